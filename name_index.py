@@ -0,0 +1,126 @@
+"""Player name resolution: exact normalized keys, then a trigram index.
+
+FuzzyDict scored a missed name against every key with thefuzz, and
+estimated_raptor.match_rows ran difflib.get_close_matches over the whole (year,
+split) pool for every row, so both were O(rows x pool) and both returned the best
+score above a cutoff even when a second player scored just as well -- two Hollidays,
+two Morrises, a Jr. and his father -- and silently joined the wrong one. Here:
+
+  * names go through norm_name, and a normalized key is a dict lookup. A key shared
+    by players with different values is ambiguous, never a coin flip.
+  * every key's character trigrams (padded, so the ends count) go into an inverted
+    index. A miss retrieves the keys sharing the most trigrams with it and scores
+    only the best TOP_CANDIDATES of those with difflib's ratio, the same similarity
+    the old cutoffs were tuned on.
+  * resolve() returns a Match with the value, the key it came from, the score and
+    how it matched: "exact", "fuzzy", "ambiguous" (the runner-up, a different
+    value, is within MARGIN of the best) or "none" (nothing reaches the cutoff).
+
+It sits at the repo root, beside utils.py, because scraping/fuzzydict.py and
+training/estimated_raptor.py both use it.
+"""
+
+import difflib
+import re
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+
+NGRAM = 3
+# Candidates, by shared trigrams, that get a full difflib score.
+TOP_CANDIDATES = 8
+# difflib ratio a fuzzy match needs; match_rows has used 0.85 since it was written.
+CUTOFF = 0.85
+# A runner-up with a different value this close to the best makes the match ambiguous.
+MARGIN = 0.03
+
+Match = namedtuple("Match", "value key score how")
+
+
+def norm_name(s):
+    """Alphanumeric-only key.
+
+    Paine's CSV has lost its diacritics to literal '?' ("Bojan Bogdanovi?",
+    "Ersan ?lyasova") and our standard_name drops hyphens entirely
+    ("Kentavious CaldwellPope"), so anything but letters and digits is noise.
+    """
+    s = unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode()
+    # Strip a generational suffix only at the end.  The old unanchored pattern
+    # also removed the *first name* from "JR Smith", preventing seven valid
+    # Paine joins in the canonical 2014-23 comparison.
+    s = re.sub(r"(?:^|\s)(jr|sr|ii|iii|iv)\.?$", "", s.lower().strip())
+    return re.sub(r"[^a-z0-9]", "", s)
+
+
+def grams(key, n=NGRAM):
+    k = f"^{key}$"
+    return {k[i:i + n] for i in range(max(1, len(k) - n + 1))}
+
+
+class NameIndex:
+    """name -> value, resolved exactly on the normalized key or by trigram search."""
+
+    def __init__(self, items=(), cutoff=CUTOFF, margin=MARGIN, top=TOP_CANDIDATES):
+        self.cutoff = cutoff
+        self.margin = margin
+        self.top = top
+        self.values = defaultdict(set)      # key -> values it has been given
+        self.postings = defaultdict(list)   # trigram -> keys
+        self.n_grams = {}                   # key -> number of distinct trigrams
+        for name, value in (items.items() if isinstance(items, dict) else items):
+            self.add(name, value)
+
+    def add(self, name, value):
+        key = norm_name(name)
+        if not key:
+            return
+        if key not in self.values:
+            gs = grams(key)
+            self.n_grams[key] = len(gs)
+            for g in gs:
+                self.postings[g].append(key)
+        self.values[key].add(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def _value(self, key):
+        vals = self.values[key]
+        return next(iter(vals)) if len(vals) == 1 else None
+
+    def candidates(self, key):
+        """Indexed keys sharing the most trigrams with key, best first."""
+        q = grams(key)
+        shared = Counter()
+        for g in q:
+            shared.update(self.postings.get(g, ()))
+        # Dice on the gram sets; cheap, and only ranks which keys difflib sees.
+        dice = {k: 2 * n / (len(q) + self.n_grams[k]) for k, n in shared.items()}
+        return sorted(dice, key=lambda k: (-dice[k], k))[:self.top]
+
+    def resolve(self, name):
+        key = norm_name(name)
+        if key in self.values:
+            v = self._value(key)
+            return Match(v, key, 1.0, "exact" if v is not None else "ambiguous")
+        if not key:
+            return Match(None, None, 0.0, "none")
+        sm = difflib.SequenceMatcher(b=key, autojunk=False)
+        scored = []
+        for k in self.candidates(key):
+            sm.set_seq1(k)
+            scored.append((sm.ratio(), k))
+        scored.sort(key=lambda t: (-t[0], t[1]))
+        if not scored or scored[0][0] < self.cutoff:
+            best = scored[0] if scored else (0.0, None)
+            return Match(None, best[1], best[0], "none")
+        score, k = scored[0]
+        v = self._value(k)
+        rival = any(s >= score - self.margin and self.values[k2] != self.values[k]
+                    for s, k2 in scored[1:])
+        if v is None or rival:
+            return Match(None, k, score, "ambiguous")
+        return Match(v, k, score, "fuzzy")
+
+    def get(self, name, default=None):
+        m = self.resolve(name)
+        return default if m.value is None else m.value
@@ -1,4 +1,8 @@
-from thefuzz import process
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from name_index import NameIndex  # noqa: E402
 
 
 class FuzzyDict:
@@ -7,24 +11,35 @@ class FuzzyDict:
         Initialize the fuzzy dictionary.
 
         :param threshold: Minimum similarity score (0-100) for a match to be considered valid.
+            This is difflib's ratio x 100 between name_index.norm_name keys. It was
+            thefuzz's WRatio on the raw strings, which also scores reordered words
+            ("Cui Yongxi" / "Yongxi Cui") and a name inside a longer one highly; those
+            now fall below 80 and raise KeyError instead of matching. Typos and
+            punctuation score about as before.
         """
         self.data = {}
         self.threshold = threshold
+        self.index = NameIndex(cutoff=threshold / 100)
 
     def __setitem__(self, key, value):
         """Set a key-value pair."""
         self.data[key] = value
+        self.index.add(key, key)
 
     def __getitem__(self, key):
-        """Get a value with an exact or fuzzy-matched key."""
+        """Get a value with an exact or fuzzy-matched key.
+
+        Misses go through the name index: a near-tie between two different keys
+        raises KeyError rather than picking one.
+        """
         if key in self.data:
             return self.data[key]
 
-        best_match, score = process.extractOne(key, self.data.keys())
-        if score >= self.threshold:
-            return self.data[best_match]
-        else:
-            raise KeyError(f"No sufficiently close match found for '{key}'")
+        match = self.index.resolve(key)
+        if match.value is None:
+            raise KeyError(f"No unambiguous close match found for '{key}' "
+                           f"({match.how}, best {match.key!r} at {match.score:.2f})")
+        return self.data[match.value]
 
     def get(self, key, default=None):
         """Get a value with fuzzy matching, or return a default if no match is found."""
@@ -37,14 +52,13 @@ class FuzzyDict:
         """Check if a key (or a close match) exists in the dictionary."""
         if key in self.data:
             return True
-        best_match, score = process.extractOne(key, self.data.keys())
-        return score >= self.threshold
+        return self.index.resolve(key).value is not None
 
     def update(self, dictionary):
         """Populate the fuzzy dictionary with a vanilla dictionary."""
-        self.data.update(dictionary)
+        for key, value in dictionary.items():
+            self[key] = value
 
     def __repr__(self):
         """Return a string representation of the dictionary."""
         return f"FuzzyDict({self.data})"
-
@@ -0,0 +1,388 @@
+"""Keep-alive HTTP connections and an on-disk response cache for the scrapers.
+
+Every get_json in scraping/ used to call urllib.request.urlopen, which opens a new
+TCP connection and does a full TLS handshake per request and never asks for
+compression. A wowy cell is thousands of calls to one host, a tracking cell is 14
+league-wide tables, and the bodies are JSON that gzip shrinks 5-10x. Here:
+
+  * Pool keeps idle http.client connections per (scheme, host) and hands each one
+    to one thread at a time. A connection the server closed while it sat idle is
+    retried once on a fresh one, so keep-alive never shows up as a failure.
+  * Requests send Accept-Encoding: gzip and bodies are decompressed here.
+  * Successful JSON bodies are cached under CACHE_DIR, keyed by the full URL
+    (params included). A cell re-run after a crash gets its tables from disk. An
+    entry older than CACHE_TTL is revalidated with If-None-Match/If-Modified-Since
+    when the server gave validators, so an unchanged table costs a 304 rather
+    than a download. Only a body that parsed is ever written. The first cached
+    request of a process prunes the directory (prune()): entries untouched for
+    CACHE_MAX_AGE go, then the oldest until it is under CACHE_MAX_BYTES.
+
+Every network request (and every cache hit) is also appended to a telemetry file,
+TELEMETRY_DIR/requests.jsonl, rotated at TELEMETRY_MAX_BYTES: wall time, host,
+endpoint, a hash of the query, the cell it belongs to, status or error, wire bytes,
+latency and the caller's attempt number. scrape_report.py summarizes it.
+
+Errors look like urlopen's: a 4xx/5xx raises urllib.error.HTTPError, and transport
+failures raise the same OSError/http.client.HTTPException family, so each caller's
+retry loop is unchanged.
+"""
+
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import zlib
+from collections import defaultdict
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).resolve().parent / "_http_cache"
+# Historical tables never change, but in-season snapshots and the current
+# season's game lists do. Long enough to cover a crash and re-run, short enough
+# that yesterday's box scores are not served today.
+CACHE_TTL = 12 * 3600
+# Past the TTL an entry only saves a download if the server still answers 304,
+# which a week-old in-season table will not; and a season's wowy is gigabytes.
+CACHE_MAX_AGE = 7 * 86400
+CACHE_MAX_BYTES = 4 << 30
+# Idle connections kept per host; more than the scrapers ever run in parallel.
+MAX_IDLE = 8
+MAX_REDIRECTS = 5
+
+TELEMETRY_DIR = Path(__file__).resolve().parent / "_telemetry"
+TELEMETRY_MAX_BYTES = 16 << 20
+# Rotated files kept beside the live one: requests.1.jsonl (newest) .. requests.5.jsonl
+TELEMETRY_KEEP = 5
+
+_ssl_context = ssl.create_default_context()
+
+
+class Pool:
+    """Per-host idle connections, shared by every thread in the process."""
+
+    def __init__(self, max_idle=MAX_IDLE):
+        self.max_idle = max_idle
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self, scheme, host, timeout):
+        with self._lock:
+            self.opened += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, timeout=timeout,
+                                               context=_ssl_context)
+        return http.client.HTTPConnection(host, timeout=timeout)
+
+    def _checkout(self, scheme, host, timeout):
+        with self._lock:
+            idle = self._idle[(scheme, host)]
+            if idle:
+                self.reused += 1
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        return self._connect(scheme, host, timeout), False
+
+    def _checkin(self, scheme, host, conn):
+        with self._lock:
+            idle = self._idle[(scheme, host)]
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, url, headers, timeout):
+        """GET url -> (status, reason, headers, decoded body bytes, wire bytes)."""
+        u = urllib.parse.urlsplit(url)
+        path = u.path or "/"
+        if u.query:
+            path += "?" + u.query
+        headers = dict(headers, **{"Accept-Encoding": "gzip"})
+        headers.pop("Connection", None)
+
+        conn, reused = self._checkout(u.scheme, u.netloc, timeout)
+        try:
+            try:
+                conn.request("GET", path, headers=headers)
+                r = conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError,
+                    ConnectionResetError):
+                # The server dropped the idle connection; that says nothing
+                # about this request, so try it once on a new one.
+                conn.close()
+                if not reused:
+                    raise
+                conn = self._connect(u.scheme, u.netloc, timeout)
+                conn.request("GET", path, headers=headers)
+                r = conn.getresponse()
+            body = r.read()
+        except BaseException:
+            conn.close()
+            raise
+        if r.will_close:
+            conn.close()
+        else:
+            self._checkin(u.scheme, u.netloc, conn)
+
+        wire = len(body)
+        enc = (r.getheader("Content-Encoding") or "").lower()
+        if enc == "gzip":
+            body = gzip.decompress(body)
+        elif enc == "deflate":
+            body = zlib.decompress(body)
+        return r.status, r.reason, r.headers, body, wire
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for c in conns:
+                    c.close()
+            self._idle.clear()
+
+
+_pool = Pool()
+
+
+# ------------------------------------------------------------------ telemetry
+class Telemetry:
+    """Thread-safe JSONL appender that rotates by size."""
+
+    def __init__(self, root=TELEMETRY_DIR, max_bytes=TELEMETRY_MAX_BYTES,
+                 keep=TELEMETRY_KEEP):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self.root / "requests.jsonl"
+
+    def files(self):
+        """Every telemetry file, oldest first."""
+        rotated = [self.root / f"requests.{i}.jsonl" for i in range(self.keep, 0, -1)]
+        return [p for p in rotated + [self.path] if p.exists()]
+
+    def _rotate(self):
+        for i in range(self.keep - 1, 0, -1):
+            src = self.root / f"requests.{i}.jsonl"
+            if src.exists():
+                src.replace(self.root / f"requests.{i + 1}.jsonl")
+        self.path.replace(self.root / "requests.1.jsonl")
+
+    def record(self, **rec):
+        line = json.dumps(rec) + "\n"
+        with self._lock:
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                with self.path.open("a") as f:
+                    f.write(line)
+                    full = f.tell() >= self.max_bytes
+                if full:
+                    self._rotate()
+            except OSError:
+                pass    # telemetry must never fail a scrape
+
+
+telemetry = Telemetry()
+
+# Query parameters that name the cell a request belongs to, pbpstats and
+# stats.nba.com spellings.
+_CELL_PARAMS = (("Season",), ("SeasonType",), ("ToDate", "DateTo"))
+
+
+def _describe(url):
+    u = urllib.parse.urlsplit(url)
+    q = dict(urllib.parse.parse_qsl(u.query, keep_blank_values=True))
+    cell = "|".join(next((q[k] for k in keys if q.get(k)), "") for keys in _CELL_PARAMS)
+    return {"host": u.netloc, "endpoint": u.path,
+            "params": hashlib.sha256(u.query.encode()).hexdigest()[:12],
+            "cell": cell if cell.strip("|") else None}
+
+
+def _record(url, attempt, t0, status=None, error=None, nbytes=0, cached=False):
+    telemetry.record(ts=round(time.time(), 3), **_describe(url), status=status,
+                     error=error, bytes=nbytes,
+                     latency=round(time.monotonic() - t0, 4), attempt=attempt,
+                     cached=cached)
+
+
+def pool_stats():
+    return {"opened": _pool.opened, "reused": _pool.reused}
+
+
+# ---------------------------------------------------------------------- cache
+def cache_path(url, root=CACHE_DIR):
+    h = hashlib.sha256(url.encode()).hexdigest()
+    host = urllib.parse.urlsplit(url).netloc
+    return Path(root) / host / h[:2] / f"{h}.json.gz"
+
+
+def _meta_path(p):
+    return p.with_name(p.name.replace(".json.gz", ".meta.json"))
+
+
+def _read_meta(p):
+    try:
+        return json.loads(_meta_path(p).read_text())
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _read_body(p):
+    try:
+        with gzip.open(p, "rb") as f:
+            return json.loads(f.read())
+    except (OSError, EOFError, json.JSONDecodeError):
+        return None
+
+
+def _write(p, url, raw, headers):
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(f"{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(gzip.compress(raw))
+    tmp.replace(p)
+    _touch(p, url, headers)
+
+
+def _touch(p, url, headers):
+    meta = {"url": url, "fetched": time.time(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified")}
+    tmp = _meta_path(p).with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(meta))
+    tmp.replace(_meta_path(p))
+
+
+def prune(root=CACHE_DIR, max_age=CACHE_MAX_AGE, max_bytes=CACHE_MAX_BYTES):
+    """Delete entries not written or revalidated within max_age, then the least
+    recently touched until the rest fit in max_bytes, and stray .tmp files from a
+    killed write. -> (entries removed, bytes freed)."""
+    entries, now = [], time.time()
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            f = Path(dirpath) / name
+            try:
+                if name.endswith(".tmp"):
+                    if now - f.stat().st_mtime > 3600:
+                        f.unlink()
+                    continue
+                if not name.endswith(".json.gz"):
+                    continue
+                meta = _meta_path(f)
+                st = f.stat()
+                mst = meta.stat() if meta.exists() else st
+                entries.append((max(st.st_mtime, mst.st_mtime),
+                                st.st_size + (mst.st_size if mst is not st else 0), f))
+            except OSError:
+                continue        # another process pruned or replaced it
+    entries.sort()
+    total = sum(e[1] for e in entries)
+    removed = freed = 0
+    for touched, size, f in entries:
+        if now - touched <= max_age and total <= max_bytes:
+            break
+        for q in (f, _meta_path(f)):
+            try:
+                q.unlink()
+            except OSError:
+                pass
+        total -= size
+        removed, freed = removed + 1, freed + size
+    return removed, freed
+
+
+_pruned = []
+_prune_lock = threading.Lock()
+
+
+def _prune_once(root):
+    with _prune_lock:
+        if root in _pruned:
+            return
+        _pruned.append(root)
+    prune(root)
+
+
+def cached(url, ttl=CACHE_TTL, root=CACHE_DIR):
+    """The cached body for url if it is younger than ttl, else None."""
+    t0 = time.monotonic()
+    _prune_once(root)
+    p = cache_path(url, root)
+    meta = _read_meta(p)
+    if meta is None or time.time() - meta["fetched"] > ttl:
+        return None
+    body = _read_body(p)
+    if body is not None:
+        _record(url, None, t0, status=200, cached=True)
+    return body
+
+
+def get_json(url, headers, timeout, cache=True, ttl=CACHE_TTL, root=CACHE_DIR,
+             attempt=None):
+    """GET url through the pool -> parsed JSON, using and filling the cache.
+
+    Raises urllib.error.HTTPError for an error status, and lets transport errors
+    and json.JSONDecodeError through for the caller's retry loop. attempt is only
+    recorded in the telemetry.
+    """
+    t0 = time.monotonic()
+    p = cache_path(url, root) if cache else None
+    meta = None
+    if cache:
+        _prune_once(root)
+        meta = _read_meta(p)
+        if meta is not None and time.time() - meta["fetched"] <= ttl:
+            body = _read_body(p)
+            if body is not None:
+                _record(url, attempt, t0, status=200, cached=True)
+                return body
+            meta = None
+
+    headers = dict(headers)
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    status, nbytes = None, 0
+    try:
+        for _ in range(MAX_REDIRECTS + 1):
+            status, reason, hdrs, raw, wire = _pool.request(url, headers, timeout)
+            nbytes += wire
+            if status in (301, 302, 303, 307, 308) and hdrs.get("Location"):
+                url = urllib.parse.urljoin(url, hdrs["Location"])
+                continue
+            break
+
+        if status == 304 and meta is not None:
+            body = _read_body(p)
+            if body is not None:
+                _touch(p, meta["url"], {"ETag": hdrs.get("ETag") or meta.get("etag"),
+                                        "Last-Modified": hdrs.get("Last-Modified")
+                                        or meta.get("last_modified")})
+                _record(url, attempt, t0, status=304, nbytes=nbytes)
+                return body
+        if status >= 300:
+            raise urllib.error.HTTPError(url, status, reason, hdrs, None)
+
+        body = json.loads(raw)
+    except Exception as e:
+        _record(url, attempt, t0, status=status, nbytes=nbytes,
+                error=None if isinstance(e, urllib.error.HTTPError)
+                else type(e).__name__)
+        raise
+    _record(url, attempt, t0, status=status, nbytes=nbytes)
+    if cache:
+        _write(p, meta["url"] if meta else url, raw, hdrs)
+    return body
@@ -0,0 +1,197 @@
+"""Which indexes the collection's queries need, whether they get them, and build them.
+
+The only indexes the code has ever referred to are timestamp_1_standard_name_1 (the
+upsert filter) and timestamp_1_source_1 (the timestamp-by-source $group). Most of what
+the scrapers and loaders actually ask filters on source plus a cell plus one more key,
+and a timestamp-led index makes Mongo fetch every document in the timestamp -- all
+sources, all season types -- to answer that.
+
+QUERY_SHAPES lists every query the repo issues, with representative values. --report
+runs explain() on each and prints the winning plan, whether it is a COLLSCAN, whether
+it is covered (no FETCH), and docs examined per doc returned. INDEXES is the compound
+set that makes those plans index-led; --create builds whichever are missing. Creation
+is idempotent: an index whose key pattern already exists is left alone, whatever its
+name.
+
+Point it at a local mongod restored from a dump before touching Atlas -- explain()
+with executionStats runs the query, and building an index on 4.2M documents is not
+something to try first on the shared cluster.
+
+Run:  python scraping/indexes.py --uri mongodb://localhost:27017 --report
+      python scraping/indexes.py --uri mongodb://localhost:27017 --create
+      python scraping/indexes.py --create            # Atlas, via credentials.txt
+"""
+
+import argparse
+
+import pymongo
+
+import mongo_sink
+
+TS, ST = "20220715000000", "Regular season"
+
+# (key pattern, why). Name follows Mongo's default so the two never disagree.
+INDEXES = [
+    ([("source", 1), ("timestamp", 1), ("season_type", 1), ("standard_name", 1)],
+     "pbp/538 upserts, per-source cell reads, verify_scrape, purge_cell"),
+    ([("source", 1), ("timestamp", 1), ("season_type", 1), ("data_type", 1),
+      ("standard_name", 1)],
+     "nba-tracking/defend/shotdash upserts; covers existing_keys and block fetches"),
+    ([("source", 1), ("timestamp", 1), ("season_type", 1), ("on_or_off", 1),
+      ("standard_name", 1)],
+     "wowy/wowy-opp upserts; covers existing_keys and block fetches"),
+    ([("source", 1), ("label_season", 1), ("season_type", 1)],
+     "labels.best_season_table"),
+    ([("source", 1), ("_id", 1)],
+     "labels watermark (newest 538 _id), feature_store per-cell watermarks"),
+]
+
+# (name, filter, projection, sort). The values are representative, not special.
+QUERY_SHAPES = [
+    ("fetch_blocks (coverage/build_dataset)",
+     {"timestamp": TS, "season_type": ST,
+      "$or": [{"source": "pbp"}, {"source": "wowy", "on_or_off": "on"},
+              {"source": "nba-tracking", "data_type": "passing"}]},
+     None, None),
+    ("upsert key: pbp",
+     {"source": "pbp", "timestamp": TS, "season_type": ST,
+      "standard_name": "Nikola Jokic"}, None, None),
+    ("upsert key: wowy",
+     {"source": "wowy", "timestamp": TS, "season_type": ST,
+      "standard_name": "Nikola Jokic", "on_or_off": "on"}, None, None),
+    ("upsert key: nba-tracking",
+     {"source": "nba-tracking", "timestamp": TS, "season_type": ST,
+      "standard_name": "Nikola Jokic", "data_type": "passing"}, None, None),
+    ("existing_keys: wowy-opp",
+     {"source": "wowy-opp", "timestamp": TS, "season_type": ST},
+     {"standard_name": 1, "on_or_off": 1, "_id": 0}, None),
+    ("existing_keys: nba-defend",
+     {"source": "nba-defend", "timestamp": TS, "season_type": ST},
+     {"standard_name": 1, "data_type": 1, "_id": 0}, None),
+    ("labels.labels_for (same-timestamp)",
+     {"source": "538", "timestamp": TS, "season_type": ST,
+      "label_season": "2021-22"}, None, None),
+    ("labels.best_season_table",
+     {"source": "538", "label_season": "2021-22", "season_type": ST}, None, None),
+    ("labels watermark",
+     {"source": "538"}, {"_id": 1}, [("_id", -1)]),
+    ("verify_scrape.cell_report: pbp",
+     {"source": "pbp", "timestamp": TS, "season_type": ST},
+     {"standard_name": 1, "_id": 0}, None),
+    ("extract_wowyopp / final_boards",
+     {"source": "wowy-opp", "timestamp": TS, "season_type": ST}, None, None),
+    ("purge_cell",
+     {"source": "nba-tracking", "timestamp": TS},
+     {"season_type": 1, "standard_name": 1, "data_type": 1}, None),
+]
+
+
+def index_name(keys):
+    return "_".join(f"{k}_{d}" for k, d in keys)
+
+
+def existing_patterns(coll):
+    return {tuple(tuple(kv) for kv in info["key"])
+            for info in coll.index_information().values()}
+
+
+def create_missing(coll, dry_run=False):
+    """Build every INDEXES entry whose key pattern is not already present."""
+    have = existing_patterns(coll)
+    made = []
+    for keys, why in INDEXES:
+        if tuple(keys) in have:
+            print(f"  ok       {index_name(keys)}")
+            continue
+        print(f"  {'would' if dry_run else 'create'}   {index_name(keys)}  ({why})")
+        if not dry_run:
+            coll.create_index(keys, name=index_name(keys))
+        made.append(index_name(keys))
+    return made
+
+
+def _stages(plan):
+    """Every stage name in a winning plan, depth first."""
+    out = [plan.get("stage")]
+    for k in ("inputStage", "queryPlan"):
+        if k in plan:
+            out += _stages(plan[k])
+    for child in plan.get("inputStages", []):
+        out += _stages(child)
+    return [s for s in out if s]
+
+
+def _index_names(plan):
+    out = [plan["indexName"]] if "indexName" in plan else []
+    for k in ("inputStage", "queryPlan"):
+        if k in plan:
+            out += _index_names(plan[k])
+    for child in plan.get("inputStages", []):
+        out += _index_names(child)
+    return out
+
+
+def explain_shape(coll, filt, proj=None, sort=None):
+    """-> {stages, indexes, collscan, covered, keys_examined, docs_examined, returned}"""
+    cur = coll.find(filt, proj)
+    if sort:
+        cur = cur.sort(sort).limit(1)
+    ex = cur.explain()
+    plan = ex["queryPlanner"]["winningPlan"]
+    stages = _stages(plan)
+    st = ex.get("executionStats", {})
+    return {"stages": stages, "indexes": sorted(set(_index_names(plan))),
+            "collscan": "COLLSCAN" in stages,
+            "covered": "FETCH" not in stages and "COLLSCAN" not in stages,
+            "keys_examined": st.get("totalKeysExamined"),
+            "docs_examined": st.get("totalDocsExamined"),
+            "returned": st.get("nReturned")}
+
+
+def report(coll):
+    print(f"\n{'query':<40} {'plan':<10} {'index':<44} {'keys':>8} {'docs':>8} "
+          f"{'ret':>6} {'docs/ret':>8}")
+    bad = 0
+    for name, filt, proj, sort in QUERY_SHAPES:
+        r = explain_shape(coll, filt, proj, sort)
+        plan = "COLLSCAN" if r["collscan"] else ("covered" if r["covered"] else "IXSCAN")
+        ratio = (f"{r['docs_examined'] / r['returned']:.1f}"
+                 if r["returned"] else ("-" if not r["docs_examined"] else "inf"))
+        idx = ",".join(r["indexes"]) or "-"
+        print(f"{name:<40} {plan:<10} {idx[:44]:<44} {r['keys_examined'] or 0:>8} "
+              f"{r['docs_examined'] or 0:>8} {r['returned'] or 0:>6} {ratio:>8}")
+        bad += r["collscan"]
+    print(f"\n{bad} of {len(QUERY_SHAPES)} query shapes scan the collection")
+    return bad
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--uri", help="a mongod to run against (default: Atlas via "
+                                  "credentials.txt / MONGO_URI)")
+    ap.add_argument("--report", action="store_true", help="explain every query shape")
+    ap.add_argument("--create", action="store_true", help="build missing indexes")
+    ap.add_argument("--dry-run", action="store_true",
+                    help="with --create, list what would be built")
+    args = ap.parse_args()
+    if not (args.report or args.create):
+        args.report = True
+
+    if args.uri:
+        coll = pymongo.MongoClient(args.uri)[mongo_sink.DB_NAME][mongo_sink.COLL_NAME]
+    else:
+        coll = mongo_sink.get_collection()
+    print(f"{coll.database.name}.{coll.name}: "
+          f"{', '.join(sorted(coll.index_information()))}")
+
+    if args.report:
+        report(coll)
+    if args.create:
+        print("\nindexes:")
+        create_missing(coll, args.dry_run)
+        if args.report and not args.dry_run:
+            report(coll)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""A durable journal of scrape jobs, and a worker pool that drains it across cells.
+
+scrape_wowy's per-cell loop kept its jobs in memory: a crash or Ctrl-C lost track
+of what was in flight, a failed split was printed with "re-run to retry them", and
+the next cell could not start until the slowest split of this one -- always a
+high-minute player, half a megabyte, retrying -- had finished, so most workers sat
+idle at every cell boundary.
+
+Here every job is a line in an append-only JSONL file, one file per source:
+
+  {"k": [source, timestamp, season_type, name, side], "s": "pending", "p": {...}}
+  {"k": [...], "s": "in-flight"}
+  {"k": [...], "s": "done"}
+  {"k": [...], "s": "failed", "e": "RuntimeError: ..."}
+
+The last line for a key is its state. Replaying the file on open turns "in-flight"
+back into pending (whatever was running when the process died never stored its
+row), so a restart resumes exactly where it stopped. The file is rewritten compactly
+when replay finds it mostly superseded lines.
+
+drain() runs every runnable job through one pool, in journal order but without
+cell barriers: a free worker takes the next job whatever cell it belongs to. A
+failure goes back on the queue after JOB_BACKOFF * 2^(n-1) seconds, up to
+JOB_MAX_ATTEMPTS times per run; one that exhausts them stays "failed" in the journal
+and is retried by the next run. A job is only marked done after store() has written
+its result, so a kill between fetch and write refetches rather than loses it.
+"""
+
+import heapq
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+JOURNAL_DIR = Path(__file__).resolve().parent / "journal"
+
+PENDING, IN_FLIGHT, DONE, FAILED = "pending", "in-flight", "done", "failed"
+
+# pbpstats_client already retries a transient failure 40 times before raising, so a
+# job-level failure is a longer outage than a shed burst; wait on that scale.
+JOB_MAX_ATTEMPTS = 5
+JOB_BACKOFF = 30.0
+JOB_MAX_BACKOFF = 900.0
+# Results written per store() call.
+FLUSH_EVERY = 25
+
+
+class Journal:
+    """Replayed state of one journal file, plus an appender for changes to it."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.state = {}       # key -> state
+        self.payload = {}     # key -> job payload
+        self.info = {}        # key -> extra fields from the last line (error, empty)
+        self._lock = threading.Lock()
+        self._replay()
+
+    def _replay(self):
+        if not self.path.exists():
+            return
+        lines = 0
+        with self.path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except json.JSONDecodeError:
+                    continue          # torn by a kill
+                lines += 1
+                k = tuple(r["k"])
+                if "p" in r:
+                    self.payload[k] = r["p"]
+                self.state[k] = PENDING if r["s"] == IN_FLIGHT else r["s"]
+                self.info[k] = {x: r[x] for x in ("e", "a", "empty") if x in r}
+        if lines > 2 * len(self.state) + 1000:
+            self.compact()
+
+    def _append(self, records):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+    def compact(self):
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for k, s in self.state.items():
+                r = dict({"k": list(k), "s": s, "p": self.payload[k]}, **self.info[k])
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        tmp.replace(self.path)
+
+    def add(self, key, payload, reset=False):
+        """Journal a job unless it is already there. reset=True makes it pending."""
+        key = tuple(key)
+        with self._lock:
+            if key in self.state and not reset:
+                return False
+            self.state[key], self.payload[key], self.info[key] = PENDING, payload, {}
+            self._append([{"k": list(key), "s": PENDING, "p": payload}])
+            return True
+
+    def mark(self, keys, state, **extra):
+        keys = [tuple(k) for k in keys]
+        if not keys:
+            return
+        with self._lock:
+            for k in keys:
+                self.state[k] = state
+                self.info[k] = dict(extra)
+            self._append([dict({"k": list(k), "s": state}, **extra) for k in keys])
+
+    def runnable(self, keys=None):
+        """Keys not yet done, in the order they were journaled; only those among
+        keys when given, so a run leaves other cells' leftovers alone."""
+        keys = None if keys is None else {tuple(k) for k in keys}
+        return [k for k, s in self.state.items()
+                if s != DONE and (keys is None or k in keys)]
+
+    def counts(self):
+        out = {}
+        for s in self.state.values():
+            out[s] = out.get(s, 0) + 1
+        return out
+
+
+def _backoff(n):
+    return min(JOB_BACKOFF * 2 ** (n - 1), JOB_MAX_BACKOFF)
+
+
+def drain(journal, work, store, workers, stop_on=(), max_attempts=JOB_MAX_ATTEMPTS,
+          flush_every=FLUSH_EVERY, progress=None, keys=None):
+    """Run every runnable job (of keys, when given). -> the stop_on exception that
+    ended it early, or None.
+
+    work(payload) -> result runs on a worker thread; a raise is a failed attempt.
+    store([(key, result)]) runs on this thread and must make the results durable
+    before returning; the keys are then marked done. An exception of a stop_on type
+    (an IP block) stops new dispatch, puts its job back to pending and lets the
+    in-flight ones finish. progress(n_finished, n_total, n_failed), if given, is
+    called after every finished job.
+    """
+    ready = deque(journal.runnable(keys))
+    total = len(ready)
+    delayed, seq = [], 0             # heap of (monotonic ready time, seq, key)
+    attempts, buffered = {}, []
+    finished = failed = 0
+    stopped = None
+    futures = {}
+
+    def flush():
+        nonlocal buffered
+        if buffered:
+            store(buffered)
+            journal.mark([k for k, r in buffered if r], DONE)
+            # An empty result is done too, and says so: nothing was stored for it.
+            journal.mark([k for k, r in buffered if not r], DONE, empty=True)
+            buffered = []
+
+    ex = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            now = time.monotonic()
+            while delayed and delayed[0][0] <= now:
+                ready.append(heapq.heappop(delayed)[2])
+            while stopped is None and ready and len(futures) < workers:
+                key = ready.popleft()
+                journal.mark([key], IN_FLIGHT)
+                futures[ex.submit(work, journal.payload[key])] = key
+            if not futures:
+                if stopped is not None or not delayed:
+                    break
+                time.sleep(max(0.0, delayed[0][0] - now))
+                continue
+            timeout = max(0.0, delayed[0][0] - now) if delayed else None
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                key = futures.pop(fut)
+                try:
+                    buffered.append((key, fut.result()))
+                    finished += 1
+                except stop_on as e:
+                    stopped = e
+                    journal.mark([key], PENDING)
+                    continue
+                except Exception as e:
+                    n = attempts[key] = attempts.get(key, 0) + 1
+                    journal.mark([key], FAILED, e=f"{type(e).__name__}: {e}"[:500],
+                                 a=n)
+                    if n < max_attempts:
+                        seq += 1
+                        heapq.heappush(delayed, (time.monotonic() + _backoff(n),
+                                                 seq, key))
+                    else:
+                        finished += 1
+                        failed += 1
+                    continue
+                if progress:
+                    progress(finished, total, failed)
+            if len(buffered) >= flush_every:
+                flush()
+    except KeyboardInterrupt:
+        # Everything still in flight is journaled as such and comes back as pending
+        # on the next run; only what has been stored is marked done.
+        ex.shutdown(wait=False, cancel_futures=True)
+        flush()
+        raise
+    flush()
+    ex.shutdown(wait=True)
+    return stopped
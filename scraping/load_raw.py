@@ -7,57 +7,166 @@ network reaches both, scrape with --raw-dir on the network that reaches the API,
 run this on the network that reaches Atlas.
 
 Upserts on the same key fields as a direct write, so this is safe to re-run, safe to
-interrupt, and safe to point at a directory that is partly loaded already.
+interrupt, and safe to point at a directory that is partly loaded already. Reads both
+RawSink formats: v1 <cell>.jsonl files and v2 segment directories (raw_segments.py),
+whose segments are checksummed before loading and skipped once loaded.
 
 Run:  python scraping/load_raw.py raw/ --dry-run
       python scraping/load_raw.py raw/
 """
 
 import argparse
+import gzip
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import mongo_sink
+import raw_segments
 
-BATCH = 500
+# A batch closes at whichever comes first. Rows run from a few hundred bytes (a
+# tracking row) to half a megabyte (wowy for a high-minute player), so a fixed row
+# count either sends 250 MB in one bulk_write or makes a round trip per 40 KB.
+# 8 MB keeps each batch well inside Mongo's 48 MB message limit.
+BATCH_BYTES = 8 << 20
+BATCH_ROWS = 2000
+WORKERS = 4
 
 
-def read_rows(path):
-    """Yield rows, skipping a torn final line from a killed scrape."""
+def read_batches(path, key_fields=None, lanes=1, max_bytes=BATCH_BYTES,
+                 max_rows=BATCH_ROWS):
+    """Yield (lane, rows, n_bytes) batches, skipping a torn final line from a killed
+    scrape.
+
+    A row goes to lane hash(its key_fields) % lanes, so every row for one key lands
+    in the same lane, in file order, and a batch keeps only the last row per key.
+    """
     bad = 0
-    with path.open(encoding="utf-8") as f:
+    open_ = [({}, 0) for _ in range(lanes)]
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rb") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
             try:
-                yield json.loads(line)
+                row = json.loads(line)
             except json.JSONDecodeError:
                 bad += 1
+                continue
+            k = tuple(row.get(c) for c in key_fields) if key_fields else object()
+            lane = hash(k) % lanes if key_fields else 0
+            batch, size = open_[lane]
+            batch.pop(k, None)            # a later row for the key replaces it
+            batch[k] = row
+            size += len(line)
+            if size >= max_bytes or len(batch) >= max_rows:
+                yield lane, list(batch.values()), size
+                batch, size = {}, 0
+            open_[lane] = (batch, size)
+    for lane, (batch, size) in enumerate(open_):
+        if batch:
+            yield lane, list(batch.values()), size
     if bad:
-        print(f"    skipped {bad} unparseable line(s)")
+        print(f"    {path.name}: skipped {bad} unparseable line(s)")
 
 
-def load_file(coll, path, source, dry_run):
-    ins = mod = same = n = 0
-    batch = []
-    for row in read_rows(path):
-        n += 1
-        batch.append(row)
-        if len(batch) >= BATCH:
-            a, b, matched = mongo_sink.write_rows(coll, batch, source, dry_run)
-            ins, mod, same = ins + a, mod + b, same + (matched - b)
-            batch = []
-    if batch:
-        a, b, matched = mongo_sink.write_rows(coll, batch, source, dry_run)
-        ins, mod, same = ins + a, mod + b, same + (matched - b)
-    return n, ins, mod, same
+def read_rows(path):
+    """Yield rows, skipping a torn final line from a killed scrape."""
+    for _, batch, _ in read_batches(path):
+        yield from batch
+
+
+def units(path, reload=False):
+    """-> [(segment or None, file to read)] for a v1 file or a v2 cell directory.
+
+    v2 segments are checked against their footers first. Unsealed (torn by a kill)
+    or corrupt segments are reported and left out; so are segments an earlier run
+    already loaded, unless reload.
+    """
+    if path.is_file():
+        return [(None, path)]
+    done = set() if reload else raw_segments.loaded(path)
+    out, torn, bad, skipped = [], 0, 0, 0
+    for seg, footer in raw_segments.segments(path):
+        if footer is None:
+            torn += 1
+        elif seg.name in done:
+            skipped += 1
+        elif not raw_segments.verify(seg, footer):
+            bad += 1
+        else:
+            out.append((seg, seg))
+    if torn or bad or skipped:
+        print(f"    {path.name}: {skipped} segment(s) already loaded, "
+              f"{torn} unsealed, {bad} failed checksum")
+    return out
+
+
+def load_source(coll, paths, source, dry_run, workers=WORKERS, reload=False):
+    """Upsert every file or cell directory for one source through `workers` lanes.
+
+    A RawSink file is append-only, so a re-scrape (--force) leaves a key in it
+    twice. Rows are split into lanes by upsert key (read_batches) and each lane
+    writes its batches one at a time, in file order: the last row for a key is the
+    one that stays, and two upserts of one key never race into two inserts.
+
+    The main thread parses and batches while up to `workers` bulk_writes are in
+    flight; at most 2 * workers batches are held in memory at once. A v2 segment is
+    marked LOADED once every batch from it has been written.
+    -> {path: (n, inserted, modified, unchanged)}, plus (rows, bytes, seconds).
+    """
+    slots = threading.BoundedSemaphore(2 * workers)
+    per_unit = {p: [] for p in paths}
+    n_rows = n_bytes = 0
+    t0 = time.time()
+    keys = mongo_sink.KEY_FIELDS[source]
+
+    def write(batch):
+        try:
+            return mongo_sink.write_rows(coll, batch, source, dry_run)
+        finally:
+            slots.release()
+
+    lanes = [ThreadPoolExecutor(max_workers=1) for _ in range(workers)]
+    try:
+        for path in paths:
+            for seg, f in units(path, reload):
+                futs = []
+                for lane, batch, size in read_batches(f, keys, workers):
+                    slots.acquire()
+                    futs.append((len(batch), lanes[lane].submit(write, batch)))
+                    n_rows += len(batch)
+                    n_bytes += size
+                per_unit[path].append((seg, futs))
+
+        out = {}
+        for path in paths:
+            n = ins = mod = same = 0
+            for seg, futs in per_unit[path]:
+                for rows, fut in futs:
+                    a, b, matched = fut.result()
+                    n, ins, mod, same = (n + rows, ins + a, mod + b,
+                                         same + (matched - b))
+                if seg is not None and not dry_run:
+                    raw_segments.mark_loaded(path, seg)
+            out[path] = (n, ins, mod, same)
+    finally:
+        for ex in lanes:
+            ex.shutdown()
+    return out, (n_rows, n_bytes, time.time() - t0)
 
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("raw_dir", help="the directory passed to --raw-dir")
     ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--workers", type=int, default=WORKERS,
+                    help="concurrent bulk_writes per source")
+    ap.add_argument("--reload", action="store_true",
+                    help="also load v2 segments an earlier run marked LOADED")
     args = ap.parse_args()
 
     root = Path(args.raw_dir)
@@ -65,29 +174,42 @@ def main():
         raise SystemExit(f"{root} is not a directory")
 
     coll = None if args.dry_run else mongo_sink.check_connection()
-    files = sorted(p for p in root.glob("*/*.jsonl"))
+    # v1 cells are <source>/<cell>.jsonl, v2 cells <source>/<cell>/seg-*.jsonl.gz
+    files = sorted(set(root.glob("*/*.jsonl"))
+                   | {p.parent for p in root.glob(f"*/*/{raw_segments.SEG_GLOB}")})
     if not files:
-        raise SystemExit(f"no .jsonl files under {root}")
-    print(f"{len(files)} file(s) under {root}")
+        raise SystemExit(f"no .jsonl files or segment directories under {root}")
+    print(f"{len(files)} cell file(s)/directories under {root}")
 
-    totals = {}
+    by_source = {}
     for path in files:
         source = path.parent.name
         if source not in mongo_sink.KEY_FIELDS:
             print(f"  SKIP {path} -- '{source}' is not a known source "
                   f"({', '.join(sorted(mongo_sink.KEY_FIELDS))})")
             continue
-        n, ins, mod, same = load_file(coll, path, source, args.dry_run)
+        by_source.setdefault(source, []).append(path)
+
+    totals, rates = {}, {}
+    for source, paths in sorted(by_source.items()):
+        per_file, (n_rows, n_bytes, secs) = load_source(
+            coll, paths, source, args.dry_run, args.workers, args.reload)
         t = totals.setdefault(source, [0, 0, 0, 0])
-        for i, v in enumerate((n, ins, mod, same)):
-            t[i] += v
-        print(f"  {path.relative_to(root)}  {n} rows -> "
-              f"{ins} inserted, {mod} updated, {same} unchanged")
+        for path, vals in per_file.items():
+            for i, v in enumerate(vals):
+                t[i] += v
+            n, ins, mod, same = vals
+            print(f"  {path.relative_to(root)}  {n} rows -> "
+                  f"{ins} inserted, {mod} updated, {same} unchanged")
+        rates[source] = (n_rows / max(secs, 1e-9), n_bytes / 2**20 / max(secs, 1e-9))
+        print(f"  [{source}] {n_rows} rows, {n_bytes / 2**20:.1f} MB in {secs:.1f}s  "
+              f"({rates[source][0]:.0f} rows/s, {rates[source][1]:.2f} MB/s)")
 
     print()
     for source, (n, ins, mod, same) in sorted(totals.items()):
+        rps, mbps = rates[source]
         print(f"{source:<14} {n:>7} rows  {ins:>7} inserted  {mod:>7} updated  "
-              f"{same:>7} unchanged")
+              f"{same:>7} unchanged  {rps:>7.0f} rows/s  {mbps:>6.2f} MB/s")
 
 
 if __name__ == "__main__":
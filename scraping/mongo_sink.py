@@ -16,8 +16,13 @@ Two consequences worth having:
     pick_doc() to break ties between repeat inserts of the same player; rows
     written through here can't accumulate those.
 
+Every write also updates schema_registry's per-cell field catalog, so drift checks
+and coverage read a few small documents instead of scanning cells.
+
 The upsert filter rides the existing timestamp_1_standard_name_1 index, so nothing
-new has to be built on a 4.2M document collection.
+new has to be built on a 4.2M document collection. indexes.py builds the compound
+(source, timestamp, season_type, ...) indexes that make it, and existing_keys,
+index-led rather than timestamp-led.
 """
 
 import json
@@ -29,12 +34,17 @@ from pathlib import Path
 
 import pymongo
 
+import raw_segments
+import schema_registry
+
 REPO_ROOT = Path(__file__).resolve().parent.parent
 CRED_PATH = REPO_ROOT / "credentials.txt"
 
 CLUSTER = "nba-rapture-2.qnfzf.mongodb.net"
 DB_NAME = "nba_rapture"
 COLL_NAME = "nba_rapture"
+# Per-(source, cell) resume ledger; see existing_keys.
+LEDGER_NAME = "resume_ledger"
 
 # Fields that identify a document rather than describe a player's play. A row is
 # replaced when all of these match, so they must pin down exactly one row per source.
@@ -52,6 +62,14 @@ KEY_FIELDS = {
 }
 
 
+# Every source's upsert key starts with these; the rest is what varies within a cell.
+CELL_FIELDS = ("source", "timestamp", "season_type")
+
+
+def cell_key_fields(source):
+    return [k for k in KEY_FIELDS[source] if k not in CELL_FIELDS]
+
+
 def mongo_uri(cred_path=CRED_PATH):
     """Same contract as training/db.py: MONGO_URI env var, else credentials.txt."""
     if os.environ.get("MONGO_URI"):
@@ -80,34 +98,65 @@ class RawSink:
     is what the original CSV-then-data_saver.py pipeline did by accident.
 
     Rows go to raw/<source>/<timestamp>_<season_type>.jsonl, one JSON object per
-    line, appended as they arrive. A killed run keeps everything already written,
-    and a resumed run reads the file back to see what it can skip. load_raw.py
-    upserts the files into Mongo later, from a network that can see it.
+    line, appended as they arrive. A killed run keeps everything already written.
+    load_raw.py upserts the files into Mongo later, from a network that can see it.
+
+    Beside each data file is a .keys sidecar: one line per row holding just its
+    cell_key_fields, appended after the row itself is on disk. A resumed run reads
+    that instead of reparsing half-megabyte wowy rows. A data file with no sidecar
+    (written before there were sidecars) is scanned once and the sidecar written
+    from it.
+
+    That is format v1. New rows are written in v2 (raw_segments.py): a directory
+    per cell of gzip segments, each sealed by a footer carrying its keys and a
+    checksum. A cell may hold both -- a v1 file from an older run and v2 segments
+    from a resumed one -- and both are read. segmented=False keeps writing v1.
     """
 
-    def __init__(self, root):
+    def __init__(self, root, segmented=True):
         self.root = Path(root)
+        self.segmented = segmented
+
+    def cell_dir(self, source, timestamp, season_type):
+        return self.root / source / f"{timestamp}_{season_type.replace(' ', '_')}"
 
     def path(self, source, timestamp, season_type):
         d = self.root / source
         d.mkdir(parents=True, exist_ok=True)
         return d / f"{timestamp}_{season_type.replace(' ', '_')}.jsonl"
 
+    def keys_path(self, source, timestamp, season_type):
+        return self.path(source, timestamp, season_type).with_suffix(".keys")
+
     def append(self, rows, source):
+        fields = cell_key_fields(source)
         by_cell = defaultdict(list)
         for r in rows:
             by_cell[(r["timestamp"], r["season_type"])].append(r)
         for (ts, st), group in by_cell.items():
-            with self.path(source, ts, st).open("a", encoding="utf-8") as f:
+            if self.segmented:
+                raw_segments.write_segment(self.cell_dir(source, ts, st), group, fields)
+                continue
+            p = self.path(source, ts, st)
+            if p.exists() and not self.keys_path(source, ts, st).exists():
+                # A sidecar started here would hide the older rows from ledger().
+                self._append_keys(source, ts, st, self._scan_keys(p, fields))
+            with p.open("a", encoding="utf-8") as f:
                 for r in group:
                     f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            # Only after the rows are closed: a key in the sidecar promises a row.
+            self._append_keys(source, ts, st,
+                              [[r.get(k) for k in fields] for r in group])
         return len(rows)
 
-    def keys(self, source, timestamp, season_type, fields):
-        p = self.path(source, timestamp, season_type)
-        if not p.exists():
-            return set()
-        out = set()
+    def _append_keys(self, source, timestamp, season_type, keys):
+        with self.keys_path(source, timestamp, season_type).open(
+                "a", encoding="utf-8") as f:
+            for k in keys:
+                f.write(json.dumps(k, ensure_ascii=False) + "\n")
+
+    def _scan_keys(self, p, fields):
+        out = []
         with p.open(encoding="utf-8") as f:
             for line in f:
                 line = line.strip()
@@ -117,7 +166,40 @@ class RawSink:
                     d = json.loads(line)
                 except json.JSONDecodeError:
                     continue          # a torn final line from a killed run
-                out.add(tuple(d.get(k) for k in fields))
+                out.append([d.get(k) for k in fields])
+        return out
+
+    def ledger(self, source, timestamp, season_type):
+        """cell_key_fields tuples stored for this cell, from sidecar and footers."""
+        out = raw_segments.cell_keys(self.cell_dir(source, timestamp, season_type))
+        p = self.path(source, timestamp, season_type)
+        if not p.exists():
+            return out
+        kp = self.keys_path(source, timestamp, season_type)
+        if not kp.exists():
+            self._append_keys(source, timestamp, season_type,
+                              self._scan_keys(p, cell_key_fields(source)))
+        with kp.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    out.add(tuple(json.loads(line)))
+                except json.JSONDecodeError:
+                    continue          # torn by a kill; that row gets re-fetched
+        return out
+
+    def keys(self, source, timestamp, season_type, fields):
+        ck = cell_key_fields(source)
+        if all(k in ck for k in fields):
+            idx = [ck.index(k) for k in fields]
+            return {tuple(t[i] for i in idx)
+                    for t in self.ledger(source, timestamp, season_type)}
+        p = self.path(source, timestamp, season_type)
+        out = {tuple(k) for k in self._scan_keys(p, fields)} if p.exists() else set()
+        for seg, footer in raw_segments.segments(
+                self.cell_dir(source, timestamp, season_type)):
+            if footer:
+                out.update(tuple(r.get(k) for k in fields)
+                           for r in raw_segments.read_segment(seg))
         return out
 
 
@@ -148,20 +230,96 @@ def write_rows(coll, rows, source, dry_run=False):
         print(f"    [dry-run] would upsert {len(ops)} {source} rows")
         return 0, 0, 0
 
+    old = schema_registry.replaced(coll, rows, source)
     res = coll.bulk_write(ops, ordered=False)
+    record_keys(coll, rows, source)
+    schema_registry.add_rows(coll, rows, source, old)
     return res.upserted_count, res.modified_count, res.matched_count
 
 
-def existing_keys(coll, source, timestamp, season_type, extra=None):
-    """Key tuples already stored for this cell, so a resumed run can skip them."""
-    q = {"source": source, "timestamp": timestamp, "season_type": season_type}
-    q.update(extra or {})
-    keys = [k for k in KEY_FIELDS[source] if k not in q]
-    if isinstance(coll, RawSink):
-        return coll.keys(source, timestamp, season_type, keys)
-    proj = {k: 1 for k in keys}
+def _ledger(coll):
+    return coll.database[LEDGER_NAME]
+
+
+def _ledger_id(source, timestamp, season_type):
+    return f"{source}|{timestamp}|{season_type}"
+
+
+def record_keys(coll, rows, source):
+    """Add the rows' cell_key_fields to each cell's ledger document.
+
+    A cell with no ledger document may hold rows written some other way, so it is
+    seeded from a scan instead; write_rows calls this after the write, so the scan
+    finds these rows too.
+    """
+    fields = cell_key_fields(source)
+    by_cell = defaultdict(list)
+    for r in rows:
+        by_cell[(r["timestamp"], r["season_type"])].append([r[k] for k in fields])
+    for (ts, st), keys in by_cell.items():
+        res = _ledger(coll).update_one({"_id": _ledger_id(source, ts, st)},
+                                       {"$addToSet": {"keys": {"$each": keys}}})
+        if not res.matched_count:
+            _seed_keys(coll, source, ts, st)
+
+
+def _seed_keys(coll, source, timestamp, season_type):
+    """Scan one cell's stored keys into its ledger. -> the cell_key_fields tuples."""
+    fields = cell_key_fields(source)
+    proj = {k: 1 for k in fields}
     proj["_id"] = 0
-    return {tuple(d.get(k) for k in keys) for d in coll.find(q, proj)}
+    keys = [[d.get(k) for k in fields]
+            for d in coll.find({"source": source, "timestamp": timestamp,
+                                "season_type": season_type}, proj)]
+    keys = [k for k in keys if all(v is not None for v in k)]
+    if keys:
+        _ledger(coll).update_one(
+            {"_id": _ledger_id(source, timestamp, season_type)},
+            {"$setOnInsert": {"source": source, "timestamp": timestamp,
+                              "season_type": season_type, "fields": fields},
+             "$addToSet": {"keys": {"$each": keys}}},
+            upsert=True)
+    return {tuple(k) for k in keys}
+
+
+def forget_keys(coll, source, timestamp, season_type=None):
+    """Drop ledger entries for deleted documents, so a resume does not skip them."""
+    q = {"source": source, "timestamp": timestamp}
+    if season_type is not None:
+        q["season_type"] = season_type
+    return _ledger(coll).delete_many(q).deleted_count
+
+
+def _stored_keys(coll, source, timestamp, season_type):
+    """cell_key_fields tuples for one cell: the ledger, else a scan that seeds it.
+
+    The ledger only knows about rows that came through write_rows. A cell written
+    any other way (the legacy collectors, or before the ledger existed) has no ledger
+    document, and is scanned once. Anything that deletes documents has to call
+    forget_keys, as purge_cell.py does, or a resume would skip the deleted rows.
+    """
+    if isinstance(coll, RawSink):
+        return coll.ledger(source, timestamp, season_type)
+    doc = _ledger(coll).find_one({"_id": _ledger_id(source, timestamp, season_type)},
+                                 {"keys": 1})
+    if doc is not None:
+        return {tuple(k) for k in doc.get("keys", [])}
+    return _seed_keys(coll, source, timestamp, season_type)
+
+
+def existing_keys(coll, source, timestamp, season_type, extra=None):
+    """Key tuples already stored for this cell, so a resumed run can skip them.
+
+    Read from the resume ledger -- one small document, or a sidecar file for a
+    RawSink -- rather than by rescanning every stored row.
+    """
+    extra = extra or {}
+    fields = cell_key_fields(source)
+    keep = [i for i, k in enumerate(fields) if k not in extra]
+    match = [(fields.index(k), v) for k, v in extra.items() if k in fields]
+    return {tuple(t[i] for i in keep)
+            for t in _stored_keys(coll, source, timestamp, season_type)
+            if all(t[i] == v for i, v in match)}
 
 
 def check_connection():
@@ -14,6 +14,15 @@ wowy_scrape.py's asyncio.Semaphore(50) is why that scrape was painful. The old
 retry loop also doubled its delay to 600s, which turns a blip into a ten-minute
 stall; here the backoff is capped low because the failures are cheap and transient.
 
+How low is not a constant, though, so RateController finds it: request rate and
+in-flight count grow additively while calls succeed and are cut multiplicatively
+when pbpstats sheds, under hard caps (MIN_INTERVAL, MAX_INFLIGHT). Callers can run
+MAX_INFLIGHT threads and let it decide how many are actually talking to the API.
+stats() reports its current state.
+
+Connections are kept alive and responses cached on disk by http_pool; a cached
+response is returned before the controller is consulted at all.
+
 Only stdlib is used -- this container has no `requests`.
 """
 
@@ -23,9 +32,11 @@ import random
 import socket
 import threading
 import time
+from collections import deque
 import urllib.error
 import urllib.parse
-import urllib.request
+
+import http_pool
 
 BASE = "https://api.pbpstats.com/"
 UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
@@ -50,26 +61,103 @@ TRANSIENT = (urllib.error.URLError, http.client.HTTPException, socket.timeout,
 # api.pbpstats.com then began answering 403 from nginx for every path including "/",
 # while www.pbpstats.com still served normally -- an IP block, not a rate limiter.
 # MIN_INTERVAL is a floor on the gap between requests across all threads, so a run
-# has a bounded request rate no matter how many workers call in.
+# has a bounded request rate no matter how many workers call in. The controller
+# below never goes faster than this, and MAX_INFLIGHT caps it the same way.
 MIN_INTERVAL = 0.35
-_pace_lock = threading.Lock()
-_last_call = [0.0]
-
-_stats_lock = threading.Lock()
-_stats = {"calls": 0, "retries": 0, "failures": 0}
-
-
-def _pace():
-    with _pace_lock:
-        wait = _last_call[0] + MIN_INTERVAL - time.monotonic()
+MAX_INFLIGHT = 6
+
+# AIMD. A fixed pace spent 2.2 calls per success: whatever rate pbpstats tolerates
+# moves with its load, so any fixed number is either too slow or shedding. Instead
+# each success, while the recent shed rate is under SHED_TARGET and latency is sane,
+# adds RATE_STEP req/s and 1/window in-flight slots; each shed (503/502/timeout)
+# cuts both by DECREASE. Cuts are spaced by CUT_COOLDOWN so one burst of 503s --
+# every in-flight request failing together -- counts as one signal, not six.
+START_RATE = 1.0
+MIN_RATE = 0.1
+RATE_STEP = 0.02
+START_WINDOW = 2.0
+DECREASE = 0.6
+CUT_COOLDOWN = 2.0
+SHED_TARGET = 0.2
+RECENT = 50
+LATENCY_CEILING = 20.0
+
+
+class RateController:
+    """Shared pacing and in-flight limit for every thread calling get_json."""
+
+    def __init__(self):
+        self._cv = threading.Condition()
+        self.rate = START_RATE
+        self.window = START_WINDOW
+        self.inflight = 0
+        self.cuts = 0
+        self.latency = None         # EWMA of successful-call latency, seconds
+        self._next = 0.0
+        self._last_cut = -CUT_COOLDOWN
+        self._recent = deque(maxlen=RECENT)
+
+    def acquire(self):
+        """Block until a slot is free and the pace allows another request."""
+        with self._cv:
+            while self.inflight >= int(self.window):
+                self._cv.wait()
+            self.inflight += 1
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + 1.0 / self.rate
         if wait > 0:
             time.sleep(wait)
-        _last_call[0] = time.monotonic()
+
+    def shed_rate(self):
+        return (sum(1 for ok in self._recent if not ok) / len(self._recent)
+                if self._recent else 0.0)
+
+    def release(self, outcome, latency=None):
+        """outcome: True served, False shed, None neither (a 400 says nothing)."""
+        with self._cv:
+            self.inflight -= 1
+            if outcome is True:
+                self._recent.append(True)
+                self.latency = (latency if self.latency is None
+                                else 0.8 * self.latency + 0.2 * latency)
+                if (self.shed_rate() <= SHED_TARGET
+                        and self.latency <= LATENCY_CEILING):
+                    self.rate = min(1.0 / MIN_INTERVAL, self.rate + RATE_STEP)
+                    self.window = min(MAX_INFLIGHT, self.window + 1.0 / self.window)
+            elif outcome is False:
+                self._recent.append(False)
+                now = time.monotonic()
+                if now - self._last_cut >= CUT_COOLDOWN:
+                    self.rate = max(MIN_RATE, self.rate * DECREASE)
+                    self.window = max(1.0, self.window * DECREASE)
+                    self._last_cut = now
+                    self.cuts += 1
+            self._cv.notify_all()
+
+    def state(self):
+        with self._cv:
+            return {"rate": round(self.rate, 3), "window": round(self.window, 2),
+                    "inflight": self.inflight, "shed_rate": round(self.shed_rate(), 3),
+                    "latency": None if self.latency is None else round(self.latency, 2),
+                    "cuts": self.cuts}
+
+
+class Blocked(RuntimeError):
+    """api.pbpstats.com answered 403: this IP is blocked, not this request refused."""
+
+
+_controller = RateController()
+
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "retries": 0, "failures": 0, "successes": 0, "cache_hits": 0}
 
 
 def stats():
     with _stats_lock:
-        return dict(_stats)
+        out = dict(_stats)
+    out.update(_controller.state())
+    return out
 
 
 def _bump(key, n=1):
@@ -85,20 +173,30 @@ def get_json(path, params, max_attempts=MAX_ATTEMPTS):
     amount of waiting fixes it).
     """
     url = f"{BASE}{path}?{urllib.parse.urlencode(params)}"
+    # A cached response never reaches pbpstats, so it bypasses the controller.
+    body = http_pool.cached(url)
+    if body is not None:
+        _bump("cache_hits")
+        return body
+    headers = {"User-Agent": UA, "Accept": "application/json"}
     last = None
     for attempt in range(1, max_attempts + 1):
-        req = urllib.request.Request(url, headers={"User-Agent": UA,
-                                                   "Accept": "application/json"})
+        _controller.acquire()
+        t0 = time.monotonic()
+        outcome = None
         try:
-            _pace()
             _bump("calls")
-            with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-                return json.loads(r.read())
+            body = http_pool.get_json(url, headers, TIMEOUT, attempt=attempt)
+            outcome = True
+            _bump("successes")
+            return body
         except urllib.error.HTTPError as e:
             last = f"HTTP {e.code}"
+            if e.code in RETRY_STATUS or e.code == 403:
+                outcome = False
             if e.code == 403:
                 _bump("failures")
-                raise RuntimeError(
+                raise Blocked(
                     "api.pbpstats.com returned 403 Forbidden. If every request is "
                     "doing this, including https://api.pbpstats.com/ itself, this IP "
                     "is blocked -- it is not a per-season or per-endpoint permission. "
@@ -110,6 +208,9 @@ def get_json(path, params, max_attempts=MAX_ATTEMPTS):
                 raise RuntimeError(f"{last} (not retryable) for {url}") from e
         except TRANSIENT as e:
             last = f"{type(e).__name__}: {e}"
+            outcome = False
+        finally:
+            _controller.release(outcome, time.monotonic() - t0)
 
         if attempt < max_attempts:
             _bump("retries")
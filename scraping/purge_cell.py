@@ -21,6 +21,7 @@ import argparse
 from collections import Counter
 
 import mongo_sink
+import schema_registry
 
 
 def main():
@@ -60,6 +61,11 @@ def main():
 
     res = coll.delete_many(q)
     print(f"\ndeleted {res.deleted_count} documents")
+    if args.source in mongo_sink.KEY_FIELDS:
+        n_led = mongo_sink.forget_keys(coll, args.source, args.timestamp)
+        print(f"dropped {n_led} resume-ledger entr{'y' if n_led == 1 else 'ies'}")
+        n_cat = schema_registry.forget(coll, args.source, args.timestamp)
+        print(f"dropped {n_cat} schema-registry catalog(s)")
     print(f"remaining for this source+timestamp: {coll.count_documents(q)}")
 
 
@@ -0,0 +1,127 @@
+"""RawSink's v2 on-disk format: gzip JSONL segments, each sealed by a footer.
+
+v1 was one plain JSONL file per cell. A resumed scrape reparsed the whole file to
+rebuild its key set, a torn line was only noticed when json.loads failed on it, and
+the opponent-wowy cells -- half-megabyte rows, ten thousand of them -- made the files
+large enough for disk and reparse time to matter.
+
+v2 writes each flush as its own segment in a per-cell directory:
+
+  raw/<source>/<timestamp>_<season_type>/seg-000001.jsonl.gz
+                                         seg-000001.footer.json
+                                         LOADED
+
+The footer is written only after the segment is closed, and holds the row count,
+the segment's key tuples, a hash of the sorted key set and a sha256 of the
+compressed bytes. So:
+
+  * a segment with no footer was torn by a kill, and is skipped -- its keys never
+    reached a footer, so a resumed scrape fetches those rows again;
+  * the key set for a resume comes from the footers alone, without decompressing
+    anything;
+  * load_raw.py checks the sha256 before loading a segment and appends its name to
+    LOADED once every row is upserted, so a re-run skips it.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+
+FORMAT = 2
+SEG_GLOB = "seg-*.jsonl.gz"
+
+
+def keys_hash(keys):
+    blob = json.dumps(sorted(json.dumps(k, ensure_ascii=False) for k in keys))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def footer_path(seg):
+    return seg.with_name(seg.name.replace(".jsonl.gz", ".footer.json"))
+
+
+def _next_segment(cell_dir):
+    """Claim the next free segment name; O_EXCL makes concurrent writers safe."""
+    n = len(list(cell_dir.glob(SEG_GLOB)))
+    while True:
+        n += 1
+        seg = cell_dir / f"seg-{n:06d}.jsonl.gz"
+        try:
+            os.close(os.open(seg, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return seg
+        except FileExistsError:
+            continue
+
+
+def write_segment(cell_dir, rows, key_fields):
+    """Write rows as one sealed segment. -> the segment path."""
+    cell_dir = Path(cell_dir)
+    cell_dir.mkdir(parents=True, exist_ok=True)
+    seg = _next_segment(cell_dir)
+    with gzip.open(seg, "wt", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    keys = [[r.get(k) for k in key_fields] for r in rows]
+    footer = {"format": FORMAT, "rows": len(rows), "key_fields": list(key_fields),
+              "keys": keys, "keys_sha256": keys_hash(keys),
+              "bytes": seg.stat().st_size, "sha256": file_hash(seg)}
+    tmp = footer_path(seg).with_suffix(".tmp")
+    tmp.write_text(json.dumps(footer, ensure_ascii=False))
+    tmp.replace(footer_path(seg))
+    return seg
+
+
+def read_footer(seg):
+    """The segment's footer, or None if it was never sealed."""
+    fp = footer_path(seg)
+    if not fp.exists():
+        return None
+    try:
+        return json.loads(fp.read_text(encoding="utf-8"))
+    except json.JSONDecodeError:
+        return None
+
+
+def segments(cell_dir):
+    """-> [(segment path, footer or None)] in write order."""
+    return [(seg, read_footer(seg)) for seg in sorted(Path(cell_dir).glob(SEG_GLOB))]
+
+
+def cell_keys(cell_dir):
+    """Key tuples across every sealed segment, from the footers alone."""
+    out = set()
+    for _, footer in segments(cell_dir):
+        if footer:
+            out.update(tuple(k) for k in footer["keys"])
+    return out
+
+
+def verify(seg, footer):
+    """True when the segment's bytes are the ones its footer sealed."""
+    return (footer is not None and seg.stat().st_size == footer["bytes"]
+            and file_hash(seg) == footer["sha256"])
+
+
+def read_segment(seg):
+    with gzip.open(seg, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def loaded(cell_dir):
+    p = Path(cell_dir) / "LOADED"
+    return set(p.read_text().split()) if p.exists() else set()
+
+
+def mark_loaded(cell_dir, seg):
+    with (Path(cell_dir) / "LOADED").open("a") as f:
+        f.write(Path(seg).name + "\n")
@@ -0,0 +1,281 @@
+"""A field catalog per (source, sub-table, cell), kept up to date at ingest time.
+
+Schema drift used to be found at build time, by scanning: verify_scrape.field_report
+read every document of two cells to diff their field names, and training/coverage.py
+pulled sampled cells whole to recompute which fields are populated. Neither could
+run often, so a renamed column was found when a model had already been trained on a
+column of NaNs.
+
+write_rows() now keeps one small document per cell in REGISTRY_NAME:
+
+  {"_id": "nba-tracking|20260105000000|Regular season",
+   "source": ..., "timestamp": ..., "season_type": ...,
+   "subs": {"speed-distance": {"rows": 512,
+                               "fields": {"DIST_MILES": {"n": 512, "num": 512}, ...}}}}
+
+sub is the part of the upsert key past the player (data_type, on_or_off), "-" for a
+source without one. n counts rows carrying the field, num those whose value parses
+as a number (utils.as_float's test). A batch is folded in with one $inc per cell:
++1 for every row written, -1 for what each document it replaced held, which
+write_rows tallies on the server (replaced()) just before the upsert. Writers
+running at once only ever $inc, so none of them can lose another's counts.
+
+Drift checks and coverage then read O(fields) per cell. Cells written before the
+registry existed have no entry, and a delta onto nothing would be wrong: the first
+write into one recounts it, catalog() scans and seeds one on first read, and
+--backfill does the whole collection once.
+
+Run:  python scraping/schema_registry.py --backfill
+      python scraping/schema_registry.py --source nba-tracking --timestamp 20260105000000
+"""
+
+import argparse
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+import mongo_sink
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import as_float  # noqa: E402
+
+REGISTRY_NAME = "schema_registry"
+# The upsert-key fields that split a cell into tables (mongo_sink.KEY_FIELDS).
+SUB_FIELDS = ("data_type", "on_or_off")
+NO_SUB = "-"
+# The document's own identity; never catalogued.
+SKIP_FIELDS = {"_id", "source", "timestamp", "season_type", "standard_name"}
+
+# Mongo reads '.' in a key as a path and '$' at its start as an operator, and the
+# tracking feeds have "DIST. MILES".
+def _enc(name):
+    return name.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def _dec(key):
+    return key.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+
+def _registry(coll):
+    return coll.database[REGISTRY_NAME]
+
+
+def _id(source, timestamp, season_type):
+    return f"{source}|{timestamp}|{season_type}"
+
+
+def tally(rows):
+    """rows of one source -> {(ts, st): {sub: [rows, {field: [n, num]}]}}."""
+    out = defaultdict(lambda: defaultdict(lambda: [0, defaultdict(lambda: [0, 0])]))
+    for r in rows:
+        sub = next((r[k] for k in SUB_FIELDS if r.get(k)), NO_SUB)
+        t = out[(r["timestamp"], r["season_type"])][sub]
+        t[0] += 1
+        for k, v in r.items():
+            if k in SKIP_FIELDS or k in SUB_FIELDS:
+                continue
+            c = t[1][k]
+            c[0] += 1
+            c[1] += as_float(v) is not None
+    return out
+
+
+def _inc(subs, inc=None, sign=1):
+    inc = {} if inc is None else inc
+    for sub, (n, fields) in subs.items():
+        p = f"subs.{_enc(sub)}"
+        inc[f"{p}.rows"] = inc.get(f"{p}.rows", 0) + sign * n
+        for f, (k, num) in fields.items():
+            for name, v in (("n", k), ("num", num)):
+                key = f"{p}.fields.{_enc(f)}.{name}"
+                inc[key] = inc.get(key, 0) + sign * v
+    return inc
+
+
+def _doc(subs):
+    return {_enc(sub): {"rows": n,
+                        "fields": {_enc(f): {"n": k, "num": num}
+                                   for f, (k, num) in fields.items()}}
+            for sub, (n, fields) in subs.items()}
+
+
+def replaced(coll, rows, source):
+    """Tally, as tally() does, the stored documents rows are about to replace.
+
+    The server does the counting: the documents are matched on their whole upsert
+    key and reduced to a count per (sub, field), so what comes back is O(fields)
+    per cell, not the documents. Non-numeric values (other than the player's name,
+    which only counts rows) come back once each, for as_float's string test.
+    """
+    rest = mongo_sink.cell_key_fields(source)
+    subs = [k for k in SUB_FIELDS if k in rest]
+    sub = NO_SUB
+    for k in reversed(subs):
+        sub = {"$ifNull": [f"$_id.{k}", sub]}
+    numeric = {"$isNumber": "$f.v"}
+    by_cell = defaultdict(dict)
+    for r in rows:
+        by_cell[(r["timestamp"], r["season_type"])][tuple(r[k] for k in rest)] = None
+    out = defaultdict(lambda: defaultdict(lambda: [0, defaultdict(lambda: [0, 0])]))
+    for (ts, st), want in by_cell.items():
+        pipeline = [
+            {"$match": {"source": source, "timestamp": ts, "season_type": st,
+                        "$or": [dict(zip(rest, k)) for k in want]}},
+            # replace_one replaces one of any repeats
+            {"$group": {"_id": {k: f"${k}" for k in rest}, "d": {"$first": "$$ROOT"}}},
+            {"$project": {"sub": sub, "f": {"$objectToArray": "$d"}}},
+            {"$unwind": "$f"},
+            {"$match": {"f.k": {"$nin": sorted((SKIP_FIELDS | set(SUB_FIELDS))
+                                              - {"standard_name"})}}},
+            {"$group": {"_id": {"sub": "$sub", "k": "$f.k",
+                                "v": {"$cond": [{"$or": [numeric, {"$eq": [
+                                    "$f.k", "standard_name"]}]}, None, "$f.v"]}},
+                        "n": {"$sum": 1},
+                        "num": {"$sum": {"$cond": [numeric, 1, 0]}}}},
+        ]
+        for g in coll.aggregate(pipeline, allowDiskUse=True):
+            t = out[(ts, st)][g["_id"]["sub"]]
+            f = g["_id"]["k"]
+            if f == "standard_name":
+                t[0] += g["n"]
+                continue
+            c = t[1][f]
+            c[0] += g["n"]
+            c[1] += g["num"] or (g["n"] if as_float(g["_id"]["v"]) is not None else 0)
+    return out
+
+
+def add_rows(coll, rows, source, old=None):
+    """Fold written rows into their cells' catalogs, less the documents they
+    replaced (old, replaced()'s tally of them, read before the write).
+
+    A cell with no catalog yet may hold documents written before the registry
+    existed, which no delta accounts for; it is recounted instead, and since this
+    runs after the write the recount has the new rows.
+    """
+    keys = mongo_sink.KEY_FIELDS[source]
+    rows = {tuple(r.get(k) for k in keys): r for r in rows}.values()   # last wins
+    new, gone = tally(rows), old or {}
+    for cell in sorted(set(new) | set(gone)):
+        inc = _inc(gone.get(cell, {}), _inc(new.get(cell, {})), sign=-1)
+        ts, st = cell
+        res = _registry(coll).update_one({"_id": _id(source, ts, st)}, {"$inc": inc})
+        if not res.matched_count:
+            recount(coll, source, ts, st)
+
+
+def recount(coll, source, timestamp, season_type):
+    """Rebuild one cell's catalog from its documents. -> the cell's subs."""
+    docs = list(coll.find({"source": source, "timestamp": timestamp,
+                           "season_type": season_type}))
+    subs = tally(docs).get((timestamp, season_type), {})
+    _registry(coll).replace_one(
+        {"_id": _id(source, timestamp, season_type)},
+        {"source": source, "timestamp": timestamp, "season_type": season_type,
+         "subs": _doc(subs)},
+        upsert=True)
+    return subs
+
+
+def forget(coll, source, timestamp, season_type=None):
+    """Drop catalogs for deleted documents, as purge_cell.py does."""
+    q = {"source": source, "timestamp": timestamp}
+    if season_type is not None:
+        q["season_type"] = season_type
+    return _registry(coll).delete_many(q).deleted_count
+
+
+def _decode(subs):
+    return {_dec(sub): {"rows": s["rows"],
+                        "fields": {_dec(f): (c["n"], c["num"])
+                                   for f, c in s["fields"].items()}}
+            for sub, s in subs.items()}
+
+
+def catalog(coll, source, timestamp, season_type, sub=None):
+    """-> {"rows": n, "fields": {field: (n_present, n_numeric)}} for one table of
+    one cell ({sub: that} for every table when sub is None); scans and seeds a cell
+    the registry has not seen."""
+    doc = _registry(coll).find_one({"_id": _id(source, timestamp, season_type)})
+    if doc is None:
+        recount(coll, source, timestamp, season_type)
+        doc = _registry(coll).find_one({"_id": _id(source, timestamp, season_type)})
+    subs = _decode(doc.get("subs", {}))
+    if sub is None:
+        return subs
+    return subs.get(sub or NO_SUB, {"rows": 0, "fields": {}})
+
+
+def catalogs(coll, query=None):
+    """Every registered cell matching query -> {(source, ts, st): {sub: catalog}}."""
+    return {(d["source"], d["timestamp"], d["season_type"]): _decode(d.get("subs", {}))
+            for d in _registry(coll).find(query or {})}
+
+
+def drift(old, new, numeric_rate=0.5):
+    """Two catalogs of the same table -> (gone, added, turned non-numeric).
+
+    gone and added compare field names, as field_report always has. Turned
+    non-numeric is a field that parsed in at least numeric_rate of the old rows
+    carrying it and in under half that share of the new ones -- a column that
+    started arriving as text is as lost to the models as one that was renamed.
+    """
+    def share(c, f):
+        n, num = c["fields"][f]
+        return num / n if n else 0.0
+    po = {f for f, (n, _) in old["fields"].items() if n}
+    pn = {f for f, (n, _) in new["fields"].items() if n}
+    turned = sorted(f for f in po & pn
+                    if share(old, f) >= numeric_rate and share(new, f) < numeric_rate / 2)
+    return sorted(po - pn), sorted(pn - po), turned
+
+
+def backfill(coll, sources, force=False):
+    """Catalog every cell of sources that has no registry entry yet (all with force)."""
+    have = set(catalogs(coll, {"source": {"$in": list(sources)}})) if not force \
+        else set()
+    n = 0
+    for source in sources:
+        cells = coll.aggregate([{"$match": {"source": source}},
+                                {"$group": {"_id": {"ts": "$timestamp",
+                                                    "st": "$season_type"}}}],
+                               allowDiskUse=True)
+        for c in sorted((r["_id"]["ts"], r["_id"]["st"]) for r in cells):
+            if (source, *c) in have:
+                continue
+            subs = recount(coll, source, *c)
+            n += 1
+            print(f"  {source:<14} {c[0]} {c[1]:<15} "
+                  f"{sum(s[0] for s in subs.values()):>6} rows, "
+                  f"{len({f for s in subs.values() for f in s[1]})} fields")
+    return n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backfill", action="store_true",
+                    help="catalog every cell that has no registry entry")
+    ap.add_argument("--force", action="store_true", help="with --backfill: recount all")
+    ap.add_argument("--source", choices=sorted(mongo_sink.KEY_FIELDS))
+    ap.add_argument("--timestamp")
+    ap.add_argument("--season-type", default="Regular season")
+    args = ap.parse_args()
+
+    coll = mongo_sink.get_collection()
+    if args.backfill:
+        n = backfill(coll, [args.source] if args.source else sorted(mongo_sink.KEY_FIELDS),
+                     args.force)
+        print(f"catalogued {n} cell(s)")
+        return
+    if not (args.source and args.timestamp):
+        ap.error("--source and --timestamp, or --backfill")
+    for sub, c in sorted(catalog(coll, args.source, args.timestamp,
+                                 args.season_type).items()):
+        print(f"{sub}: {c['rows']} rows")
+        for f, (n, num) in sorted(c["fields"].items()):
+            print(f"  {f:<40} {n / c['rows']:>6.1%} present  "
+                  f"{num / max(n, 1):>6.1%} numeric")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Every source for every cell in one run, with the two hosts working at once.
+
+README §4 runs the scrapers one after another, so a full refresh takes the sum of
+their times even though half of them talk to api.pbpstats.com and the other half
+to stats.nba.com, and neither host cares what the other is doing. This builds the
+per-cell dependency graph
+
+    pbp ──> wowy, wowy-opp                      (api.pbpstats.com)
+      └───> nba-tracking, nba-defend, nba-shotdash   (stats.nba.com)
+
+-- everything downstream of pbp reads the roster file scrape_pbp_totals writes --
+and runs each node as soon as its roster exists and its host has a free slot.
+HOST_BUDGET is how many cells may be in progress against a host at once. The
+per-request pacing inside each host is still the host's own: pbpstats_client's
+controller for pbpstats, stats_nba's token bucket (shared by all three
+stats.nba.com sources) for stats.nba.com. So a refresh now takes about as long as
+the slower host.
+
+pbp cells are preferred over wowy when a pbpstats slot frees up, since each one
+unblocks four more tasks. A node whose pbp cell failed is reported as blocked,
+not attempted. A host given no slots (--stats-cells 0) has its tasks reported as
+skipped, and what waits on them as blocked. Each task calls the source script's own scrape_cell, so resume
+behaviour (existing_keys, the resume ledger, the response cache) is unchanged.
+
+Run:  python scraping/scrape_all.py --seasons 2025-26
+      python scraping/scrape_all.py --seasons 2024-25 2025-26 --sources pbp wowy
+      python scraping/scrape_all.py --raw-dir raw      # if Atlas unreachable
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import mongo_sink
+import pbpstats_client
+import scrape_defend
+import scrape_nba_tracking
+import scrape_pbp_totals
+import scrape_shotdash
+import scrape_wowy
+import season_dates
+
+PBPSTATS, STATS_NBA = "api.pbpstats.com", "stats.nba.com"
+
+# Cells in progress per host. pbpstats' controller already sets the request-level
+# concurrency, so two cells there just keeps it fed across a cell boundary.
+# stats.nba.com blocks aggressively; stats_nba paces and bounds every request to it
+# from this process, so two cells just keep its in-flight slots fed.
+HOST_BUDGET = {PBPSTATS: 2, STATS_NBA: 2}
+
+# source -> (host, depends on pbp for the cell, scheduling priority; lower first)
+SOURCES = {
+    "pbp": (PBPSTATS, False, 0),
+    "wowy": (PBPSTATS, True, 1),
+    "wowy-opp": (PBPSTATS, True, 1),
+    "nba-tracking": (STATS_NBA, True, 0),
+    "nba-defend": (STATS_NBA, True, 0),
+    "nba-shotdash": (STATS_NBA, True, 0),
+}
+
+
+def run_task(source, cell, coll, dry_run, problems):
+    """One source for one cell, through that source's own scrape_cell."""
+    if source == "pbp":
+        scrape_pbp_totals.scrape_cell(coll, cell, dry_run)
+    elif source in ("wowy", "wowy-opp"):
+        opp = source == "wowy-opp"
+        scrape_wowy.scrape_cell(coll, cell, dry_run=dry_run, source=source,
+                                wowy_type="Opponent" if opp else "Team")
+    elif source == "nba-tracking":
+        scrape_nba_tracking.scrape_cell(coll, cell,
+                                        scrape_nba_tracking.load_roster(cell),
+                                        dry_run, problems)
+    elif source == "nba-defend":
+        scrape_defend.scrape_cell(coll, cell, scrape_defend.load_roster(cell), dry_run)
+    elif source == "nba-shotdash":
+        scrape_shotdash.scrape_cell(coll, cell, scrape_shotdash.load_roster(cell),
+                                    dry_run)
+    else:
+        raise ValueError(source)
+
+
+def build_graph(cells, sources):
+    """-> {task: [tasks it waits for]}, task = (source, timestamp, season_type).
+
+    A dependency on pbp is only an edge when pbp is part of this run; otherwise the
+    roster is expected to exist already, and load_roster says so if it does not.
+    """
+    graph = {}
+    for cell in cells:
+        pbp = ("pbp", cell["timestamp"], cell["season_type"])
+        for source in sources:
+            needs_pbp = SOURCES[source][1] and "pbp" in sources
+            graph[(source, cell["timestamp"], cell["season_type"])] = (
+                [pbp] if needs_pbp else [])
+    return graph
+
+
+class Scheduler:
+    """Runs a task graph with a separate slot budget per host."""
+
+    def __init__(self, graph, run, budget=HOST_BUDGET):
+        self.graph = graph
+        self.run = run
+        self.budget = dict(budget)
+        self.status = {}             # task -> ok | failed | skipped | blocked
+        self.elapsed = {}
+        self.busy = {h: 0.0 for h in self.budget}
+        self._lock = threading.Lock()
+
+    def _host(self, task):
+        return SOURCES[task[0]][0]
+
+    def _timed(self, task):
+        t0 = time.time()
+        try:
+            self.run(task)
+            result = "ok"
+        except SystemExit as e:
+            # load_roster's "missing roster" -- same meaning as in the scripts.
+            print(f"  SKIPPED {' '.join(task)}: {e}")
+            result = "skipped"
+        except Exception as e:
+            print(f"  FAILED {' '.join(task)}: {type(e).__name__}: {e}")
+            result = "failed"
+        dt = time.time() - t0
+        with self._lock:
+            self.busy[self._host(task)] += dt
+        return task, result, dt
+
+    def execute(self):
+        waiting = {t: set(deps) for t, deps in self.graph.items()}
+        off = [t for t in waiting if self.budget.get(self._host(t), 0) <= 0]
+        for t in off:
+            del waiting[t]
+            self.status[t] = "skipped"
+        for h in sorted({self._host(t) for t in off}):
+            print(f"  SKIPPED {sum(self._host(t) == h for t in off)} task(s) on {h}: "
+                  f"no slots in the budget")
+        for t in [t for t, deps in waiting.items() if not deps.isdisjoint(off)]:
+            if t in waiting:
+                self._block(t, waiting)
+        ready = []
+        inflight = {h: 0 for h in self.budget}
+        pools = {h: ThreadPoolExecutor(max_workers=n, thread_name_prefix=h)
+                 for h, n in self.budget.items() if n > 0}
+        futures = set()
+        try:
+            while waiting or ready or futures:
+                for t in [t for t, deps in waiting.items() if not deps]:
+                    ready.append(t)
+                    del waiting[t]
+                ready.sort(key=lambda t: (SOURCES[t[0]][2], t[1], t[2], t[0]))
+                for t in list(ready):
+                    h = self._host(t)
+                    if inflight[h] < self.budget[h]:
+                        inflight[h] += 1
+                        ready.remove(t)
+                        futures.add(pools[h].submit(self._timed, t))
+                if not futures:
+                    break
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    task, result, dt = fut.result()
+                    inflight[self._host(task)] -= 1
+                    self.status[task] = result
+                    self.elapsed[task] = dt
+                    for t, deps in list(waiting.items()):
+                        if task not in deps:
+                            continue
+                        if result == "ok":
+                            deps.discard(task)
+                        else:
+                            self._block(t, waiting)
+        finally:
+            for p in pools.values():
+                p.shutdown(wait=True)
+        for t in waiting:
+            self.status.setdefault(t, "blocked")
+        return self.status
+
+    def _block(self, task, waiting):
+        del waiting[task]
+        self.status[task] = "blocked"
+        for t, deps in list(waiting.items()):
+            if t in waiting and task in deps:
+                self._block(t, waiting)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seasons", nargs="*", default=list(season_dates.SNAPSHOTS))
+    ap.add_argument("--sources", nargs="*", choices=list(SOURCES),
+                    default=list(SOURCES))
+    ap.add_argument("--rs-only", action="store_true")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--raw-dir", help="write rows to JSONL files here instead of Mongo "
+                                      "(load later with load_raw.py)")
+    ap.add_argument("--pbpstats-cells", type=int, default=HOST_BUDGET[PBPSTATS],
+                    help="cells in progress against api.pbpstats.com at once")
+    ap.add_argument("--stats-cells", type=int, default=HOST_BUDGET[STATS_NBA],
+                    help="cells in progress against stats.nba.com at once")
+    ap.add_argument("--out", default="tracking_mapping_report.json")
+    args = ap.parse_args()
+
+    coll = (mongo_sink.RawSink(args.raw_dir) if args.raw_dir
+            else None if args.dry_run else mongo_sink.check_connection())
+    cells = [c for c in season_dates.cells(tuple(args.seasons))
+             if not args.rs_only or c["season_type"] == "Regular season"]
+    by_key = {(c["timestamp"], c["season_type"]): c for c in cells}
+    graph = build_graph(cells, args.sources)
+    problems = []
+
+    def run(task):
+        source, ts, st = task
+        run_task(source, by_key[(ts, st)], coll, args.dry_run, problems)
+
+    budget = {PBPSTATS: args.pbpstats_cells, STATS_NBA: args.stats_cells}
+    print(f"[all] {len(cells)} cell(s) x {len(args.sources)} source(s) = "
+          f"{len(graph)} tasks; budget {budget}")
+    t0 = time.time()
+    sched = Scheduler(graph, run, budget)
+    status = sched.execute()
+    wall = time.time() - t0
+
+    print(f"\n[all] done in {wall / 60:.1f}m")
+    for source in args.sources:
+        counts = {}
+        for (s, _, _), r in status.items():
+            if s == source:
+                counts[r] = counts.get(r, 0) + 1
+        print(f"  {source:<13} " + "  ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    for h, busy in sched.busy.items():
+        print(f"  {h:<17} {busy / 60:.1f}m of cell time")
+    print(f"  http (pbpstats): {pbpstats_client.stats()}")
+    if problems:
+        Path(args.out).write_text(json.dumps(problems, indent=2))
+        print(f"\n{len(problems)} tracking table(s) had column-mapping problems and "
+              f"were NOT written; see {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,39 +20,23 @@ and the feature is fully validatable.
 Run:  python scraping/scrape_defend.py                 # all cells, ~156 requests
       python scraping/scrape_defend.py --seasons 2013-14 2014-15
       python scraping/scrape_defend.py --raw-dir raw_defend   # if Atlas unreachable
+      python scraping/scrape_defend.py --snapshots --incremental
 """
 
 import argparse
 import json
-import time
-import urllib.error
 import urllib.parse
-import urllib.request
 from pathlib import Path
 
 import mongo_sink
 import season_dates
+import snapshot_deltas
+import stats_nba
 from scrape_pbp_totals import ROSTER_DIR
 
 SOURCE = "nba-defend"
 BASE = "https://stats.nba.com/stats/leaguedashptdefend"
 
-HEADERS = {
-    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                   "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"),
-    "Referer": "https://www.nba.com/",
-    "Origin": "https://www.nba.com",
-    "Accept": "application/json, text/plain, */*",
-    "Accept-Language": "en-US,en;q=0.9",
-    "x-nba-stats-origin": "stats",
-    "x-nba-stats-token": "true",
-    "Connection": "keep-alive",
-}
-
-DELAY = 2.0
-MAX_ATTEMPTS = 6
-TIMEOUT = 90
-
 # data_type slug -> API DefenseCategory. "2 Pointers" and "3 Pointers" are the two
 # 538 actually used; the rest cost nothing and give rim/perimeter granularity.
 CATEGORIES = {
@@ -81,22 +65,7 @@ def get_json(category, season, api_type, date_from, date_to):
         "Season": season, "SeasonSegment": "", "SeasonType": api_type, "TeamID": 0,
         "VsConference": "", "VsDivision": "", "Weight": "",
     }
-    url = f"{BASE}?{urllib.parse.urlencode(params)}"
-    last = None
-    for attempt in range(1, MAX_ATTEMPTS + 1):
-        try:
-            req = urllib.request.Request(url, headers=HEADERS)
-            with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-                return json.loads(r.read())
-        except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError,
-                json.JSONDecodeError, OSError) as e:
-            last = f"{type(e).__name__}: {e}"
-            print(f"      attempt {attempt}/{MAX_ATTEMPTS} failed ({last})")
-            time.sleep(DELAY * attempt)
-    raise RuntimeError(
-        f"stats.nba.com unreachable after {MAX_ATTEMPTS} attempts ({last}). "
-        f"If every request does this, the IP is blocked -- run from a home "
-        f"connection.")
+    return stats_nba.get_json(f"{BASE}?{urllib.parse.urlencode(params)}")
 
 
 def load_roster(cell):
@@ -119,13 +88,17 @@ def _mmddyyyy(iso):
     return f"{m}/{d}/{y}"
 
 
-def scrape_cell(coll, cell, roster, dry_run=False):
+def fetch_table(cell, data_type):
+    """-> (headers, rows) for one DefenseCategory over the cell's date range."""
+    payload = get_json(CATEGORIES[data_type], cell["season"], cell["api_type"],
+                       _mmddyyyy(cell["from"]), _mmddyyyy(cell["to"]))
+    rs = payload["resultSets"][0]
+    return rs["headers"], rs["rowSet"]
+
+
+def scrape_cell(coll, cell, roster, dry_run=False, fetch=fetch_table):
     print(f"  {cell['season']} {cell['season_type']}")
-    for data_type, category in CATEGORIES.items():
-        payload = get_json(category, cell["season"], cell["api_type"],
-                           _mmddyyyy(cell["from"]), _mmddyyyy(cell["to"]))
-        rs = payload["resultSets"][0]
-        headers, rows = rs["headers"], rs["rowSet"]
+    for data_type, (headers, rows) in stats_nba.fetch_tables(fetch, cell, CATEGORIES):
         id_col = next(h for h in ("CLOSE_DEF_PERSON_ID", "PLAYER_ID")
                       if h in headers)
         pid_i = headers.index(id_col)
@@ -154,7 +127,6 @@ def scrape_cell(coll, cell, roster, dry_run=False):
         print(f"    {data_type:<16} {len(rows):>4} players "
               f"({unknown} not in roster)  "
               f"mongo: {ins} ins, {mod} upd, {matched - mod} same")
-        time.sleep(DELAY)
 
 
 def main():
@@ -165,6 +137,12 @@ def main():
                     help="scrape the in-season snapshot cells listed in "
                          "defend_snapshots.json (season start .. snapshot date), "
                          "closing the training-coverage gap")
+    ap.add_argument("--incremental", action="store_true",
+                    help="with --snapshots, fetch each window between snapshot "
+                         "dates once and sum them (see snapshot_deltas.py)")
+    ap.add_argument("--cells", type=int, default=stats_nba.CELL_WORKERS,
+                    help="cells in progress at once (requests are paced by "
+                         "stats_nba.py whatever this is)")
     ap.add_argument("--dry-run", action="store_true")
     ap.add_argument("--raw-dir", help="write JSONL here instead of Mongo "
                                       "(load later with load_raw.py)")
@@ -181,17 +159,16 @@ def main():
     else:
         cells = [c for c in season_dates.cells(tuple(args.seasons))]
         print(f"[nba-defend] {len(args.seasons)} season(s)")
-    for cell in cells:
-        if args.rs_only and cell["season_type"] != "Regular season":
-            continue
-        try:
-            scrape_cell(coll, cell, load_roster(cell), args.dry_run)
-        except SystemExit as e:
-            print(f"  SKIPPED {cell['season']} {cell['season_type']}: {e}")
-        except Exception as e:
-            print(f"  FAILED {cell['season']} {cell['season_type']}: "
-                  f"{type(e).__name__}: {e}")
-    print("[nba-defend] done")
+    fetch = fetch_table
+    if args.incremental:
+        if not args.snapshots:
+            raise SystemExit("--incremental applies to --snapshots cells")
+        fetch = snapshot_deltas.WindowStore(SOURCE, fetch_table, cells)
+    if args.rs_only:
+        cells = [c for c in cells if c["season_type"] == "Regular season"]
+    stats_nba.run_cells(cells, lambda cell: scrape_cell(
+        coll, cell, load_roster(cell), args.dry_run, fetch), args.cells)
+    print("[nba-defend] done" + (f". {fetch.summary()}" if args.incremental else ""))
 
 
 if __name__ == "__main__":
@@ -37,36 +37,17 @@ Run:  python scraping/scrape_nba_tracking.py --report      # check mapping, writ
 
 import argparse
 import json
-import time
-import urllib.error
 import urllib.parse
-import urllib.request
 from pathlib import Path
 
 import mongo_sink
 import season_dates
+import stats_nba
 from scrape_pbp_totals import ROSTER_DIR
 
 SOURCE = "nba-tracking"
 BASE = "https://stats.nba.com/stats/leaguedashptstats"
 
-HEADERS = {
-    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                   "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"),
-    "Referer": "https://www.nba.com/",
-    "Origin": "https://www.nba.com",
-    "Accept": "application/json, text/plain, */*",
-    "Accept-Language": "en-US,en;q=0.9",
-    "x-nba-stats-origin": "stats",
-    "x-nba-stats-token": "true",
-    "Connection": "keep-alive",
-}
-
-# stats.nba.com rate limits aggressively and answers slowly; go gently.
-DELAY = 2.0
-MAX_ATTEMPTS = 6
-TIMEOUT = 90
-
 # data_type stored in Mongo -> (PtMeasureType, PlayerOrTeam) for the API.
 # The 14 keys are training/coverage.py's TRACK_TYPES, unchanged.
 MEASURE = {
@@ -263,22 +244,7 @@ def get_json(measure_type, season, api_type, date_from, date_to):
         "SeasonSegment": "", "SeasonType": api_type, "TeamID": 0, "VsConference": "",
         "VsDivision": "", "Weight": "",
     }
-    url = f"{BASE}?{urllib.parse.urlencode(params)}"
-    last = None
-    for attempt in range(1, MAX_ATTEMPTS + 1):
-        try:
-            req = urllib.request.Request(url, headers=HEADERS)
-            with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-                return json.loads(r.read())
-        except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError,
-                json.JSONDecodeError, OSError) as e:
-            last = f"{type(e).__name__}: {e}"
-            print(f"      attempt {attempt}/{MAX_ATTEMPTS} failed ({last})")
-            time.sleep(DELAY * attempt)
-    raise RuntimeError(
-        f"stats.nba.com unreachable after {MAX_ATTEMPTS} attempts ({last}).\n"
-        f"If this is every request rather than an occasional one, you are on an IP "
-        f"the NBA blocks -- run this from a home connection.")
+    return stats_nba.get_json(f"{BASE}?{urllib.parse.urlencode(params)}")
 
 
 def load_roster(cell):
@@ -318,13 +284,18 @@ def as_percent(v):
     return v * 100.0 if isinstance(v, (int, float)) and not isinstance(v, bool) else v
 
 
+def fetch_table(cell, data_type):
+    """-> (headers, rows) for one MEASURE table over the cell's date range."""
+    payload = get_json(MEASURE[data_type], cell["season"], cell["api_type"],
+                       _mmddyyyy(cell["from"]), _mmddyyyy(cell["to"]))
+    rs = payload["resultSets"][0]
+    return rs["headers"], rs["rowSet"]
+
+
 def scrape_cell(coll, cell, roster, report_only, problems):
     print(f"  {cell['season']} {cell['season_type']:<15}")
-    for data_type, measure in MEASURE.items():
-        payload = get_json(measure, cell["season"], cell["api_type"],
-                           _mmddyyyy(cell["from"]), _mmddyyyy(cell["to"]))
-        rs = payload["resultSets"][0]
-        headers, rows = rs["headers"], rs["rowSet"]
+    tables = stats_nba.fetch_tables(fetch_table, cell, MEASURE)
+    for data_type, (headers, rows) in tables:
         pid_i = headers.index("PLAYER_ID")
         name_i = headers.index("PLAYER_NAME")
 
@@ -376,7 +347,6 @@ def scrape_cell(coll, cell, roster, report_only, problems):
 
         if not report_only and status == "ok":
             mongo_sink.write_rows(coll, docs, SOURCE)
-        time.sleep(DELAY)
 
 
 def _team_of(headers, row):
@@ -397,6 +367,9 @@ def main():
     ap.add_argument("--report", action="store_true",
                     help="fetch and check the column mapping, write nothing")
     ap.add_argument("--out", default="tracking_mapping_report.json")
+    ap.add_argument("--cells", type=int, default=stats_nba.CELL_WORKERS,
+                    help="cells in progress at once (requests are paced by "
+                         "stats_nba.py whatever this is)")
     ap.add_argument("--raw-dir", help="write rows to JSONL files here instead of Mongo, for when this network cannot reach Atlas (see load_raw.py)")
     args = ap.parse_args()
 
@@ -404,8 +377,10 @@ def main():
             else None if args.report else mongo_sink.check_connection())
     problems = []
     print(f"[nba-tracking] {len(args.seasons)} season(s): {', '.join(args.seasons)}")
-    for cell in season_dates.cells(tuple(args.seasons)):
-        scrape_cell(coll, cell, load_roster(cell), args.report, problems)
+    stats_nba.run_cells(
+        season_dates.cells(tuple(args.seasons)),
+        lambda cell: scrape_cell(coll, cell, load_roster(cell), args.report, problems),
+        args.cells)
 
     if problems:
         Path(args.out).write_text(json.dumps(problems, indent=2))
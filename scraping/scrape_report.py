@@ -0,0 +1,152 @@
+"""What the scrapers' requests actually did, from http_pool's telemetry files.
+
+MIN_INTERVAL, MAX_INFLIGHT and each scraper's DELAY were set from a handful of
+hand-timed runs. http_pool appends one record per request to _telemetry/, and this
+turns those into the numbers that decide them:
+
+  endpoints   requests, cache hits, p50/p95 latency, shed rate, MB, per endpoint
+  over time   per host and --bucket minutes: requests, shed rate (429/5xx and
+              transport errors), 403s, p95 latency, successful wowy splits/min
+  cells       MB transferred and requests per cell (season | type | end date)
+
+A 403 from either host has so far only ever meant an IP block, and the run before
+the 2023-26 block showed rising shed rates first; the report flags both.
+
+Run:  python scraping/scrape_report.py
+      python scraping/scrape_report.py --since 6 --bucket 5 --host api.pbpstats.com
+"""
+
+import argparse
+import json
+import time
+from collections import defaultdict
+
+import http_pool
+
+SHED = {429, 500, 502, 503, 504}
+SPLITS_ENDPOINT = "/get-wowy-stats/nba"
+# Shed rate in the newest bucket, above which the report warns.
+SHED_WARN = 0.5
+
+
+def load(telemetry=http_pool.telemetry, since_hours=None, host=None):
+    cutoff = time.time() - since_hours * 3600 if since_hours else 0
+    out = []
+    for p in telemetry.files():
+        with p.open() as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except json.JSONDecodeError:
+                    continue    # a line torn by a kill
+                if r["ts"] >= cutoff and (host is None or r["host"] == host):
+                    out.append(r)
+    out.sort(key=lambda r: r["ts"])
+    return out
+
+
+def pct(xs, q):
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+
+def is_shed(r):
+    return r["status"] in SHED or (r["status"] is None and r["error"] is not None)
+
+
+def is_ok(r):
+    return r["status"] in (200, 304) and r["error"] is None
+
+
+def _fmt(x, spec=".2f"):
+    return "-" if x is None else format(x, spec)
+
+
+def endpoint_table(recs):
+    by = defaultdict(list)
+    for r in recs:
+        by[(r["host"], r["endpoint"])].append(r)
+    print(f"\n{'host':<18} {'endpoint':<36} {'reqs':>7} {'cache':>6} {'p50 s':>7} "
+          f"{'p95 s':>7} {'shed':>6} {'403':>5} {'MB':>8}")
+    for (host, ep), rs in sorted(by.items()):
+        net = [r for r in rs if not r["cached"]]
+        lat = [r["latency"] for r in net if is_ok(r)]
+        shed = sum(map(is_shed, net)) / len(net) if net else 0.0
+        print(f"{host:<18} {ep[:36]:<36} {len(net):>7} {len(rs) - len(net):>6} "
+              f"{_fmt(pct(lat, 0.5)):>7} {_fmt(pct(lat, 0.95)):>7} {shed:>6.1%} "
+              f"{sum(r['status'] == 403 for r in net):>5} "
+              f"{sum(r['bytes'] for r in rs) / 1e6:>8.1f}")
+
+
+def time_table(recs, bucket_min):
+    """-> the newest bucket's stats per host, for the warnings."""
+    width = bucket_min * 60
+    by = defaultdict(lambda: defaultdict(list))
+    for r in recs:
+        if not r["cached"]:
+            by[r["host"]][int(r["ts"] // width)].append(r)
+    newest = {}
+    for host, buckets in sorted(by.items()):
+        print(f"\n{host}  ({bucket_min}-minute buckets)")
+        print(f"  {'start':<17} {'reqs':>6} {'shed':>6} {'403':>5} {'p95 s':>7} "
+              f"{'splits/min':>10}")
+        for b in sorted(buckets):
+            rs = buckets[b]
+            shed = sum(map(is_shed, rs)) / len(rs)
+            lat = [r["latency"] for r in rs if is_ok(r)]
+            splits = sum(1 for r in rs if r["endpoint"] == SPLITS_ENDPOINT and is_ok(r))
+            start = time.strftime("%Y-%m-%d %H:%M", time.localtime(b * width))
+            print(f"  {start:<17} {len(rs):>6} {shed:>6.1%} "
+                  f"{sum(r['status'] == 403 for r in rs):>5} "
+                  f"{_fmt(pct(lat, 0.95)):>7} {splits / bucket_min:>10.1f}")
+        last = buckets[max(buckets)]
+        newest[host] = {"shed": sum(map(is_shed, last)) / len(last),
+                        "forbidden": sum(r["status"] == 403 for r in last)}
+    return newest
+
+
+def cell_table(recs):
+    by = defaultdict(lambda: [0, 0, 0])
+    for r in recs:
+        if r["cell"] and not r["cached"]:
+            c = by[(r["host"], r["cell"])]
+            c[0] += 1
+            c[1] += r["bytes"]
+            c[2] += is_ok(r)
+    print(f"\n{'host':<18} {'cell':<40} {'reqs':>7} {'ok':>7} {'MB':>8}")
+    for (host, cell), (n, b, ok) in sorted(by.items()):
+        print(f"{host:<18} {cell[:40]:<40} {n:>7} {ok:>7} {b / 1e6:>8.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dir", default=str(http_pool.TELEMETRY_DIR))
+    ap.add_argument("--since", type=float, help="only the last N hours")
+    ap.add_argument("--bucket", type=int, default=10, help="minutes per time bucket")
+    ap.add_argument("--host", help="only this host")
+    ap.add_argument("--no-cells", action="store_true", help="skip the per-cell table")
+    args = ap.parse_args()
+
+    recs = load(http_pool.Telemetry(args.dir), args.since, args.host)
+    if not recs:
+        raise SystemExit(f"no telemetry in {args.dir}")
+    span = (recs[-1]["ts"] - recs[0]["ts"]) / 3600
+    print(f"{len(recs)} records over {span:.1f}h")
+    endpoint_table(recs)
+    newest = time_table(recs, args.bucket)
+    if not args.no_cells:
+        cell_table(recs)
+
+    for host, s in newest.items():
+        if s["forbidden"]:
+            print(f"\nWARNING {host}: {s['forbidden']} x 403 in the newest bucket -- "
+                  f"the signature of an IP block. Stop and wait it out.")
+        elif s["shed"] >= SHED_WARN:
+            print(f"\nWARNING {host}: {s['shed']:.0%} shed in the newest bucket -- "
+                  f"back off before it turns into a block.")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,12 +9,22 @@ Replaces wowy_scrape.py. Three things changed:
    resolves to some retired player. scrape_pbp_totals.py already wrote the exact
    EntityId for every player in the cell, so this reads it from the roster file.
 
-2. Concurrency 2, not 50. wowy_scrape.py used asyncio.Semaphore(50); measured, that
-   turns into ~90% 503s. See pbpstats_client for the numbers.
+2. Bounded, adaptive concurrency, not 50. wowy_scrape.py used asyncio.Semaphore(50);
+   measured, that turns into ~90% 503s. pbpstats_client's controller now sets the
+   real in-flight count; see it for the numbers.
 
 3. Resumable by inspecting Mongo, not a processed_files log. wowy_scrape.py marked a
    file done only once every player in it had succeeded, so an interrupted run redid
-   the whole file.
+   the whole file. On top of that, every split is journaled (job_journal.py) and one
+   worker pool drains all cells' splits together: a crash or IP block resumes at the
+   exact split, failures are retried with backoff, and no worker waits at a cell
+   boundary. --per-cell keeps the old one-cell-at-a-time loop.
+
+--team-batch fetches each team's totals once and makes each player one job: his on
+split is fetched and his off split derived from that same response as team minus on
+(wowy_derive.py), so a cell costs about half the requests. The few rate fields with
+no derivable base are absent from those documents, which carry off_derived=True;
+--validate N also fetches N players' off splits a cell directly and compares.
 
 A traded player has a separate on/off split per team -- the question "how did the
 team do without him" only means something relative to one team. The collection
@@ -23,21 +33,31 @@ uses the player's largest stint and records team and n_stints on the document.
 
 Run:  python scraping/scrape_wowy.py
       python scraping/scrape_wowy.py --seasons 2025-26 --limit 20
+      python scraping/scrape_wowy.py --seasons 2025-26 --team-batch --validate 5
 """
 
 import argparse
 import json
+import threading
 import time
+from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import job_journal
 import mongo_sink
 import nba_teams
 import season_dates
-from pbpstats_client import get_json, stats
+import wowy_derive
+from pbpstats_client import MAX_INFLIGHT, Blocked, get_json, stats
 from scrape_pbp_totals import ROSTER_DIR
 
 SOURCE = "wowy"
-CONCURRENCY = 3
+# Threads available to the client's controller; it decides how many are in flight.
+CONCURRENCY = MAX_INFLIGHT
+# --team-batch: players per cell whose off split is both derived and fetched, as a
+# check on wowy_derive against what pbpstats actually returns. Each is an extra
+# sequential request, so it is opt-in.
+VALIDATE_SAMPLE = 0
 
 
 def load_roster(cell):
@@ -48,19 +68,84 @@ def load_roster(cell):
     return json.loads(path.read_text())
 
 
+def _wowy_params(cell, team_id, wowy_type):
+    return {"Season": cell["season"], "SeasonType": cell["api_type"],
+            "Type": wowy_type,
+            "FromDate": cell["from"], "ToDate": cell["to"], "TeamId": team_id}
+
+
+_team_totals = {}
+_team_locks = defaultdict(threading.Lock)
+
+
+def fetch_team_total(cell, team_id, wowy_type="Team"):
+    """The team's whole-range wowy row, fetched once per process per team and cell."""
+    key = (cell["timestamp"], cell["season_type"], team_id, wowy_type)
+    with _team_locks[key]:
+        if key not in _team_totals:
+            _team_totals[key] = get_json(
+                "get-wowy-stats/nba", _wowy_params(cell, team_id, wowy_type)
+            ).get("single_row_table_data") or {}
+    return _team_totals[key]
+
+
 def fetch_split(cell, entity_id, team_id, on, wowy_type="Team"):
     # Type=Team -> the team's own stats with the player on/off the floor.
     # Type=Opponent -> the OPPONENT's stats over those same possessions: opponent rim
     # accuracy, opponent 3P%, full shot-location splits -- the on-court defensive
     # profile that Team-side wowy cannot see.
-    params = {"Season": cell["season"], "SeasonType": cell["api_type"],
-              "Type": wowy_type,
-              "FromDate": cell["from"], "ToDate": cell["to"], "TeamId": team_id}
+    params = _wowy_params(cell, team_id, wowy_type)
     # 0Exactly1OnFloor -> team possessions with him on; 0Exactly0OnFloor -> without.
     params["0Exactly1OnFloor" if on else "0Exactly0OnFloor"] = entity_id
     return get_json("get-wowy-stats/nba", params).get("single_row_table_data") or {}
 
 
+def fetch_pair(cell, entity_id, team_id, wowy_type="Team"):
+    """-> (on split, off split derived as team total - on from that same on split):
+    one player request instead of two."""
+    on_row = fetch_split(cell, entity_id, team_id, True, wowy_type)
+    team = fetch_team_total(cell, team_id, wowy_type)
+    return on_row, (wowy_derive.derive_off(team, on_row) if team and on_row else {})
+
+
+def fetch_job(cell, entity_id, team_id, on, wowy_type="Team"):
+    """One job -> [(on, row)]. on=None is a --team-batch job: both of the player's
+    splits from fetch_pair."""
+    if on is None:
+        return list(zip((True, False), fetch_pair(cell, entity_id, team_id, wowy_type)))
+    return [(on, fetch_split(cell, entity_id, team_id, on, wowy_type))]
+
+
+def side(on):
+    return "on+off" if on is None else "on" if on else "off"
+
+
+def validate_cell(cell, n, wowy_type="Team"):
+    """Derive and fetch the off split for the top n players; report disagreements.
+
+    -> {field: worst (derived, direct)} across the sample.
+    """
+    roster = load_roster(cell)
+    players = sorted(((eid, p) for eid, p in roster["players"].items() if p["stints"]),
+                     key=lambda kv: -(kv[1].get("minutes") or 0))[:n]
+    worst = {}
+    for eid, p in players:
+        team_id = p["stints"][0]["team_id"]
+        derived = fetch_pair(cell, eid, team_id, wowy_type)[1]
+        direct = fetch_split(cell, eid, team_id, False, wowy_type)
+        for f, (x, d) in wowy_derive.compare(derived, direct).items():
+            err = abs((x or 0) - d)
+            if f not in worst or err > abs((worst[f][0] or 0) - worst[f][1]):
+                worst[f] = (x, d)
+    missing = sorted(f for f, (x, _) in worst.items() if x is None)
+    wrong = {f: v for f, v in worst.items() if v[0] is not None}
+    print(f"    validate {len(players)} derived off splits: "
+          f"{len(missing)} field(s) not derivable, {len(wrong)} disagreeing")
+    for f, (x, d) in sorted(wrong.items())[:20]:
+        print(f"      {f}: derived {x} vs fetched {d}")
+    return worst
+
+
 def build_doc(row, cell, player, entity_id, team_id, n_stints, on, source=SOURCE):
     return dict(row, **{
         "name": player["name"],
@@ -74,8 +159,9 @@ def build_doc(row, cell, player, entity_id, team_id, n_stints, on, source=SOURCE
     })
 
 
-def scrape_cell(coll, cell, limit=None, dry_run=False, force=False,
-                source=SOURCE, wowy_type="Team"):
+def cell_jobs(coll, cell, limit=None, force=False, source=SOURCE, derive=False):
+    """-> (n_players, [(entity_id, player, team_id, on)]) still to fetch for a cell.
+    With derive, a player missing either split is one job with on=None."""
     roster = load_roster(cell)
     players = list(roster["players"].items())
     players.sort(key=lambda kv: -(kv[1].get("minutes") or 0))
@@ -93,14 +179,22 @@ def scrape_cell(coll, cell, limit=None, dry_run=False, force=False,
         if not p["stints"]:
             continue
         team_id = p["stints"][0]["team_id"]
-        for on in (True, False):
-            if (p["name"], "on" if on else "off") in done:
-                continue
-            jobs.append((eid, p, team_id, on))
-
-    skipped = len(players) * 2 - len(jobs)
-    print(f"  {cell['season']} {cell['season_type']:<15} {len(players)} players, "
-          f"{len(jobs)} splits to fetch ({skipped} already stored or unplayed)")
+        missing = [on for on in (True, False)
+                   if (p["name"], "on" if on else "off") not in done]
+        if derive and missing:
+            jobs.append((eid, p, team_id, None))
+        else:
+            jobs.extend((eid, p, team_id, on) for on in missing)
+    return len(players), jobs
+
+
+def scrape_cell(coll, cell, limit=None, dry_run=False, force=False,
+                source=SOURCE, wowy_type="Team", derive=False):
+    n_players, jobs = cell_jobs(coll, cell, limit, force, source, derive)
+    n_splits = sum(2 if on is None else 1 for *_, on in jobs)
+    print(f"  {cell['season']} {cell['season_type']:<15} {n_players} players, "
+          f"{n_splits} splits to fetch in {len(jobs)} jobs "
+          f"({n_players * 2 - n_splits} already stored or unplayed)")
     if not jobs:
         return
 
@@ -118,7 +212,7 @@ def scrape_cell(coll, cell, limit=None, dry_run=False, force=False,
         """
         eid, p, team_id, on = job
         try:
-            return job, fetch_split(cell, eid, team_id, on, wowy_type), None
+            return job, fetch_job(cell, eid, team_id, on, wowy_type), None
         except Exception as e:
             return job, None, f"{type(e).__name__}: {e}"
 
@@ -131,15 +225,17 @@ def scrape_cell(coll, cell, limit=None, dry_run=False, force=False,
     with ThreadPoolExecutor(max_workers=CONCURRENCY) as ex:
         futures = [ex.submit(work, j) for j in jobs]
         for i, fut in enumerate(as_completed(futures), 1):
-            job, row, err = fut.result()
+            job, rows, err = fut.result()
             eid, p, team_id, on = job
             if err:
-                failed.append((p["name"], "on" if on else "off", err))
-            elif not row:
-                empty += 1
-            else:
+                failed.append((p["name"], side(on), err))
+                rows = []
+            for split_on, row in rows:
+                if not row:
+                    empty += 1
+                    continue
                 docs.append(build_doc(row, cell, p, eid, team_id,
-                                      len(p["stints"]), on, source=source))
+                                      len(p["stints"]), split_on, source=source))
             # Flush often. Everything already written is work a resumed run skips.
             if len(docs) >= 25:
                 mongo_sink.write_rows(coll, docs, source, dry_run)
@@ -159,6 +255,79 @@ def scrape_cell(coll, cell, limit=None, dry_run=False, force=False,
         print(f"      ... and {len(failed)-10} more; re-run to retry them")
 
 
+def enqueue(journal, coll, cells, limit=None, force=False, source=SOURCE,
+            derive=False):
+    """Journal every split still to fetch in cells. -> the keys of those jobs."""
+    keys = []
+    for cell in cells:
+        try:
+            n_players, jobs = cell_jobs(coll, cell, limit, force, source, derive)
+        except SystemExit as e:
+            print(f"  SKIPPED {cell['season']} {cell['season_type']}: {e}")
+            continue
+        n = 0
+        for eid, p, team_id, on in jobs:
+            key = (source, cell["timestamp"], cell["season_type"], p["name"],
+                   side(on))
+            keys.append(key)
+            # Journaled as done yet not stored: the row was purged since, unless
+            # the split was empty and nothing was ever stored for it.
+            reset = force or (journal.state.get(key) == job_journal.DONE
+                              and not journal.info.get(key, {}).get("empty"))
+            n += journal.add(key, {"cell": cell, "eid": eid, "player": p,
+                                   "team_id": team_id, "on": on}, reset=reset)
+        print(f"  {cell['season']} {cell['season_type']:<15} {n_players} players, "
+              f"{len(jobs)} jobs to run, {n} newly journaled")
+    return keys
+
+
+def scrape_journaled(coll, cells, journal, limit=None, force=False,
+                     source=SOURCE, wowy_type="Team", derive=False):
+    """Every cell's splits through one journal and one worker pool; see job_journal."""
+    # Only this run's cells: the journal also holds other seasons' leftovers.
+    keys = enqueue(journal, coll, cells, limit, force, source, derive)
+    todo = journal.runnable(keys)
+    print(f"  journal {journal.path.name}: {journal.counts()}; {len(todo)} to run")
+    if not todo:
+        return
+    t0 = time.time()
+
+    def work(job):
+        # Only the non-empty splits: a job with none is journaled as empty.
+        return [(on, row) for on, row in fetch_job(
+            job["cell"], job["eid"], job["team_id"], job["on"], wowy_type) if row]
+
+    def store(results):
+        docs = []
+        for key, rows in results:
+            job = journal.payload[key]
+            for on, row in rows:
+                docs.append(build_doc(row, job["cell"], job["player"], job["eid"],
+                                      job["team_id"], len(job["player"]["stints"]),
+                                      on, source=source))
+        mongo_sink.write_rows(coll, docs, source)
+
+    def progress(i, n, failed):
+        if i % 50 == 0:
+            rate = i / max(time.time() - t0, 1e-9)
+            print(f"    {i}/{n} splits  {rate:.2f}/s  "
+                  f"eta {(n - i) / max(rate, 1e-9) / 60:.0f}m  failed={failed}",
+                  flush=True)
+
+    blocked = job_journal.drain(journal, work, store, CONCURRENCY,
+                                stop_on=(Blocked,), progress=progress, keys=todo)
+    print(f"    done in {(time.time() - t0) / 60:.1f}m; journal {journal.counts()}")
+    if blocked is not None:
+        print(f"    STOPPED: {blocked}\n    Everything not yet fetched is still "
+              f"pending in {journal.path}; re-run once the block lifts.")
+    failed = [(k, journal.info[k].get("e")) for k in todo
+              if journal.state[k] == job_journal.FAILED]
+    for k, err in failed[:10]:
+        print(f"      FAILED {' '.join(k[1:])}: {err}")
+    if len(failed) > 10:
+        print(f"      ... and {len(failed) - 10} more; the next run retries them")
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--seasons", nargs="*", default=list(season_dates.SNAPSHOTS))
@@ -170,6 +339,16 @@ def main():
                     help="scrape opponent stats (Type=Opponent) -> source wowy-opp")
     ap.add_argument("--rs-only", action="store_true",
                     help="regular-season cells only")
+    ap.add_argument("--journal", help="job journal file (default: "
+                                      "scraping/journal/<source>.jsonl)")
+    ap.add_argument("--per-cell", action="store_true",
+                    help="no journal: one cell at a time, failures only printed")
+    ap.add_argument("--team-batch", action="store_true",
+                    help="derive off splits as team total - on (wowy_derive.py): "
+                         "one request per team instead of one per player")
+    ap.add_argument("--validate", type=int, default=VALIDATE_SAMPLE, metavar="N",
+                    help="with --team-batch, also fetch N players' off splits per "
+                         "cell directly and compare (default: none)")
     args = ap.parse_args()
 
     coll = (mongo_sink.RawSink(args.raw_dir) if args.raw_dir
@@ -178,15 +357,30 @@ def main():
     wowy_type = "Opponent" if args.opponent else "Team"
     print(f"[{source}] {len(args.seasons)} season(s): {', '.join(args.seasons)}"
           + ("  [regular season only]" if args.rs_only else ""))
-    for cell in season_dates.cells(tuple(args.seasons)):
-        if args.rs_only and cell["season_type"] != "Regular season":
-            continue
+    cells = [c for c in season_dates.cells(tuple(args.seasons))
+             if not args.rs_only or c["season_type"] == "Regular season"]
+    if args.team_batch and args.validate:
+        for cell in cells:
+            try:
+                print(f"  {cell['season']} {cell['season_type']}")
+                validate_cell(cell, args.validate, wowy_type)
+            except SystemExit as e:
+                print(f"  SKIPPED {cell['season']} {cell['season_type']}: {e}")
+    # A dry run stores nothing, so it must not journal anything as done.
+    if not (args.per_cell or args.dry_run):
+        journal = job_journal.Journal(
+            args.journal or job_journal.JOURNAL_DIR / f"{source}.jsonl")
+        scrape_journaled(coll, cells, journal, args.limit, args.force,
+                         source=source, wowy_type=wowy_type, derive=args.team_batch)
+        print(f"[{source}] done. http: {stats()}")
+        return
+    for cell in cells:
         # One cell's failure (missing roster, hard API error) must not abandon the
         # rest of a multi-season run -- a missing 2018-19 roster once killed a
         # 13-season scrape eight cells early.
         try:
             scrape_cell(coll, cell, args.limit, args.dry_run, args.force,
-                        source=source, wowy_type=wowy_type)
+                        source=source, wowy_type=wowy_type, derive=args.team_batch)
         except SystemExit as e:
             print(f"  SKIPPED {cell['season']} {cell['season_type']}: {e}")
         except Exception as e:
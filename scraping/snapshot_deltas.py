@@ -0,0 +1,272 @@
+"""In-season snapshot cells from per-window deltas instead of season-to-date refetches.
+
+defend_snapshots.json lists snapshot cells that all start on opening night and end
+on successive dates, and `--snapshots` fetched each one from scratch: the Nth
+snapshot re-downloads everything the first N-1 already covered, so transfer grows
+with the square of the number of snapshots. The tables are Totals, so the date
+ranges between consecutive snapshot ends
+
+    [from, to_1]  [to_1 + 1, to_2]  ...  [to_(n-1) + 1, to_n]
+
+are disjoint. Each window is fetched once and kept under WINDOW_DIR, and snapshot k
+is rebuilt by combining windows 1..k per player:
+
+  counts        GP, FGM/FGA and friends, touches, minutes -- summed
+  percentages   recomputed from the summed makes and attempts (D_FG_PCT, FG3_PCT,
+                EFG_PCT, LT_06_PCT ...), not averaged; 0.0 on no attempts, as the
+                API reports it
+  weighted      NORMAL_FG_PCT / NS_*_PCT (the shooter's usual percentage on the
+                shots faced) weighted by attempts; per-touch rates by touches;
+                0.0 with no weight, like the percentages
+  differences   PCT_PLUSMINUS, PLUSMINUS -- recomputed from the two sides
+  frequencies   FREQ, FGA_FREQUENCY ... are num / an unreported total; each window's
+                total is num / freq, summed. A window with num = 0 implies nothing
+                about its total, so these are a close approximation rather than
+                exact, and every row names them in an APPROX_COL column.
+  identity      team, position, age -- taken from the latest window
+
+A column with no rule raises DeltaError, and the scraper falls back to a plain
+season-to-date fetch for that table rather than store a guess. A window whose end
+is today or later is never written to disk, since its games are still being added.
+Cells run in parallel (--cells) share windows; a window is fetched by whichever gets
+there first and read from disk by the rest.
+
+Run:  python scraping/scrape_defend.py --snapshots --incremental
+      python scraping/scrape_shotdash.py --snapshots --incremental
+"""
+
+import datetime
+import json
+import re
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+WINDOW_DIR = Path(__file__).resolve().parent / "snapshot_windows"
+
+ID_COLS = ("CLOSE_DEF_PERSON_ID", "PLAYER_ID")
+IDENTITY = {"CLOSE_DEF_PERSON_ID", "PLAYER_ID", "PLAYER_NAME", "PLAYER_LAST_TEAM_ID",
+            "PLAYER_LAST_TEAM_ABBREVIATION", "PLAYER_POSITION", "AGE", "TEAM_ID",
+            "TEAM_ABBREVIATION"}
+
+# Makes and attempts: D_FGM, FG2A, FGM_LT_06, FGA_GT_15, ...
+SHOT_COUNT_RE = re.compile(r"^(D_)?FG[23]?[MA](_(LT|GT)_\d\d)?$")
+SUMS = {"GP", "G", "W", "L", "MIN", "POINTS", "TOUCHES", "FRONT_CT_TOUCHES",
+        "TIME_OF_POSS", "ELBOW_TOUCHES", "POST_TOUCHES", "PAINT_TOUCHES"}
+
+# pct -> ([(numerator column, coefficient)], denominator column)
+RATIOS = {
+    "D_FG_PCT": ([("D_FGM", 1.0)], "D_FGA"),
+    "FG_PCT": ([("FGM", 1.0)], "FGA"),
+    "FG2_PCT": ([("FG2M", 1.0)], "FG2A"),
+    "FG3_PCT": ([("FG3M", 1.0)], "FG3A"),
+    "EFG_PCT": ([("FGM", 1.0), ("FG3M", 0.5)], "FGA"),
+    "LT_06_PCT": ([("FGM_LT_06", 1.0)], "FGA_LT_06"),
+    "LT_10_PCT": ([("FGM_LT_10", 1.0)], "FGA_LT_10"),
+    "GT_15_PCT": ([("FGM_GT_15", 1.0)], "FGA_GT_15"),
+}
+# rate -> the column it is an average over
+WEIGHTED = {
+    "NORMAL_FG_PCT": "D_FGA",
+    "NS_FG2_PCT": "FG2A",
+    "NS_FG3_PCT": "FG3A",
+    "NS_LT_06_PCT": "FGA_LT_06",
+    "NS_LT_10_PCT": "FGA_LT_10",
+    "NS_GT_15_PCT": "FGA_GT_15",
+    "AVG_SEC_PER_TOUCH": "TOUCHES",
+    "AVG_DRIB_PER_TOUCH": "TOUCHES",
+    "PTS_PER_TOUCH": "TOUCHES",
+    "PTS_PER_ELBOW_TOUCH": "ELBOW_TOUCHES",
+    "PTS_PER_POST_TOUCH": "POST_TOUCHES",
+    "PTS_PER_PAINT_TOUCH": "PAINT_TOUCHES",
+}
+FREQUENCIES = {"FGA_FREQUENCY": "FGA", "FG2A_FREQUENCY": "FG2A",
+               "FG3A_FREQUENCY": "FG3A"}
+# defend's FREQ is the category's attempts over all the shots the player defended.
+ATTEMPT_COLS = ("D_FGA", "FG2A", "FG3A", "FGA_LT_06", "FGA_LT_10", "FGA_GT_15")
+# Added to a combined table that has frequency columns: the list of them, so the
+# stored documents say which values are estimates (coverage.ID_FIELDS skips it).
+APPROX_COL = "approx_fields"
+
+
+class DeltaError(ValueError):
+    """A table that cannot be rebuilt from its windows."""
+
+
+def rule(col, headers):
+    """How col combines across windows -> (kind, *args)."""
+    if col in IDENTITY:
+        return ("id",)
+    if col in SUMS or SHOT_COUNT_RE.match(col):
+        return ("sum",)
+    if col in RATIOS and all(c in headers for c, _ in RATIOS[col][0]) \
+            and RATIOS[col][1] in headers:
+        return ("ratio",) + RATIOS[col]
+    if col in WEIGHTED and WEIGHTED[col] in headers:
+        return ("wavg", WEIGHTED[col])
+    if col in FREQUENCIES and FREQUENCIES[col] in headers:
+        return ("freq", FREQUENCIES[col])
+    if col == "FREQ":
+        num = next((c for c in ATTEMPT_COLS if c in headers), None)
+        if num:
+            return ("freq", num)
+    if col == "PCT_PLUSMINUS" and {"D_FG_PCT", "NORMAL_FG_PCT"} <= set(headers):
+        return ("diff", "D_FG_PCT", "NORMAL_FG_PCT")
+    if col == "PLUSMINUS":
+        pair = next(((h, f"NS_{h}") for h in headers if f"NS_{h}" in headers), None)
+        if pair:
+            return ("diff",) + pair
+    raise DeltaError(f"no rule to combine column {col!r} across windows")
+
+
+def _num(v):
+    return v if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+
+
+def combine(tables):
+    """[(headers, rows)] for consecutive windows -> (headers, rows) season-to-date."""
+    tables = [(h, r) for h, r in tables if h]
+    if not tables:
+        return [], []
+    headers = tables[-1][0]
+    if any(h != headers for h, _ in tables):
+        raise DeltaError("window tables disagree on their columns")
+    id_i = next((headers.index(c) for c in ID_COLS if c in headers), None)
+    if id_i is None:
+        raise DeltaError("no player id column")
+    rules = [rule(c, headers) for c in headers]
+    col = {c: j for j, c in enumerate(headers)}
+
+    sums = defaultdict(lambda: defaultdict(float))   # pid -> column -> total
+    wsum = defaultdict(lambda: defaultdict(float))   # pid -> rate -> sum(rate*w)
+    wden = defaultdict(lambda: defaultdict(float))   # pid -> rate -> sum(w)
+    latest, order = {}, []
+    for _, rows in tables:
+        for row in rows:
+            pid = row[id_i]
+            if pid not in latest:
+                order.append(pid)
+            latest[pid] = row
+            s = sums[pid]
+            for j, (c, r) in enumerate(zip(headers, rules)):
+                v = _num(row[j])
+                if r[0] == "sum":
+                    s[c] += v or 0
+                elif r[0] == "wavg":
+                    w = _num(row[col[r[1]]]) or 0
+                    if v is not None and w:
+                        wsum[pid][c] += v * w
+                        wden[pid][c] += w
+                elif r[0] == "freq":
+                    n = _num(row[col[r[1]]]) or 0
+                    if v and n:
+                        wden[pid][c] += n / v
+
+    approx = [c for c, r in zip(headers, rules) if r[0] == "freq"]
+    out = []
+    for pid in order:
+        s, vals = sums[pid], {}
+        for j, (c, r) in enumerate(zip(headers, rules)):
+            if r[0] == "id":
+                vals[c] = latest[pid][j]
+            elif r[0] == "sum":
+                x = s[c]
+                vals[c] = int(x) if float(x).is_integer() else round(x, 2)
+            elif r[0] == "ratio":
+                den = s[r[2]]
+                vals[c] = (round(sum(s[n] * k for n, k in r[1]) / den, 3)
+                           if den else 0.0)
+            elif r[0] == "wavg":
+                d = wden[pid][c]
+                vals[c] = round(wsum[pid][c] / d, 3) if d else 0.0
+            elif r[0] == "freq":
+                d = wden[pid][c]
+                vals[c] = round(s[r[1]] / d, 3) if d else 0.0
+        # Differences read the recomputed sides, so they come last.
+        for c, r in zip(headers, rules):
+            if r[0] == "diff":
+                a, b = vals.get(r[1]), vals.get(r[2])
+                vals[c] = round(a - b, 3) if a is not None and b is not None else None
+        out.append([vals[c] for c in headers])
+    if approx:
+        headers = headers + [APPROX_COL]
+        out = [row + [list(approx)] for row in out]
+    return headers, out
+
+
+def _day_after(iso):
+    return (datetime.date.fromisoformat(iso) + datetime.timedelta(days=1)).isoformat()
+
+
+def windows(cell, snapshot_cells):
+    """-> [(from, to)] whose union is cell's date range, split at every snapshot end
+    in the same season and season type, so neighbouring snapshots share windows."""
+    ends = sorted({c["to"] for c in snapshot_cells
+                   if (c["season"], c["api_type"], c["from"])
+                   == (cell["season"], cell["api_type"], cell["from"])
+                   and c["to"] <= cell["to"]} | {cell["to"]})
+    out, start = [], cell["from"]
+    for end in ends:
+        out.append((start, end))
+        start = _day_after(end)
+    return out
+
+
+class WindowStore:
+    """fetch(cell, data_type) -> (headers, rows), served from per-window deltas.
+
+    fetch is the scraper's own season-to-date fetcher; it is called with the cell's
+    dates narrowed to one window, and directly for any table combine rejects.
+    """
+
+    def __init__(self, source, fetch, snapshot_cells, root=WINDOW_DIR):
+        self.source = source
+        self.fetch = fetch
+        self.snapshot_cells = snapshot_cells
+        self.root = Path(root)
+        self.fetched = self.reused = self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._path_locks = defaultdict(threading.Lock)
+
+    def path(self, cell, data_type, start, end):
+        group = f"{cell['season']}_{cell['api_type'].replace(' ', '_')}"
+        return self.root / self.source / group / f"{start}_{end}" / f"{data_type}.json"
+
+    def _count(self, what):
+        with self._lock:
+            setattr(self, what, getattr(self, what) + 1)
+
+    def window(self, cell, data_type, start, end):
+        p = self.path(cell, data_type, start, end)
+        with self._lock:
+            path_lock = self._path_locks[p]
+        with path_lock:
+            return self._window(cell, data_type, start, end, p)
+
+    def _window(self, cell, data_type, start, end, p):
+        if p.exists():
+            self._count("reused")
+            t = json.loads(p.read_text())
+            return t["headers"], t["rows"]
+        headers, rows = self.fetch(dict(cell, **{"from": start, "to": end}), data_type)
+        self._count("fetched")
+        if end < datetime.date.today().isoformat():
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"headers": headers, "rows": rows}))
+            tmp.replace(p)
+        return headers, rows
+
+    def __call__(self, cell, data_type):
+        tables = [self.window(cell, data_type, s, e)
+                  for s, e in windows(cell, self.snapshot_cells)]
+        try:
+            return combine(tables)
+        except DeltaError as e:
+            print(f"    {data_type}: {e}; fetching season-to-date instead")
+            self._count("fallbacks")
+            return self.fetch(cell, data_type)
+
+    def summary(self):
+        return (f"windows fetched={self.fetched} reused={self.reused} "
+                f"fallbacks={self.fallbacks}")
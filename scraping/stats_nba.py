@@ -0,0 +1,173 @@
+"""One stats.nba.com client shared by every scraper that talks to the site.
+
+scrape_nba_tracking, scrape_defend and scrape_shotdash each had their own get_json
+and paced themselves by sleeping DELAY seconds after every table, one table at a
+time. A league-wide table takes seconds to come back, so a cell cost (latency +
+DELAY) x tables, almost all of it waiting, and scrape_all's two stats.nba.com cells
+were two such loops that knew nothing of each other. Here:
+
+  * a TokenBucket paces every request the process sends the site: RATE a second
+    sustained, BURST at most in a row. That is the ceiling scrape_all's two cells
+    never went over -- one request per DELAY per cell -- and the site tolerated.
+  * at most MAX_INFLIGHT requests are open at once, whichever thread sends them.
+  * a failed attempt holds the whole bucket off for BACKOFF x attempt, not just the
+    thread that saw it, so a throttled burst is not answered with three more.
+  * cache hits (http_pool's response cache) cost no token, and two threads asking
+    for the same URL -- tracking's three rebounding tables are one request -- send
+    it once.
+
+fetch_tables() runs a cell's tables through a pool of TABLE_WORKERS threads and
+hands them back in the caller's order, so writes and output stay as they were; each
+scraper's --cells option runs that many cells at once through run_cells().
+"""
+
+import http.client
+import json
+import threading
+import time
+import urllib.error
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import http_pool
+
+HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"),
+    "Referer": "https://www.nba.com/",
+    "Origin": "https://www.nba.com",
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "x-nba-stats-origin": "stats",
+    "x-nba-stats-token": "true",
+    "Connection": "keep-alive",
+}
+
+MAX_ATTEMPTS = 6
+TIMEOUT = 90
+# Sustained requests per second and the most sent back to back. Two cells sleeping
+# 2.0 s after each table came to just under one request a second.
+RATE = 1.0
+BURST = 3
+# Requests open at once, across every thread and cell.
+MAX_INFLIGHT = 4
+# Seconds the bucket is held off per attempt number after a failure.
+BACKOFF = 2.0
+# Tables of one cell fetched at once.
+TABLE_WORKERS = 4
+# Cells in progress at once by default in each scraper's own main.
+CELL_WORKERS = 2
+
+TRANSIENT = (urllib.error.URLError, urllib.error.HTTPError, TimeoutError,
+             http.client.HTTPException, json.JSONDecodeError, OSError)
+
+
+class TokenBucket:
+    """rate tokens a second, up to burst banked; acquire() takes one."""
+
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._hold = 0.0            # monotonic time before which nothing is sent
+
+    def acquire(self):
+        """Block until a token is free and take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst,
+                                   self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if now >= self._hold and self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = max(self._hold - now, (1.0 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def hold(self, seconds):
+        """Send nothing for seconds, and start again with an empty bucket."""
+        with self._lock:
+            self._hold = max(self._hold, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class Client:
+    """Paced, bounded, retrying GETs against stats.nba.com."""
+
+    def __init__(self, rate=RATE, burst=BURST, inflight=MAX_INFLIGHT):
+        self.bucket = TokenBucket(rate, burst)
+        self._slots = threading.BoundedSemaphore(inflight)
+        self._lock = threading.Lock()
+        self._url_locks = defaultdict(threading.Lock)
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks[url]
+
+    def get_json(self, url):
+        with self._url_lock(url):
+            body = http_pool.cached(url)
+            if body is not None:
+                return body
+            last = None
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                self.bucket.acquire()
+                try:
+                    with self._slots:
+                        return http_pool.get_json(url, HEADERS, TIMEOUT,
+                                                  attempt=attempt)
+                except TRANSIENT as e:
+                    last = f"{type(e).__name__}: {e}"
+                    print(f"      attempt {attempt}/{MAX_ATTEMPTS} failed ({last})")
+                    self.bucket.hold(BACKOFF * attempt)
+        raise RuntimeError(
+            f"stats.nba.com unreachable after {MAX_ATTEMPTS} attempts ({last}). "
+            f"If every request does this, the IP is blocked -- run from a home "
+            f"connection.")
+
+
+client = Client()
+
+
+def get_json(url):
+    """GET url through the process-wide client -> parsed JSON."""
+    return client.get_json(url)
+
+
+def fetch_tables(fetch, cell, data_types, workers=TABLE_WORKERS):
+    """-> an iterator of (data_type, fetch(cell, data_type)) in data_types order,
+    fetched up to workers at a time. A fetch's exception is raised where its table
+    comes up, after the tables before it have been handed back."""
+    data_types = list(data_types)
+    ex = ThreadPoolExecutor(max_workers=max(1, min(workers, len(data_types))))
+    futures = [ex.submit(fetch, cell, dt) for dt in data_types]
+    try:
+        for dt, fut in zip(data_types, futures):
+            yield dt, fut.result()
+    finally:
+        for fut in futures:
+            fut.cancel()
+        ex.shutdown(wait=True)
+
+
+def run_cells(cells, scrape, workers=CELL_WORKERS):
+    """scrape(cell) for every cell, workers at a time, reporting each one that
+    raises (SystemExit: skipped, anything else: failed) the way the scrapers'
+    serial loops did."""
+    def one(cell):
+        try:
+            scrape(cell)
+        except SystemExit as e:
+            print(f"  SKIPPED {cell['season']} {cell['season_type']}: {e}")
+        except Exception as e:
+            print(f"  FAILED {cell['season']} {cell['season_type']}: "
+                  f"{type(e).__name__}: {e}")
+    if workers <= 1:
+        for cell in cells:
+            one(cell)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(one, cells))
@@ -0,0 +1,63 @@
+"""Tests that the resume ledger covers rows stored before it existed.
+
+The Mongo tests need mongomock and are skipped without it; the RawSink ones don't.
+"""
+
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import mongo_sink
+from test_schema_registry import CELL, LEGACY, collection, mongomock, row
+
+TS, ST = CELL["timestamp"], CELL["season_type"]
+ALL = {(n, s) for n in ("ann", "bob", "cat") for s in ("On", "Off")}
+
+
+@unittest.skipUnless(mongomock, "needs mongomock")
+class LedgerTests(unittest.TestCase):
+    def setUp(self):
+        self.coll = collection()
+        self.coll.insert_many([dict(d) for d in LEGACY])
+
+    def test_first_write_seeds_from_stored_rows(self):
+        mongo_sink.write_rows(self.coll, [row("dan", "On", MIN=1)], "wowy")
+        self.assertEqual(mongo_sink.existing_keys(self.coll, "wowy", TS, ST),
+                         ALL | {("dan", "On")})
+
+    def test_seeded_ledger_grows(self):
+        self.assertEqual(mongo_sink.existing_keys(self.coll, "wowy", TS, ST), ALL)
+        mongo_sink.write_rows(self.coll, [row("dan", "Off", MIN=1)], "wowy")
+        self.assertEqual(
+            mongo_sink.existing_keys(self.coll, "wowy", TS, ST, {"on_or_off": "Off"}),
+            {("ann",), ("bob",), ("cat",), ("dan",)})
+
+
+class RawSinkTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sink = mongo_sink.RawSink(self.tmp.name, segmented=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_seeds_sidecar_of_legacy_file(self):
+        # A v1 file from before there were sidecars.
+        with self.sink.path("wowy", TS, ST).open("w", encoding="utf-8") as f:
+            for d in LEGACY:
+                f.write(json.dumps(d) + "\n")
+        self.sink.append([row("dan", "On", MIN=1)], "wowy")
+        self.assertEqual(self.sink.ledger("wowy", TS, ST), ALL | {("dan", "On")})
+
+    def test_append_to_new_file(self):
+        self.sink.append([row("dan", "On", MIN=1)], "wowy")
+        self.sink.append([row("dan", "Off", MIN=1)], "wowy")
+        self.assertEqual(self.sink.ledger("wowy", TS, ST), {("dan", "On"), ("dan", "Off")})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Tests that write_rows keeps a cell's field catalog equal to a recount of it.
+
+Needs mongomock; skipped without it.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+import mongo_sink
+import schema_registry as SR
+
+CELL = {"source": "wowy", "timestamp": "20250105000000", "season_type": "Regular season"}
+
+
+def row(name, side, **fields):
+    return dict(CELL, standard_name=name, on_or_off=side, **fields)
+
+
+# Written by the legacy collectors: no catalog, and a column the new feed dropped.
+LEGACY = [row(n, s, Name=n.title(), MIN=30.5, PTS="1,234", OLD_COL=1)
+          for n in ("ann", "bob", "cat") for s in ("On", "Off")]
+
+
+def collection():
+    """A mongomock collection. Its bulk_write predates ReplaceOne's sort argument
+    (pymongo 4.11), so the replaces are applied one at a time."""
+    coll = mongomock.MongoClient().db.nba_rapture
+
+    def bulk_write(ops, ordered=True):
+        res = [coll.replace_one(op._filter, op._doc, upsert=op._upsert) for op in ops]
+        return SimpleNamespace(
+            upserted_count=sum(r.upserted_id is not None for r in res),
+            modified_count=sum(r.modified_count for r in res),
+            matched_count=sum(r.matched_count for r in res))
+    coll.bulk_write = bulk_write
+    return coll
+
+
+@unittest.skipUnless(mongomock, "needs mongomock")
+class RegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.coll = collection()
+
+    def catalog(self):
+        return SR.catalog(self.coll, "wowy", CELL["timestamp"], CELL["season_type"])
+
+    def assert_matches_recount(self):
+        got = self.catalog()
+        SR.recount(self.coll, "wowy", CELL["timestamp"], CELL["season_type"])
+        self.assertEqual(got, self.catalog())
+
+    def test_write_over_uncatalogued_docs(self):
+        self.coll.insert_many([dict(d) for d in LEGACY])
+        mongo_sink.write_rows(self.coll, [row("ann", "On", Name="Ann", MIN=31.0, PTS="x"),
+                                          row("bob", "On", Name="Bob", MIN=12)], "wowy")
+        self.assertEqual(self.catalog()["On"]["rows"], 3)
+        self.assertEqual(self.catalog()["On"]["fields"]["OLD_COL"], (1, 1))
+        self.assert_matches_recount()
+
+    def test_writes_onto_a_catalog_fold_in_deltas(self):
+        self.coll.insert_many([dict(d) for d in LEGACY])
+        SR.recount(self.coll, "wowy", CELL["timestamp"], CELL["season_type"])
+        mongo_sink.write_rows(self.coll, [row("ann", "On", Name="Ann", MIN=31.0, PTS="x"),
+                                          row("dan", "On", Name="Dan", PTS="7%"),
+                                          row("dan", "On", Name="Dan", PTS="8%")],
+                              "wowy")
+        mongo_sink.write_rows(self.coll, [row("cat", "Off", Name="Cat", MIN=True)], "wowy")
+        cat = self.catalog()
+        self.assertEqual((cat["On"]["rows"], cat["Off"]["rows"]), (4, 3))
+        self.assertEqual(cat["On"]["fields"]["PTS"], (4, 3))
+        self.assert_matches_recount()
+
+    def test_replaced_reads_only_the_keys_written(self):
+        self.coll.insert_many([dict(d) for d in LEGACY])
+        old = SR.replaced(self.coll, [row("ann", "On"), row("zed", "On")], "wowy")
+        subs = old[(CELL["timestamp"], CELL["season_type"])]
+        self.assertEqual(list(subs), ["On"])
+        self.assertEqual(subs["On"][0], 1)
+        self.assertEqual(dict(subs["On"][1]),
+                         {"Name": [1, 0], "MIN": [1, 1], "PTS": [1, 1], "OLD_COL": [1, 1]})
+
+
+if __name__ == "__main__":
+    unittest.main()
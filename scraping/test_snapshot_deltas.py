@@ -0,0 +1,120 @@
+"""Tests for rebuilding season-to-date tables from per-window deltas.
+
+Each window below is a slice of one season-to-date table, and WANT is what the API
+returns for the whole range; combine() has to reproduce it.
+"""
+
+import datetime
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import snapshot_deltas as SD
+
+HEADERS = ["CLOSE_DEF_PERSON_ID", "PLAYER_NAME", "PLAYER_LAST_TEAM_ABBREVIATION",
+           "GP", "G", "FREQ", "D_FGM", "D_FGA", "D_FG_PCT", "NORMAL_FG_PCT",
+           "PCT_PLUSMINUS"]
+
+# Player 1 defended 10 of his 20 shots faced in window 1 and 5 of 20 in window 2.
+# Player 2 defended nothing in window 2, where the API reports 0.0 percentages.
+W1 = [[1, "A", "BOS", 3, 3, 0.5, 4, 10, 0.4, 0.45, -0.05]]
+W2 = [[1, "A", "NYK", 2, 2, 0.25, 3, 5, 0.6, 0.5, 0.1],
+      [2, "B", "LAL", 1, 1, 0.0, 0, 0, 0.0, 0.0, 0.0]]
+WANT = {1: [1, "A", "NYK", 5, 5, 0.375, 7, 15, 0.467, 0.467, 0.0],
+        2: [2, "B", "LAL", 1, 1, 0.0, 0, 0, 0.0, 0.0, 0.0]}
+
+
+def rows(table):
+    return {r[0]: r for r in table[1]}
+
+
+class CombineTests(unittest.TestCase):
+    def setUp(self):
+        self.headers, self.rows = SD.combine([(HEADERS, W1), (HEADERS, W2)])
+        self.got = {r[0]: r for r in self.rows}
+        self.col = {c: j for j, c in enumerate(self.headers)}
+
+    def value(self, pid, c):
+        return self.got[pid][self.col[c]]
+
+    def test_sums_and_identity(self):
+        for c in ("GP", "G", "D_FGM", "D_FGA", "PLAYER_LAST_TEAM_ABBREVIATION"):
+            self.assertEqual(self.value(1, c), WANT[1][HEADERS.index(c)], c)
+
+    def test_ratios_recomputed_from_totals(self):
+        for pid in (1, 2):
+            for c in ("D_FG_PCT", "NORMAL_FG_PCT", "PCT_PLUSMINUS"):
+                self.assertAlmostEqual(self.value(pid, c), WANT[pid][HEADERS.index(c)],
+                                       places=3, msg=(pid, c))
+
+    def test_no_attempts_is_zero_not_none(self):
+        _, out = SD.combine([(HEADERS, [W2[1]])])
+        self.assertEqual(out[0][HEADERS.index("D_FG_PCT")], 0.0)
+
+    def test_freq_exact_when_every_window_has_attempts(self):
+        self.assertAlmostEqual(self.value(1, "FREQ"), WANT[1][HEADERS.index("FREQ")])
+        self.assertEqual(self.value(2, "FREQ"), 0.0)
+
+    def test_freq_marked_approximate(self):
+        self.assertEqual(self.headers[:len(HEADERS)], HEADERS)
+        self.assertEqual(self.headers[-1], SD.APPROX_COL)
+        self.assertEqual(self.value(1, SD.APPROX_COL), ["FREQ"])
+        # A window with no attempts hides its total (12 shots faced), so the
+        # estimate is 6 / 12 where the API says 6 / 24.
+        w1 = [[3, "C", "MIA", 1, 1, 0.0, 0, 0, 0.0, 0.0, 0.0]]
+        w2 = [[3, "C", "MIA", 1, 1, 0.5, 3, 6, 0.5, 0.5, 0.0]]
+        _, out = SD.combine([(HEADERS, w1), (HEADERS, w2)])
+        self.assertEqual(out[0][HEADERS.index("FREQ")], 0.5)
+
+    def test_no_freq_columns_no_marker(self):
+        keep = [j for j, c in enumerate(HEADERS) if c != "FREQ"]
+        headers, _ = SD.combine([([HEADERS[j] for j in keep],
+                                  [[r[j] for j in keep] for r in W1])])
+        self.assertNotIn(SD.APPROX_COL, headers)
+
+    def test_unknown_column_raises(self):
+        with self.assertRaises(SD.DeltaError):
+            SD.combine([(HEADERS + ["MYSTERY"], [W1[0] + [1]])])
+
+
+class WindowStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = []
+        self.windows = {("2024-10-22", "2024-11-01"): W1,
+                        ("2024-11-02", "2024-11-15"): W2}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fetch(self, cell, data_type):
+        self.calls.append((cell["from"], cell["to"]))
+        return HEADERS, self.windows[(cell["from"], cell["to"])]
+
+    def test_snapshots_share_windows(self):
+        base = {"season": "2024-25", "api_type": "Regular Season", "from": "2024-10-22"}
+        cells = [dict(base, to="2024-11-01"), dict(base, to="2024-11-15")]
+        store = SD.WindowStore("nba-defend", self.fetch, cells, root=self.tmp.name)
+        first = store(cells[0], "overall")
+        both = store(cells[1], "overall")
+        self.assertEqual(self.calls, list(self.windows))
+        self.assertEqual((store.fetched, store.reused), (2, 1))
+        self.assertEqual(rows(first)[1][:len(HEADERS)], W1[0])
+        self.assertEqual(rows(both)[1][:len(HEADERS)], WANT[1])
+
+    def test_open_window_not_kept(self):
+        today = datetime.date.today().isoformat()
+        cell = {"season": "2024-25", "api_type": "Regular Season",
+                "from": today, "to": today}
+        self.windows = {(today, today): W1}
+        store = SD.WindowStore("nba-defend", self.fetch, [cell], root=self.tmp.name)
+        store(cell, "overall")
+        store(cell, "overall")
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,6 +22,7 @@ import unicodedata
 from collections import Counter, defaultdict
 
 import mongo_sink
+import schema_registry
 import season_dates
 
 TRACK_TYPES = ['catch-shoot', 'defensive-impact', 'defensive-rebounding', 'drives',
@@ -86,29 +87,25 @@ def cell_report(coll, ts, season_type):
 
 
 def field_report(coll, ts, season_type, compare_ts):
-    """New cell's fields vs an older cell's, per source."""
+    """New cell's fields vs an older cell's, per source, from the schema registry."""
     print(f"\n  fields vs {compare_ts}")
-    for source, extra in (("pbp", {}), ("wowy", {"on_or_off": "on"}),
-                          ("nba-tracking", {"data_type": "speed-distance"})):
-        def fields(t):
-            c = Counter()
-            n = 0
-            for d in coll.find({"source": source, "timestamp": t,
-                                "season_type": season_type, **extra}):
-                n += 1
-                c.update(k for k in d if k not in ID_FIELDS)
-            return n, c
-        n_new, f_new = fields(ts)
-        n_old, f_old = fields(compare_ts)
-        if not n_new or not n_old:
-            print(f"    {source:<14} skipped (new={n_new} docs, old={n_old} docs)")
+    for source, sub in (("pbp", None), ("wowy", "on"),
+                        ("nba-tracking", "speed-distance")):
+        new, old = (schema_registry.catalog(coll, source, t, season_type, sub)
+                    for t in (ts, compare_ts))
+        if not new["rows"] or not old["rows"]:
+            print(f"    {source:<14} skipped (new={new['rows']} docs, "
+                  f"old={old['rows']} docs)")
             continue
-        gone = sorted(k for k in f_old if k not in f_new)
-        added = sorted(k for k in f_new if k not in f_old)
-        print(f"    {source:<14} new={len(f_new)} fields / {n_new} docs, "
-              f"old={len(f_old)} / {n_old} docs")
+        for c in (new, old):
+            c["fields"] = {k: v for k, v in c["fields"].items() if k not in ID_FIELDS}
+        gone, added, turned = schema_registry.drift(old, new)
+        print(f"    {source:<14} new={len(new['fields'])} fields / {new['rows']} docs, "
+              f"old={len(old['fields'])} / {old['rows']} docs")
         if gone:
             print(f"      IN OLD, MISSING FROM NEW: {gone}")
+        if turned:
+            print(f"      NUMERIC IN OLD, TEXT IN NEW: {turned}")
         if added:
             print(f"      new only: {added}")
 
@@ -0,0 +1,155 @@
+"""A player's "off" wowy split from his team's totals and his "on" split.
+
+With a TeamId filter, every team possession has the player either on the floor or
+off it, so for any counting stat
+
+    off = team total - on
+
+and one team-total request per team per cell replaces one off request per player,
+which halves what a wowy cell costs pbpstats. Rates are not additive, but nearly all
+of them are means over a count that is: zone accuracy over that zone's attempts,
+frequency over all attempts, seconds per possession over possessions, pace over
+minutes. For those
+
+    off_rate = (team_rate * team_base - on_rate * on_base) / (team_base - on_base)
+
+is exact. RATE_BASES lists each rate's base, and IMPLIED_BASES the rebound
+percentages whose base follows from a count in the same row. A rate with no known
+base (the per-zone rebound percentages, whose chances are not in the row) is left
+out of a derived document rather than guessed, and the document is marked
+off_derived so it can always be told apart from a fetched one. compare() is what scrape_wowy's
+--validate sampling uses to check derived against fetched splits.
+"""
+
+import re
+
+# Anything matching this is a rate; everything else numeric is a count.
+RATE_RE = re.compile(r"Pct|Accuracy|Frequency|Avg|Pace|PerPoss")
+
+_Z = r"(?P<z>AtRim|ShortMidRange|LongMidRange|Corner3|Arc3|NonHeaveArc3)"
+_P = r"(?P<p>Penalty|SecondChance|)"
+
+
+def _fga(p):
+    return [(f"{p}FG2A", 1.0), (f"{p}FG3A", 1.0)]
+
+
+# (pattern, match -> [(base field, coefficient)]). First match wins.
+RATE_BASES = [
+    (rf"^Unblocked{_Z}Accuracy$", lambda m: [(f"{m['z']}FGA", 1.0),
+                                              (f"Blocked{m['z']}", -1.0)]),
+    (rf"^{_P}{_Z}Accuracy$", lambda m: [(f"{m['p']}{m['z']}FGA", 1.0)]),
+    (rf"^{_P}{_Z}Frequency$", lambda m: _fga(m["p"])),
+    (rf"^{_P}{_Z}PctAssisted$", lambda m: [(f"{m['p']}{m['z']}FGM", 1.0)]),
+    (rf"^{_Z}PctBlocked$", lambda m: [(f"{m['z']}FGA", 1.0)]),
+    (rf"^{_P}Fg2Pct$", lambda m: [(f"{m['p']}FG2A", 1.0)]),
+    (rf"^{_P}Fg3Pct$", lambda m: [(f"{m['p']}FG3A", 1.0)]),
+    (r"^NonHeaveFg3Pct$", lambda m: [("FG3A", 1.0), ("HeaveAttempts", -1.0)]),
+    (rf"^{_P}(EfgPct|ShotQualityAvg)$", lambda m: _fga(m["p"])),
+    (r"^TsPct$", lambda m: _fga("") + [("FTA", 0.44)]),
+    (r"^Assisted2sPct$", lambda m: [("FG2M", 1.0)]),
+    (r"^Assisted3sPct$", lambda m: [("FG3M", 1.0)]),
+    (r"^FG3APct$", lambda m: _fga("")),
+    (r"^FG2APctBlocked$", lambda m: [("FG2A", 1.0)]),
+    (r"^FG3APctBlocked$", lambda m: [("FG3A", 1.0)]),
+    (r"^Avg2ptShotDistance$", lambda m: [("FG2A", 1.0)]),
+    (r"^Avg3ptShotDistance$", lambda m: [("FG3A", 1.0)]),
+    (r"^SecondsPerPossOff$", lambda m: [("OffPoss", 1.0)]),
+    (r"^SecondsPerPossDef$", lambda m: [("DefPoss", 1.0)]),
+    (r"^Pace$", lambda m: [("Minutes", 1.0)]),
+    (r"^LiveBallTurnoverPct$", lambda m: [("Turnovers", 1.0)]),
+    (r"^BlocksRecoveredPct$", lambda m: [("Blocks", 1.0)]),
+    (r"^PenaltyOffPossPct$", lambda m: [("OffPoss", 1.0)]),
+    (r"^(PenaltyPointsPct|SecondChancePointsPct)$", lambda m: [("Points", 1.0)]),
+]
+_RATE_BASES = [(re.compile(p), f) for p, f in RATE_BASES]
+
+# Rebound percentages whose count is in the row but whose chances are not: each
+# row's chances are count / rate, which is additive like any other base.
+IMPLIED_BASES = {
+    "DefThreePtReboundPct": "DefThreePtRebounds",
+    "DefTwoPtReboundPct": "DefTwoPtRebounds",
+    "OffThreePtReboundPct": "OffThreePtRebounds",
+    "OffTwoPtReboundPct": "OffTwoPtRebounds",
+    "DefFTReboundPct": "FTDefRebounds",
+    "OffFTReboundPct": "FTOffRebounds",
+}
+
+
+def _num(v):
+    return v if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+
+
+def base_of(field):
+    """[(field, coef)] the rate is a mean over, or None if not known."""
+    for pat, f in _RATE_BASES:
+        m = pat.match(field)
+        if m:
+            return f(m)
+    return None
+
+
+def _base(row, terms):
+    vals = [_num(row.get(f)) for f, _ in terms]
+    if any(v is None for v in vals):
+        return None
+    return sum(v * k for v, (_, k) in zip(vals, terms))
+
+
+def _implied(row, f):
+    r, c = _num(row.get(f)), _num(row.get(IMPLIED_BASES[f]))
+    if c is None or r is None:
+        return None
+    return c / r if r else (0.0 if not c else None)
+
+
+def underivable(row):
+    """Rate fields in row that derive_off has to leave out."""
+    return sorted(f for f, v in row.items()
+                  if _num(v) is not None and RATE_RE.search(f)
+                  and base_of(f) is None and f not in IMPLIED_BASES)
+
+
+def derive_off(team_row, on_row):
+    """-> the off split, from the team's totals and the player's on split."""
+    out = {}
+    for f, tv in team_row.items():
+        t = _num(tv)
+        if t is None:
+            out[f] = tv                     # labels, not stats
+            continue
+        o = _num(on_row.get(f)) or 0
+        if not RATE_RE.search(f):
+            x = t - o
+            out[f] = x if isinstance(x, int) else round(x, 6)
+            continue
+        if f in IMPLIED_BASES:
+            tb, ob = _implied(team_row, f), _implied(on_row, f) or 0
+        else:
+            terms = base_of(f)
+            if terms is None:
+                continue
+            tb, ob = _base(team_row, terms), _base(on_row, terms) or 0
+        if tb is None:
+            continue
+        off_b = tb - ob
+        if off_b > 1e-9:
+            out[f] = round((t * tb - o * ob) / off_b, 6)
+    out["off_derived"] = True
+    return out
+
+
+def compare(derived, direct, tol=0.01):
+    """-> {field: (derived, direct)} for fields that disagree by more than tol
+    (relative, or absolute below 1), plus fields only the direct split has."""
+    bad = {}
+    for f, dv in direct.items():
+        d = _num(dv)
+        if d is None:
+            continue
+        x = _num(derived.get(f))
+        if x is None:
+            bad[f] = (None, d)
+        elif abs(x - d) > tol * max(1.0, abs(d)):
+            bad[f] = (x, d)
+    return bad
@@ -15,6 +15,7 @@ Run:  python training/build_dataset.py --modern-stride 6
 import argparse
 import json
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import numpy as np
@@ -23,8 +24,9 @@ import sys
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 import utils
 
-from coverage import ID_FIELDS, TRACK_TYPES, as_float, pick_doc
+from coverage import ID_FIELDS, TRACK_TYPES, as_float, docs_to_matrix, fetch_blocks
 from db import REPO_ROOT, get_collection
+from feature_store import FeatureStore
 from labels import SEASON_WIDE, aligned_timestamps, labels_for
 from seasons import FULL_SEASON_SNAPSHOTS, is_test, season_of, season_progress
 
@@ -115,8 +117,12 @@ def select_timestamps(ts_by_src, model, modern_stride, aligned):
     return hist + thinned
 
 
-def fetch_cell(coll, ts, season_type, blocks, fields):
-    """-> {player: {block: doc}} for the players 538 rates in this cell, plus label docs."""
+def fetch_cell(coll, ts, season_type, blocks, fields, store=None):
+    """-> {player: {block: doc}} for the players 538 rates in this cell, plus label docs.
+
+    With a feature_store.FeatureStore the feature blocks come from its local files;
+    labels are still resolved against coll.
+    """
     # Not "every 538 document at this timestamp" -- see labels.py. A capture often
     # shows a different season than the stats were scraped for, and 174 of them show
     # two seasons at once.
@@ -124,66 +130,117 @@ def fetch_cell(coll, ts, season_type, blocks, fields):
     if not labels:
         return {}, {}
 
-    picked = defaultdict(dict)
-    for block, q in blocks.items():
-        grp = defaultdict(list)
-        for d in coll.find({"timestamp": ts, "season_type": season_type, **q}):
-            if d["standard_name"] in labels:
-                grp[d["standard_name"]].append(d)
-        for name, docs in grp.items():
-            picked[name][block] = pick_doc(docs)
-    return labels, picked
+    if store is not None:
+        return labels, store.fetch_blocks(ts, season_type, blocks, players=labels,
+                                          fields=fields)
+    return labels, fetch_blocks(coll, ts, season_type, blocks, players=labels,
+                                fields=fields)
+
 
+def build_cell(model, coll, ts, st, fields, min_blocks_frac=0.8, store=None):
+    """One cell's rows. -> (n_538, X, y, y_off, y_def, meta, n_skipped_no_block)
 
-def build(model, coll, report, timestamps, min_blocks_frac=0.8):
+    Rows are filtered first, then each block's columns are converted in one
+    docs_to_matrix pass into a preallocated float32 matrix.
+    """
     blocks = BLOCKS[model]
     required = REQUIRED_BLOCKS[model]
+    n_feat = sum(len(v) for v in fields.values())
+    labels, picked = fetch_cell(coll, ts, st, blocks, fields, store)
+    kept, ys, ys_off, ys_def, meta = [], [], [], [], []
+    skipped_no_block = 0
+    for player, lab in labels.items():
+        got = picked.get(player, {})
+        if (any(b not in got for b in required)
+                or len(got) < len(blocks) * min_blocks_frac):
+            skipped_no_block += 1
+            continue
+        y = as_float(lab.get(LABELS[model]))
+        y_off = as_float(lab.get(LABELS_OFF[model]))
+        y_def = as_float(lab.get(LABELS_DEF[model]))
+        # require all three so every target sees the same rows
+        if y is None or y_off is None or y_def is None:
+            continue
+        kept.append(got)
+        ys.append(y)
+        ys_off.append(y_off)
+        ys_def.append(y_def)
+        meta.append({"player": player, "timestamp": ts, "season": season_of(ts),
+                     "season_type": st, "mp": as_float(lab.get("mp")) or 0.0,
+                     "pos": lab.get("pos", ""), "test": is_test(ts)})
+    X = np.full((len(kept), n_feat), np.nan, dtype=np.float32)
+    j = 0
+    for b in blocks:
+        docs_to_matrix([got.get(b) for got in kept], fields[b],
+                       out=X[:, j:j + len(fields[b])])
+        j += len(fields[b])
+    return (len(labels), X, np.asarray(ys, dtype=np.float32),
+            np.asarray(ys_off, dtype=np.float32), np.asarray(ys_def, dtype=np.float32),
+            meta, skipped_no_block)
+
+
+# Per-process state for --workers: each worker opens its own Mongo client (a
+# MongoClient must not cross a fork) and its own feature store.
+_worker = {}
+
+
+def _init_worker(store_dir):
+    _worker["coll"] = get_collection()
+    _worker["store"] = FeatureStore(store_dir) if store_dir else None
+
+
+def _build_cell_in_worker(task):
+    model, ts, st, fields, min_blocks_frac = task
+    return build_cell(model, _worker["coll"], ts, st, fields, min_blocks_frac,
+                      _worker["store"])
+
+
+def build(model, coll, report, timestamps, min_blocks_frac=0.8, store=None,
+          workers=1):
+    """Rows for every cell, in timestamp then SEASON_TYPES order.
+
+    workers > 1 shards cells across a process pool. Results are collected in
+    submission order, so the arrays match a serial build exactly.
+    """
+    blocks = BLOCKS[model]
     fields = {b: usable_fields(report, b) for b in blocks}
     n_feat = sum(len(v) for v in fields.values())
     print(f"[{model}] {len(blocks)} blocks, {n_feat} raw stat fields")
 
-    rows, ys, ys_off, ys_def, meta = [], [], [], [], []
+    cells = [(ts, st) for ts in timestamps for st in SEASON_TYPES]
+    if workers > 1:
+        tasks = [(model, ts, st, fields, min_blocks_frac) for ts, st in cells]
+        ex = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(str(store.root) if store else None,))
+        results = ex.map(_build_cell_in_worker, tasks)
+    else:
+        ex = None
+        results = (build_cell(model, coll, ts, st, fields, min_blocks_frac, store)
+                   for ts, st in cells)
+
+    Xs, ys, ys_off, ys_def, meta = [], [], [], [], []
     skipped_no_block = 0
-    for i, ts in enumerate(timestamps):
-        for st in SEASON_TYPES:
-            labels, picked = fetch_cell(coll, ts, st, blocks, fields)
-            if not labels:
+    try:
+        for k, ((ts, st), res) in enumerate(zip(cells, results)):
+            n538, Xc, yc, yc_off, yc_def, mc, skipped = res
+            skipped_no_block += skipped
+            if not n538:
                 continue
-            n_before = len(rows)
-            for player, lab in labels.items():
-                got = picked.get(player, {})
-                if (any(b not in got for b in required)
-                        or len(got) < len(blocks) * min_blocks_frac):
-                    skipped_no_block += 1
-                    continue
-                y = as_float(lab.get(LABELS[model]))
-                y_off = as_float(lab.get(LABELS_OFF[model]))
-                y_def = as_float(lab.get(LABELS_DEF[model]))
-                # require all three so every target sees the same rows
-                if y is None or y_off is None or y_def is None:
-                    continue
-                vec = []
-                for b in blocks:
-                    doc = got.get(b, {})
-                    vec.extend(as_float(doc.get(f)) for f in fields[b])
-                # convert per row: a Python list-of-lists for a full-stride build
-                # would peak around 2.7 GB before np.asarray gets to it
-                rows.append(np.array([np.nan if v is None else v for v in vec],
-                                     dtype=np.float32))
-                ys.append(y)
-                ys_off.append(y_off)
-                ys_def.append(y_def)
-                meta.append({"player": player, "timestamp": ts, "season": season_of(ts),
-                             "season_type": st, "mp": as_float(lab.get("mp")) or 0.0,
-                             "pos": lab.get("pos", ""), "test": is_test(ts)})
-            print(f"  [{i+1}/{len(timestamps)}] {ts} {st:<15} 538={len(labels):<4} "
-                  f"rows+={len(rows)-n_before}")
-
-    X = (np.vstack(rows) if rows
-         else np.zeros((0, sum(len(v) for v in fields.values())), dtype=np.float32))
-    y = np.asarray(ys, dtype=np.float32)
-    y_off = np.asarray(ys_off, dtype=np.float32)
-    y_def = np.asarray(ys_def, dtype=np.float32)
+            Xs.append(Xc)
+            ys.append(yc)
+            ys_off.append(yc_off)
+            ys_def.append(yc_def)
+            meta.extend(mc)
+            print(f"  [{k // len(SEASON_TYPES) + 1}/{len(timestamps)}] {ts} {st:<15} "
+                  f"538={n538:<4} rows+={len(yc)}")
+    finally:
+        if ex is not None:
+            ex.shutdown()
+
+    X = (np.vstack(Xs) if Xs else np.zeros((0, n_feat), dtype=np.float32))
+    y = np.concatenate(ys) if ys else np.zeros(0, dtype=np.float32)
+    y_off = np.concatenate(ys_off) if ys else np.zeros(0, dtype=np.float32)
+    y_def = np.concatenate(ys_def) if ys else np.zeros(0, dtype=np.float32)
     feat_names = [f"{b}|{f}" for b in blocks for f in fields[b]]
     print(f"[{model}] X={X.shape} y={y.shape} skipped(missing block)={skipped_no_block}")
     return X, y, y_off, y_def, feat_names, meta
@@ -196,12 +253,19 @@ def main():
     ap.add_argument("--modern-stride", type=int, default=6,
                     help="keep every Nth modern snapshot (they are ~daily and highly redundant)")
     ap.add_argument("--outdir", default=str(REPO_ROOT / "training" / "data"))
+    ap.add_argument("--store", default=None,
+                    help="read feature blocks from this feature_store.py directory "
+                         "instead of Mongo (sync it first)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="build cells in this many processes, each with its own "
+                         "Mongo client; output is identical to a serial build")
     args = ap.parse_args()
 
     outdir = Path(args.outdir)
     outdir.mkdir(parents=True, exist_ok=True)
     report = json.load(open(REPO_ROOT / "training" / "coverage_report.json"))
     coll = get_collection()
+    store = FeatureStore(args.store) if args.store else None
     ts_by_src = timestamps_with_sources(coll)
     aligned = aligned_timestamps(coll, season_of)
     print(f"{len(aligned)} timestamps have a label table for their own season")
@@ -211,7 +275,8 @@ def main():
     for model in models:
         tss = select_timestamps(ts_by_src, model, args.modern_stride, aligned)
         print(f"\n[{model}] {len(tss)} timestamps selected")
-        X, y, y_off, y_def, feat_names, meta = build(model, coll, report, tss)
+        X, y, y_off, y_def, feat_names, meta = build(model, coll, report, tss,
+                                                     store=store, workers=args.workers)
         np.savez_compressed(
             outdir / f"{model}.npz", X=X, y=y, y_off=y_off, y_def=y_def,
             feat_names=np.array(feat_names, dtype=object),
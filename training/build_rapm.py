@@ -12,7 +12,8 @@ Pipeline (per rd11490/NBA_Tutorials, adapted to run fully in-container):
             period end; points counted for the possession team only
   ridge     his rapm.py exactly: X = [offense +1 | defense -1] sparse, y =
             100 * points per possession, RidgeCV over lambdas {.01,.05,.1}
-            scaled by n (lambda_to_alpha), 5-fold, with intercept
+            scaled by n (lambda_to_alpha), 5-fold, with intercept -- solved by
+            rapm_solver on one design shared by both pools
 
 538's two adjustments on top: no extra mean-reversion (plain ridge already),
 and the pooled estimate re-centered to zero (possession-weighted).
@@ -22,13 +23,24 @@ Outputs data_fixed/rapm_recreated.npz:
   orapm4/drapm4 (2015-16..2018-19 pooled -- leak-free for scoring on the
   2013-14/2014-15 test seasons), poss6/poss4.
 
-Run:  python training/build_rapm.py            (~30-60 min)
+Possessions are parsed a season at a time by possessions.py (the rules above as
+column operations); only the lineup reconstruction is still per game.
+--workers N spreads that across N processes, CHUNK_GAMES games per task, with
+identical output. --check N parses the first N games of each season both that way
+and with the original row-by-row loop over play_by_play_utils, and reports games
+that differ. Parsed seasons are kept in poss_store (with their attributed events,
+so parse_attrib.py finds them done).
+
+Run:  python training/build_rapm.py --workers 8
+      python training/build_rapm.py --check 50
 """
 
+import argparse
 import json
 import math
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import numpy as np
@@ -37,8 +49,6 @@ if not hasattr(np, "in1d"):
     np.in1d = np.isin   # numpy 2.x dropped the alias nba_on_court still uses
 
 import pandas as pd
-from scipy import sparse
-from sklearn.linear_model import RidgeCV
 
 sys.path.insert(0, "/tmp/NBA_Tutorials/play_by_play_parser")
 import play_by_play_utils as U          # Davis's predicates, verbatim
@@ -79,6 +89,9 @@ def lineups_offline(g):
         return None
     return pd.concat(parts, ignore_index=True)
 
+import poss_store
+import possessions as P
+import rapm_solver
 from db import REPO_ROOT
 
 TD = REPO_ROOT / "training"
@@ -87,53 +100,71 @@ BUILD.mkdir(exist_ok=True)
 SEASONS6 = [2013, 2014, 2015, 2016, 2017, 2018]     # start years, RS
 SEASONS4 = [2015, 2016, 2017, 2018]
 LAMBDAS = [0.01, 0.05, 0.1]
-HP = [f"HOME_PLAYER{i}" for i in range(1, 6)]
-AP = [f"AWAY_PLAYER{i}" for i in range(1, 6)]
+# Games per --workers task: enough to amortize shipping a chunk between processes,
+# few enough that every core stays busy to the end of a season (~1230 games).
+CHUNK_GAMES = 20
+HP, AP = P.HP, P.AP
 
 
 def add_time_elapsed(g):
-    def elapsed(row):
-        try:
-            m, s = str(row["PCTIMESTRING"]).split(":")
-            m, s = int(m), int(s)
-        except (ValueError, AttributeError):
-            return np.nan
-        period = row["PERIOD"]
-        maxm = 12 if period < 5 else 5
-        in_period = ((maxm - m - 1) * 60) + (60 - s)
-        base = (min(period, 5) - 1) * 720 + max(period - 5, 0) * 300
-        return base + in_period
-    g[U.time_elapsed] = g.apply(elapsed, axis=1)
+    g[U.time_elapsed] = P.time_elapsed(g)
     return g
 
 
-def team_ids(g):
-    """(home_id, away_id) from which side's description carries made shots."""
-    made = g[g["EVENTMSGTYPE"] == 1]
-    h = made[made["HOMEDESCRIPTION"].astype(str).str.len() > 0]
-    a = made[made["VISITORDESCRIPTION"].astype(str).str.len() > 0]
-    if not len(h) or not len(a):
-        return None, None
-    return (int(h["PLAYER1_TEAM_ID"].mode().iloc[0]),
-            int(a["PLAYER1_TEAM_ID"].mode().iloc[0]))
+def _parse_chunk(g):
+    """A run of whole games -> (pack()ed possessions and events, periods skipped,
+    games skipped). Runs in a --workers process, whose counters start wherever
+    its previous chunk left them."""
+    sp, sg = SKIPPED_PERIODS[0], SKIPPED_GAMES[0]
+    packed = P.pack(*P.parse(*P.with_lineups(g, lineups_offline)))
+    return packed, SKIPPED_PERIODS[0] - sp, SKIPPED_GAMES[0] - sg
 
 
-def parse_game(g):
-    """-> list of (off5, def5, points) for one game."""
+def parse_season(df, tag="", workers=1):
+    """Season play-by-play -> (possessions, attributed events); possessions.py.
+
+    workers > 1 reconstructs lineups and parses CHUNK_GAMES games per task in a
+    process pool. Chunks come back in GAME_ID order and the skip counters are
+    summed here, so both outputs and counters match a serial run exactly.
+    """
+    t0 = time.time()
+    df = add_time_elapsed(df.copy())
+
+    def progress(k, n):
+        if k % 200 == 0 or k == n:
+            print(f"  [{tag}] lineups for {k}/{n} games ({time.time()-t0:.0f}s)",
+                  flush=True)
+    if workers <= 1:
+        return P.parse(*P.with_lineups(df, lineups_offline, progress))
+
+    games = [g for _, g in df.groupby("GAME_ID", sort=True)]
+    chunks = [pd.concat(games[i:i + CHUNK_GAMES])
+              for i in range(0, len(games), CHUNK_GAMES)]
+    parts = []
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for k, (packed, sp, sg) in enumerate(ex.map(_parse_chunk, chunks)):
+            SKIPPED_PERIODS[0] += sp
+            SKIPPED_GAMES[0] += sg
+            parts.append(packed)
+            progress(min((k + 1) * CHUNK_GAMES, len(games)), len(games))
+    return P.unpack(parts)
+
+
+def parse_game_rows(g):
+    """The row-by-row loop parse_season replaced, over play_by_play_utils' own
+    predicates: -> (possession rows, events) for one game. Only --check runs it."""
     g = g.sort_values("EVENTNUM").reset_index(drop=True)
-    g["HOMEDESCRIPTION"] = g["HOMEDESCRIPTION"].fillna("")
-    g["VISITORDESCRIPTION"] = g["VISITORDESCRIPTION"].fillna("")
-    g["NEUTRALDESCRIPTION"] = g["NEUTRALDESCRIPTION"].fillna("")
+    for c in P.DESCRIPTIONS:
+        g[c] = g[c].fillna("")
     g = add_time_elapsed(g)
-    hid, aid = team_ids(g)
+    hid, aid = P.team_ids(g).get(g["GAME_ID"].iloc[0], (None, None))
     if hid is None:
-        return []
+        return [], []
     g = lineups_offline(g)
     if g is None:
-        return []
+        return [], []
     rows = list(g.iterrows())
-
-    out = []
+    poss_out, ev_out = [], []
     cur = []
     for ind, row in rows:
         if not U.is_substitution(row) and not U.is_end_of_period(row):
@@ -151,17 +182,29 @@ def parse_game(g):
             team = _possession_team(last, hid, aid)
             if team is not None:
                 pts = 0
+                events = []
                 for p in cur:
                     if (U.is_made_shot(p) or (U.is_free_throw(p)
                                               and not U.is_miss(p))):
                         if p["PLAYER1_TEAM_ID"] == team:
-                            pts += _points(p)
+                            v = _points(p)
+                            pts += v
+                            events.append(("score", int(p["PLAYER1_ID"]), v))
+                    elif U.is_rebound(p) and not U.is_team_rebound(p):
+                        try:
+                            rt = int(p["PLAYER1_TEAM_ID"])
+                        except (ValueError, TypeError):
+                            continue
+                        kind = "oreb" if rt == team else "dreb"
+                        events.append((kind, int(p["PLAYER1_ID"]), 1))
                 home5 = [int(last[c]) for c in HP]
                 away5 = [int(last[c]) for c in AP]
                 off5, def5 = (home5, away5) if team == hid else (away5, home5)
-                out.append((off5, def5, pts))
+                idx = len(poss_out)
+                poss_out.append(off5 + def5 + [pts])
+                ev_out += [(idx, k, pid, v) for k, pid, v in events]
             cur = []
-    return out
+    return poss_out, ev_out
 
 
 def _points(p):
@@ -192,74 +235,74 @@ def _possession_team(p, hid, aid):
         return None
 
 
-def build_possessions(season):
-    cache = BUILD / f"poss_{season}.csv"
-    if cache.exists():
-        return pd.read_csv(cache)
+def check(season, n_games):
+    """Parse n_games of season both ways; -> the GAME_IDs whose output differs."""
+    df = pd.read_csv(season_csv(season))
+    gids = sorted(df["GAME_ID"].unique())[:n_games]
+    bad = []
+    for gid in gids:
+        g = df[df["GAME_ID"] == gid]
+        want_p, want_e = parse_game_rows(g)
+        got_p, got_e = parse_season(g, season)
+        if not P.same_as_rows(got_p, got_e, want_p, want_e):
+            bad.append(gid)
+    print(f"[{season}] {len(gids) - len(bad)}/{len(gids)} games identical"
+          + (f"; differ: {bad[:10]}" if bad else ""), flush=True)
+    return bad
+
+
+def season_csv(season):
     csv = BUILD / f"nbastats_{season}.csv"
     if not csv.exists():
         noc.load_nba_data(path=BUILD, seasons=season, data="nbastats",
                           seasontype="rg", untar=True)
-    df = pd.read_csv(csv)
-    recs = []
-    t0 = time.time()
-    for k, (gid, g) in enumerate(df.groupby("GAME_ID", sort=True)):
-        for off5, def5, pts in parse_game(g):
-            recs.append(off5 + def5 + [pts])
-        if (k + 1) % 200 == 0:
-            print(f"  [{season}] {k+1} games, {len(recs):,} poss "
-                  f"({time.time()-t0:.0f}s)", flush=True)
-    cols = [f"o{i}" for i in range(5)] + [f"d{i}" for i in range(5)] + ["pts"]
-    out = pd.DataFrame(recs, columns=cols)
+    return csv
+
+
+def build_possessions(season, workers=1):
+    if not poss_store.exists(season):
+        poss, events = parse_season(pd.read_csv(season_csv(season)), season, workers)
+        poss_store.save(season, poss, events)
+        print(f"[{season}] {len(poss):,} possessions "
+              f"(mean pts {poss.pts.mean():.3f}; skipped periods so far "
+              f"{SKIPPED_PERIODS[0]}, games {SKIPPED_GAMES[0]})", flush=True)
+    out = poss_store.load(season).frame()
     out["season"] = season
-    out.to_csv(cache, index=False)
-    print(f"[{season}] {len(out):,} possessions "
-          f"(mean pts {out.pts.mean():.3f}; skipped periods so far "
-          f"{SKIPPED_PERIODS[0]}, games {SKIPPED_GAMES[0]})", flush=True)
     return out
 
 
-def fit_rapm(poss, tag):
-    players = sorted(set(np.unique(poss[[f"o{i}" for i in range(5)]].values))
-                     | set(np.unique(poss[[f"d{i}" for i in range(5)]].values)))
-    pidx = {p: i for i, p in enumerate(players)}
-    P, n = len(players), len(poss)
-    rows = np.repeat(np.arange(n), 10)
-    cols = np.empty(n * 10, dtype=np.int64)
-    vals = np.empty(n * 10, dtype=np.float64)
-    O = poss[[f"o{i}" for i in range(5)]].values
-    D = poss[[f"d{i}" for i in range(5)]].values
-    for j in range(5):
-        cols[j::10] = [pidx[p] for p in O[:, j]]
-        vals[j::10] = 1.0
-        cols[5 + j::10] = [pidx[p] + P for p in D[:, j]]
-        vals[5 + j::10] = -1.0
-    X = sparse.csr_matrix((vals, (rows, cols)), shape=(n, 2 * P))
-    y = 100.0 * poss["pts"].values.astype(np.float64)
-    alphas = [(l * n) / 2.0 for l in LAMBDAS]
-    clf = RidgeCV(alphas=alphas, cv=5, fit_intercept=True)
-    model = clf.fit(X, y)
-    lam = (model.alpha_ * 2.0) / n
-    o = model.coef_[:P]
-    d = model.coef_[P:]
-    # possession-weighted recentering (538 re-zeroed their pooled target)
-    cnt_o = np.bincount(cols[np.tile(np.arange(10) < 5, n)], minlength=2 * P)[:P]
-    cnt_d = np.bincount(cols[np.tile(np.arange(10) >= 5, n)] - P,
-                        minlength=P)
-    o = o - np.average(o, weights=np.maximum(cnt_o, 1))
-    d = d - np.average(d, weights=np.maximum(cnt_d, 1))
-    print(f"[{tag}] {n:,} poss, {P} players, lambda={lam:.3f}, "
-          f"intercept={model.intercept_:.2f}", flush=True)
-    return players, o, d, cnt_o + cnt_d
+def fit_rapm(design, tag, mask=None, x0=None):
+    """Ridge over the possessions of design in mask, lambda from LAMBDAS by 5-fold
+    CV (rapm_solver). -> (players, offense, defense, possessions, coefficients)."""
+    coef, lam = rapm_solver.fit_cv(design, LAMBDAS, mask, x0=x0)
+    players, o, d, cnt_o, cnt_d = rapm_solver.ratings(design, coef, mask)
+    n = len(design) if mask is None else int(np.count_nonzero(mask))
+    print(f"[{tag}] {n:,} poss, {len(players)} players, lambda={lam:.3f}, "
+          f"intercept={coef[-1]:.2f}", flush=True)
+    return list(players), o, d, cnt_o + cnt_d, coef
 
 
 def main():
-    frames = [build_possessions(s) for s in SEASONS6]
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--check", type=int, metavar="N",
+                    help="compare the parsers on N games per season, build nothing")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="parse games in this many processes")
+    args = ap.parse_args()
+    if args.check:
+        bad = sum(len(check(s, args.check)) for s in SEASONS6)
+        raise SystemExit(1 if bad else 0)
+
+    frames = [build_possessions(s, args.workers) for s in SEASONS6]
     poss6 = pd.concat(frames, ignore_index=True)
-    poss4 = poss6[poss6["season"].isin(SEASONS4)]
-
-    p6, o6, d6, c6 = fit_rapm(poss6, "6y 2013-19")
-    p4, o4, d4, c4 = fit_rapm(poss4, "4y 2015-19")
+    # one design for both pools; the 4-year pool is a mask over it, started from
+    # the 6-year solution
+    design = rapm_solver.Design(poss6[[f"o{i}" for i in range(5)]].values,
+                                poss6[[f"d{i}" for i in range(5)]].values,
+                                poss6["pts"].values)
+    p6, o6, d6, c6, coef6 = fit_rapm(design, "6y 2013-19")
+    p4, o4, d4, c4, _ = fit_rapm(design, "4y 2015-19",
+                                 poss6["season"].isin(SEASONS4).values, coef6)
     m4 = {p: (o, d, c) for p, o, d, c in zip(p4, o4, d4, c4)}
 
     # id -> standard name via the roster files
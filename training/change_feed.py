@@ -0,0 +1,310 @@
+"""Notice which (source, cell) pairs a scrape changed, and plan the rebuild they need.
+
+Nothing used to notice when a scrape landed: someone re-ran build_dataset.py, the
+extract_*.py scripts, the LOSO and the boards by hand, all of them, every time. This
+records changes as they happen and turns them into the smallest plan that brings
+every artifact back up to date.
+
+Watching. On Atlas (a replica set) a change stream on the collection reports every
+insert, replace and update with its document, and the resume token is kept in
+STATE_PATH so a restart picks up where it stopped. A standalone mongod -- a local
+stand-in -- has no change streams; there the feed polls for _ids above the last
+watermark instead. ObjectIds grow with insert time, so that catches every new
+document, but a ReplaceOne upsert keeps the _id it replaces: a re-scrape that
+rewrites a cell in place is only visible to the change stream (as with
+feature_store.py's manifest, purge_cell.py plus a re-scrape makes it visible to
+polling). Deletes carry no document and are not recorded; purge_cell.py is always
+followed by the re-scrape that is.
+
+Planning. A changed cell matters to an artifact only if the artifact reads it:
+
+  labeled era     cells of the ten labeled seasons (2013-14 .. 2022-23) are rows of
+                  data_fixed/combined.npz when their source feeds it, and every
+                  extract_*.py artifact is row-aligned to that file. Any labeled
+                  regular-season row is training data for the nine folds it is not
+                  scored in, so the LOSO folds go stale together; the plan says
+                  which of them also had their evaluation cell change.
+  projection      the UNLABELED_SNAPSHOTS cells (2023-24 onward, whole season) are
+                  read straight from Mongo by final_boards.py, so they stale the
+                  boards and nothing else.
+  idle            any other cell -- the daily in-season snapshots after 538 shut
+                  down -- is read by no artifact. Only the feature store syncs it.
+
+Run:  python training/change_feed.py              # record changes since last time
+      python training/change_feed.py --watch      # keep recording until Ctrl-C
+      python training/change_feed.py --plan       # the plan for what is recorded
+      python training/change_feed.py --done       # that plan was run; forget it
+"""
+
+import argparse
+import json
+import time
+from collections import defaultdict
+
+import pymongo
+from bson import ObjectId
+
+from build_dataset import SOURCES_NEEDED
+from db import REPO_ROOT, get_collection
+from seasons import FULL_SEASON_SNAPSHOTS, UNLABELED_SNAPSHOTS, season_of
+
+STATE_PATH = REPO_ROOT / "training" / "change_feed.json"
+# Seconds between polls when following without a change stream.
+POLL_INTERVAL = 60
+# Changes recorded between state writes while following a stream.
+SAVE_EVERY = 500
+
+LABELED_SEASONS = {s for t, s in FULL_SEASON_SNAPSHOTS.items()
+                   if t not in UNLABELED_SNAPSHOTS}
+
+FIXED = "training/data_fixed"
+# artifact -> (sources it reads, artifact it is row-aligned to, command), in build
+# order. Each extract script reads its source for every row of combined.npz.
+ARTIFACTS = {
+    f"{FIXED}/combined.npz": (
+        set(SOURCES_NEEDED["combined"]), None,
+        f"python training/build_dataset.py --model combined --outdir {FIXED} "
+        f"--store training/store"),
+    f"{FIXED}/components.npz": ({"538"}, f"{FIXED}/combined.npz",
+                                "cd training && python extract_components.py"),
+    f"{FIXED}/wowyopp.npz": ({"wowy-opp"}, f"{FIXED}/combined.npz",
+                             "cd training && python extract_wowyopp.py"),
+    f"{FIXED}/shotdash.npz": ({"nba-shotdash"}, f"{FIXED}/combined.npz",
+                              "python training/extract_shotdash.py"),
+    f"{FIXED}/defend.npz": ({"nba-defend"}, f"{FIXED}/combined.npz",
+                            "python training/experiment_defend.py"),
+}
+# What loso_confidence.py reads; the folds are LABELED_SEASONS.
+LOSO_INPUTS = (f"{FIXED}/combined.npz", f"{FIXED}/components.npz",
+               f"{FIXED}/defend.npz", f"{FIXED}/wowyopp.npz")
+LOSO_COMMANDS = ["python training/loso_confidence.py",
+                 "python training/confidence_report.py"]
+BOARD_COMMANDS = ["python training/final_boards.py"]
+
+
+# ------------------------------------------------------------------ state
+def load_state(path=STATE_PATH):
+    if path.exists():
+        return json.loads(path.read_text())
+    return {"token": None, "watermark": None, "changed": {}}
+
+
+def save_state(state, path=STATE_PATH):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True))
+    tmp.replace(path)
+
+
+def record(state, doc):
+    """Count one changed document against its (source, cell)."""
+    src, ts, st = doc.get("source"), doc.get("timestamp"), doc.get("season_type")
+    if src is None or ts is None or st is None:
+        return
+    cells = state["changed"].setdefault(src, {})
+    key = f"{ts}|{st}"
+    cells[key] = cells.get(key, 0) + 1
+
+
+def changed_cells(state):
+    """-> {(source, timestamp, season_type): n documents}."""
+    return {(src, *k.split("|", 1)): n
+            for src, cells in state["changed"].items() for k, n in cells.items()}
+
+
+# --------------------------------------------------------------- watching
+_CELL_FIELDS = {"source": 1, "timestamp": 1, "season_type": 1}
+
+
+def open_stream(coll, state):
+    """A change stream resuming from the saved token, or None without one."""
+    pipeline = [
+        {"$match": {"operationType": {"$in": ["insert", "replace", "update"]}}},
+        {"$project": {"operationType": 1,
+                      **{f"fullDocument.{k}": 1 for k in _CELL_FIELDS}}}]
+    try:
+        return coll.watch(pipeline, full_document="updateLookup",
+                          resume_after=state["token"])
+    except pymongo.errors.OperationFailure as e:
+        if e.code == 286 and state["token"] is not None:
+            # ChangeStreamHistoryLost: the oplog rolled past the saved token.
+            print("WARNING: the resume token has aged out of the oplog; changes "
+                  "since the last run are lost. Rebuild everything once.")
+            state["token"] = None
+            return open_stream(coll, state)
+        # 40573: "The $changeStream stage is only supported on replica sets".
+        print(f"no change stream ({e.details.get('codeName', e.code)}); "
+              f"polling _id watermarks")
+        return None
+
+
+def drain_stream(stream, state, follow=False):
+    """Record what the stream has. -> n changes. follow=True runs until Ctrl-C."""
+    n = 0
+    try:
+        while stream.alive:
+            ch = stream.try_next()
+            if stream.resume_token is not None:
+                state["token"] = dict(stream.resume_token)
+            if ch is None:
+                if not follow:
+                    break
+                continue
+            if ch.get("fullDocument"):
+                record(state, ch["fullDocument"])
+                n += 1
+                if n % SAVE_EVERY == 0:
+                    save_state(state)
+    finally:
+        save_state(state)
+    return n
+
+
+def poll(coll, state):
+    """Record every document inserted above the watermark. -> n changes.
+
+    The first poll only sets the watermark: what is already there is what the
+    current artifacts were built from.
+    """
+    if state["watermark"] is None:
+        last = coll.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        state["watermark"] = str(last["_id"]) if last else None
+        save_state(state)
+        return 0
+    n = 0
+    cur = coll.find({"_id": {"$gt": ObjectId(state["watermark"])}},
+                    _CELL_FIELDS).sort("_id", 1)
+    for doc in cur:
+        record(state, doc)
+        state["watermark"] = str(doc["_id"])
+        n += 1
+        if n % SAVE_EVERY == 0:
+            save_state(state)
+    save_state(state)
+    return n
+
+
+# --------------------------------------------------------------- planning
+def plan(changed):
+    """Changed (source, timestamp, season_type) cells -> the rebuild plan.
+
+    -> {"store": {source: [cells]}, "artifacts": [path, ...] in build order,
+        "loso": {season: "eval" | "train"}, "boards": bool, "idle": [cells],
+        "commands": [shell command, ...]}
+    """
+    store = defaultdict(set)
+    labeled = defaultdict(set)          # source -> {(ts, st)} in the labeled era
+    eval_seasons = set()
+    boards, idle = False, []
+    for src, ts, st in sorted(changed):
+        store[src].add(f"{ts}|{st}")
+        season = season_of(ts)
+        if season in LABELED_SEASONS:
+            labeled[src].add((ts, st))
+            if st == "Regular season":
+                eval_seasons.add(season)
+        elif ts in UNLABELED_SNAPSHOTS:
+            boards = True
+        else:
+            idle.append((src, ts, st))
+
+    stale = []
+    for path, (sources, aligned_to, _) in ARTIFACTS.items():
+        if any(labeled[s] for s in sources) or aligned_to in stale:
+            stale.append(path)
+
+    loso = {}
+    if any(p in stale for p in LOSO_INPUTS):
+        loso = {s: "eval" if s in eval_seasons else "train"
+                for s in sorted(LABELED_SEASONS)}
+    boards = boards or bool(stale)
+
+    commands = [f"python training/feature_store.py "
+                + " ".join(f"--source {s}" for s in sorted(store))] if store else []
+    commands += [ARTIFACTS[p][2] for p in stale]
+    if loso:
+        commands += LOSO_COMMANDS
+    if boards:
+        commands += BOARD_COMMANDS
+    return {"store": {s: sorted(c) for s, c in sorted(store.items())},
+            "artifacts": stale, "loso": loso, "boards": boards, "idle": idle,
+            "commands": commands}
+
+
+def print_plan(p, changed):
+    if not changed:
+        print("nothing recorded; every artifact is current")
+        return
+    print(f"{len(changed)} changed cell(s), {sum(changed.values())} document(s)")
+    for src, cells in p["store"].items():
+        print(f"  {src:<14} {len(cells):>4} cell(s)  {', '.join(cells[:4])}"
+              f"{' ...' if len(cells) > 4 else ''}")
+    if p["idle"]:
+        print(f"  {len(p['idle'])} of them read by no artifact (feature store only)")
+    print("\nstale:")
+    for a in p["artifacts"]:
+        print(f"  {a}")
+    if p["loso"]:
+        ev = [s for s, why in p["loso"].items() if why == "eval"]
+        print(f"  LOSO folds: all {len(p['loso'])}"
+              f"{'; evaluation cell changed for ' + ', '.join(ev) if ev else ''}")
+    if p["boards"]:
+        print("  projection boards")
+    if not (p["artifacts"] or p["loso"] or p["boards"]):
+        print("  nothing downstream")
+    print("\nrun:")
+    for c in p["commands"]:
+        print(f"  {c}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--watch", action="store_true",
+                    help="keep recording (change stream, or a poll every "
+                         f"{POLL_INTERVAL}s) until Ctrl-C")
+    ap.add_argument("--plan", action="store_true",
+                    help="only print the plan for what is already recorded")
+    ap.add_argument("--json", action="store_true", help="print the plan as JSON")
+    ap.add_argument("--done", action="store_true",
+                    help="the plan has been run: clear the recorded changes")
+    ap.add_argument("--poll", action="store_true",
+                    help="poll _id watermarks even where change streams exist")
+    args = ap.parse_args()
+
+    state = load_state()
+    if args.done:
+        state["changed"] = {}
+        save_state(state)
+        print("cleared recorded changes")
+        return
+
+    if not args.plan:
+        coll = get_collection()
+        stream = None if args.poll else open_stream(coll, state)
+        try:
+            if stream is not None:
+                n = drain_stream(stream, state, follow=args.watch)
+            else:
+                n = poll(coll, state)
+                while args.watch:
+                    time.sleep(POLL_INTERVAL)
+                    n += poll(coll, state)
+                    print(f"  {time.strftime('%H:%M:%S')} {n} change(s) so far",
+                          flush=True)
+        except KeyboardInterrupt:
+            n = None
+        finally:
+            if stream is not None:
+                stream.close()
+        if n is not None:
+            print(f"recorded {n} change(s)\n")
+
+    changed = changed_cells(state)
+    p = plan(changed)
+    if args.json:
+        print(json.dumps(p, indent=1))
+    else:
+        print_plan(p, changed)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,17 +8,30 @@ Coverage is reported separately for the historical/test era (the YYYY0715 snapsh
 and the modern/train era, because the NBA's tracking feeds gained columns over time and
 a field that only exists post-2020 is useless to us.
 
+--from-registry builds the same report from scraping/schema_registry.py's per-cell
+field catalogs, which write_rows keeps current at ingest, so it reads a few hundred
+small documents instead of pulling cells. Its rates are over every row a cell holds
+rather than only the players 538 rates, and its train era is every modern cell
+rather than a sample; usable_fields' 5% era-presence floor reads the same off both.
+
 Run:  python training/coverage.py
+      python training/coverage.py --from-registry
 """
 
 import argparse
+import functools
 import json
-import re
+import sys
 from collections import defaultdict
 from pathlib import Path
 
+import numpy as np
+
 from db import REPO_ROOT, get_collection
 
+sys.path.insert(0, str(REPO_ROOT))
+from utils import NUM_RE, as_float  # noqa: E402  (re-exported)
+
 # Held-out seasons -> their single synthetic snapshot.
 TEST_TIMESTAMPS = {"20140715000000": "2013-14", "20150715000000": "2014-15"}
 # The other historical snapshots (also full-season, same shape as test).
@@ -38,23 +51,49 @@ ID_FIELDS = {"_id", "name", "ShortName", "standard_name", "timestamp", "season_t
              "data_key", "row_num", "pos",
              # provenance markers, never features
              "ft_ast_derived", "tracking_schema", "n_stints", "pbp_row_scope",
-             "nba_player_id"}
-
-NUM_RE = re.compile(r"^-?[\d,]*\.?\d+$")
-
-
-def as_float(v):
-    """Parse a scraped value to float, or None if it isn't a number."""
-    if isinstance(v, (int, float)) and not isinstance(v, bool):
-        return float(v)
-    if isinstance(v, str):
-        s = v.strip().replace(",", "").replace("%", "").lstrip("+")
-        if s and NUM_RE.match(s.replace(",", "")):
-            try:
-                return float(s)
-            except ValueError:
-                return None
-    return None
+             "nba_player_id", "off_derived", "approx_fields"}
+
+@functools.lru_cache(maxsize=1 << 16)
+def _parse_str(v):
+    # Scraped strings repeat heavily ("0", "0.0", "100.0%"), so each distinct one
+    # goes through the regex once per process.
+    return as_float(v)
+
+
+# Value types as_float passes straight through as float(v). bool is an int
+# subclass that as_float rejects, so it is deliberately absent.
+_NUMERIC_TYPES = {int, float, type(None)}
+
+
+def docs_to_matrix(docs, fields, out=None):
+    """as_float over docs x fields in one pass -> float32 matrix, NaN where as_float is None.
+
+    A missing document is passed as {} (or None). Columns whose values are all plain
+    numbers or absent -- nearly every column once a document has been through the
+    store or a migration -- convert with one np.array call; anything else falls back
+    to the cached string parser. out, if given, is filled in place and returned.
+    """
+    docs = [d or {} for d in docs]
+    if out is None:
+        out = np.full((len(docs), len(fields)), np.nan, dtype=np.float32)
+    for j, f in enumerate(fields):
+        col = [d.get(f) for d in docs]
+        if set(map(type, col)) <= _NUMERIC_TYPES:
+            out[:, j] = np.array(col, dtype=np.float64)
+            continue
+        vals = np.full(len(col), np.nan)
+        for i, v in enumerate(col):
+            t = type(v)
+            if t is str:
+                x = _parse_str(v)
+            elif t is float or t is int:
+                x = v
+            else:
+                x = as_float(v)
+            if x is not None:
+                vals[i] = x
+        out[:, j] = vals
+    return out
 
 
 def pick_doc(docs):
@@ -66,6 +105,68 @@ def pick_doc(docs):
     return max(docs, key=lambda d: d["_id"])
 
 
+# What a cell fetch needs beyond the stat fields: enough to route a document to its
+# block (source + data_type/on_or_off), name the player, and let pick_doc break ties.
+ROUTING_FIELDS = ("_id", "standard_name", "source", "data_type", "on_or_off")
+
+
+def _block_of(doc, specs_by_source):
+    for block, q in specs_by_source.get(doc.get("source"), ()):
+        if all(doc.get(k) == v for k, v in q.items()):
+            return block
+    return None
+
+
+def fetch_blocks(coll, ts, season_type, specs, players=None, fields=None):
+    """-> {player: {block: doc}} for one cell, in one round trip per projection.
+
+    The loaders used to issue one find() per block -- pbp, 14 tracking tables and
+    two wowy sides is 17 round trips per cell -- and pull whole documents for each.
+    Here every block's spec goes into a single $or under the cell's timestamp and
+    season type, and documents are routed back to their block in memory.
+
+    players, if given, restricts the query to those standard_names. fields maps
+    block -> the stat fields the caller will read; only those (plus ROUTING_FIELDS)
+    are transferred. A projection cannot name a field with a '.' in it -- Mongo
+    reads "DIST. MILES" as a path -- so blocks that need one are fetched whole, in a
+    second query.
+    """
+    specs_by_source = defaultdict(list)
+    for block, q in specs.items():
+        specs_by_source[q["source"]].append((block, q))
+
+    groups = defaultdict(list)        # projection (or None) -> blocks
+    if fields is None:
+        groups[None] = list(specs)
+    else:
+        proj, whole = set(ROUTING_FIELDS), []
+        for block in specs:
+            fs = fields.get(block, ())
+            if any("." in f or f.startswith("$") for f in fs):
+                whole.append(block)
+            else:
+                proj.update(fs)
+        if whole:
+            groups[None] = whole
+        rest = [b for b in specs if b not in whole]
+        if rest:
+            groups[tuple(sorted(proj))] = rest
+
+    base = {"timestamp": ts, "season_type": season_type}
+    if players is not None:
+        base["standard_name"] = {"$in": sorted(players)}
+    grp = defaultdict(lambda: defaultdict(list))
+    for proj, blocks in groups.items():
+        q = dict(base, **{"$or": [specs[b] for b in blocks]})
+        for d in coll.find(q, {f: 1 for f in proj} if proj else None):
+            block = _block_of(d, specs_by_source)
+            if block is not None:
+                grp[d["standard_name"]][block].append(d)
+
+    return {name: {b: pick_doc(docs) for b, docs in by_block.items()}
+            for name, by_block in grp.items()}
+
+
 def block_specs():
     specs = {"pbp": {"source": "pbp"},
              "wowy_on": {"source": "wowy", "on_or_off": "on"},
@@ -83,36 +184,86 @@ def cell_coverage(coll, ts, season_type, specs):
     if not players:
         return 0, {}, {}
 
+    picked = fetch_blocks(coll, ts, season_type, specs, players=players)
     present = {}
     counts = {}
-    for block, q in specs.items():
-        grp = defaultdict(list)
-        for d in coll.find({"timestamp": ts, "season_type": season_type, **q}):
-            if d["standard_name"] in players:
-                grp[d["standard_name"]].append(d)
+    for block in specs:
         c = defaultdict(int)
-        for name, docs in grp.items():
-            doc = pick_doc(docs)
+        n = 0
+        for got in picked.values():
+            doc = got.get(block)
+            if doc is None:
+                continue
+            n += 1
             for k, v in doc.items():
                 if k in ID_FIELDS:
                     continue
                 if as_float(v) is not None:
                     c[k] += 1
         counts[block] = dict(c)
-        present[block] = len(grp)
+        present[block] = n
     return len(players), counts, present
 
 
+def registry_report(cats, specs, train_after="20201101000000"):
+    """Schema-registry catalogs {(source, ts, st): {sub: catalog}} -> the report.
+
+    Same shape as main()'s: per era, the cells used, per-block {field: share of the
+    block's rows with a numeric value}, and the rows behind each share.
+    """
+    eras = {"test": lambda ts: ts in TEST_TIMESTAMPS,
+            "hist": lambda ts: ts in HIST_TIMESTAMPS,
+            "train": lambda ts: ts > train_after}
+    report = {}
+    for era, in_era in eras.items():
+        num = defaultdict(lambda: defaultdict(int))
+        den = defaultdict(int)
+        cells = defaultdict(dict)
+        for block, q in specs.items():
+            sub = q.get("data_type") or q.get("on_or_off") or "-"
+            for (src, ts, st), subs in cats.items():
+                c = subs.get(sub)
+                if src != q["source"] or not in_era(ts) or not c:
+                    continue
+                den[block] += c["rows"]
+                cells[(ts, st)][block] = c["rows"]
+                for f, (_, n_num) in c["fields"].items():
+                    if f not in ID_FIELDS and n_num:
+                        num[block][f] += n_num
+        report[era] = {
+            "cells": [{"ts": ts, "season_type": st, "n_block_players": n}
+                      for (ts, st), n in sorted(cells.items())],
+            "coverage": {b: {k: v / max(den[b], 1) for k, v in flds.items()}
+                         for b, flds in num.items()},
+            "denominator": dict(den),
+        }
+    return report
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--train-samples", type=int, default=6)
     ap.add_argument("--out", default=str(REPO_ROOT / "training" / "coverage_report.json"))
+    ap.add_argument("--from-registry", action="store_true",
+                    help="build the report from the schema registry's catalogs")
     args = ap.parse_args()
     Path(args.out).parent.mkdir(parents=True, exist_ok=True)
 
     coll = get_collection()
     specs = block_specs()
 
+    if args.from_registry:
+        sys.path.insert(0, str(REPO_ROOT / "scraping"))
+        import schema_registry
+        sources = sorted({q["source"] for q in specs.values()})
+        report = registry_report(
+            schema_registry.catalogs(coll, {"source": {"$in": sources}}), specs)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.out} from "
+              + ", ".join(f"{era}: {len(r['cells'])} cells" for era, r in report.items()))
+        return
+
     # Sample modern timestamps spread across seasons for the train-era view.
     modern = sorted(t for t in coll.distinct("timestamp", {"source": "538"})
                     if t > "20201101000000")
@@ -18,17 +18,19 @@ Run:  python training/estimated_raptor.py --repo /tmp/NBA-elo
 
 import argparse
 import json
-import difflib
-import re
-import unicodedata
+import sys
 from collections import defaultdict
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 
-from coverage import as_float, pick_doc
+from coverage import as_float, fetch_blocks
 from db import REPO_ROOT, get_collection
+from labels import snapshot_table
+
+sys.path.insert(0, str(REPO_ROOT))
+from name_index import NameIndex, norm_name  # noqa: E402  (re-exported)
 
 # season -> (our wayback snapshot, Paine's Year)
 TEST_SEASONS = {"2013-14": ("20140715000000", 2014), "2014-15": ("20150715000000", 2015)}
@@ -50,37 +52,25 @@ POS_TARGETS = {"PG": (0.3, -0.3), "SG": (0.2, -0.2), "SF": (0.0, 0.0),
 POS_COLS = ["PG", "SG", "SF", "PF", "C"]
 
 
-def norm_name(s):
-    """Alphanumeric-only key.
+def match_rows(ours, paine):
+    """Exact key match, then the name index's trigram fallback within the same
+    (year, split). -> (paine row or -1, how, score) per row of ours.
 
-    Paine's CSV has lost its diacritics to literal '?' ("Bojan Bogdanovi?",
-    "Ersan ?lyasova") and our standard_name drops hyphens entirely
-    ("Kentavious CaldwellPope"), so anything but letters and digits is noise.
+    how is "exact", "fuzzy", "ambiguous" or "none"; an ambiguous row is left
+    unmatched rather than joined to whichever near-tie difflib happened to rank first.
     """
-    s = unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode()
-    # Strip a generational suffix only at the end.  The old unanchored pattern
-    # also removed the *first name* from "JR Smith", preventing seven valid
-    # Paine joins in the canonical 2014-23 comparison.
-    s = re.sub(r"(?:^|\s)(jr|sr|ii|iii|iv)\.?$", "", s.lower().strip())
-    return re.sub(r"[^a-z0-9]", "", s)
-
-
-def match_rows(ours, paine):
-    """Exact key match, then difflib fallback within the same (year, split)."""
-    lookup = defaultdict(dict)
+    pools = defaultdict(list)
     for i, r in paine.iterrows():
-        lookup[(r["Year"], r["Type"])][r["key"]] = i
-    idx, how = [], []
+        pools[(r["Year"], r["Type"])].append((r["key"], i))
+    index = {k: NameIndex(v) for k, v in pools.items()}
+    empty = NameIndex()
+    idx, how, score = [], [], []
     for _, r in ours.iterrows():
-        pool = lookup.get((r["year"], r["ptype"]), {})
-        if r["key"] in pool:
-            idx.append(pool[r["key"]]); how.append("exact"); continue
-        close = difflib.get_close_matches(r["key"], list(pool), n=1, cutoff=0.85)
-        if close:
-            idx.append(pool[close[0]]); how.append("fuzzy")
-        else:
-            idx.append(-1); how.append("none")
-    return np.array(idx), np.array(how)
+        m = index.get((r["year"], r["ptype"]), empty).resolve(r["key"])
+        idx.append(-1 if m.value is None else m.value)
+        how.append(m.how)
+        score.append(m.score)
+    return np.array(idx), np.array(how), np.array(score)
 
 
 # ---------------------------------------------------------------- our labels
@@ -92,19 +82,18 @@ def load_our_test_rows(coll):
     rows = []
     for season, (ts, year) in TEST_SEASONS.items():
         for split, ptype in SPLITS.items():
-            labels = {}
-            for d in coll.find({"timestamp": ts, "source": "538", "season_type": split}):
-                labels.setdefault(d["standard_name"], d)
-
-            blocks = {}
-            for key, q in (("pbp", {"source": "pbp"}),
-                           ("on", {"source": "wowy", "on_or_off": "on"}),
-                           ("off", {"source": "wowy", "on_or_off": "off"})):
-                grp = defaultdict(list)
-                for d in coll.find({"timestamp": ts, "season_type": split, **q}):
-                    if d["standard_name"] in labels:
-                        grp[d["standard_name"]].append(d)
-                blocks[key] = {n: pick_doc(v) for n, v in grp.items()}
+            labels = snapshot_table(coll, ts, split)
+
+            picked = fetch_blocks(
+                coll, ts, split,
+                {"pbp": {"source": "pbp"},
+                 "on": {"source": "wowy", "on_or_off": "on"},
+                 "off": {"source": "wowy", "on_or_off": "off"}},
+                players=labels,
+                fields={"pbp": need_pbp, "on": ["PlusMinus", "TotalPoss"],
+                        "off": ["PlusMinus", "TotalPoss"]})
+            blocks = {key: {n: got[key] for n, got in picked.items() if key in got}
+                      for key in ("pbp", "on", "off")}
 
             for name, lab in labels.items():
                 r = {"player": name, "season": season, "year": year,
@@ -239,14 +228,16 @@ def main():
     print(f"  {len(ours)} rows  ({ours.groupby(['season','split']).size().to_dict()})")
 
     paine = load_paine(args.repo)
-    idx, how = match_rows(ours, paine)
+    idx, how, score = match_rows(ours, paine)
     merged = ours.reset_index(drop=True).copy()
     for c in ("eRO", "eRD", "eRT"):
         merged[c] = [paine.loc[i, c] if i >= 0 else np.nan for i in idx]
     merged["match"] = how
+    merged["match_score"] = score
     matched = merged.eRT.notna().to_numpy()
     print(f"  matched to Paine's published values: {matched.sum()}/{len(merged)} "
-          f"({(how=='exact').sum()} exact, {(how=='fuzzy').sum()} fuzzy)")
+          f"({(how=='exact').sum()} exact, {(how=='fuzzy').sum()} fuzzy, "
+          f"{(how=='ambiguous').sum()} ambiguous)")
     unmatched = sorted(merged.loc[~matched, "player"].unique())
     if unmatched:
         print(f"  unmatched ({len(unmatched)}): {unmatched[:15]}")
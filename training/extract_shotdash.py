@@ -13,12 +13,16 @@ Two blocks, aligned to combined.npz rows by (timestamp, season_type, player):
         time_poss_per36, sec_per_touch, drib_per_touch, touches_per36
 
 Run:  python training/extract_shotdash.py
+      python training/extract_shotdash.py --store training/store
 """
 
+import argparse
+
 import numpy as np
 
 from db import REPO_ROOT, get_collection
 from coverage import as_float
+from feature_store import FeatureStore
 
 TD = REPO_ROOT / "training"
 TABLES = ("shots-def0-2", "shots-def2-4", "shots-def4-6", "shots-def6plus",
@@ -29,21 +33,41 @@ COVER_W = {"shots-def0-2": 1.00, "shots-def2-4": 0.80,
            "shots-def4-6": 0.57, "shots-def6plus": 0.31}
 
 
-def main():
-    d = np.load(TD / "data_fixed" / "combined.npz", allow_pickle=True)
-    players, tss, sts = d["player"], d["timestamp"], d["season_type"]
-    mp = d["mp"].astype(np.float64)
-    n = len(players)
-    coll = get_collection()
-
+def read_docs(coll=None, store=None):
+    """-> ({(ts, st, name): {table: doc}}, {table: stat columns}), from Mongo or a
+    feature_store.FeatureStore."""
     docs = {}          # (ts, st, name) -> {table: doc}
     cols = {t: set() for t in TABLES}
+    if store is not None:
+        for ts, st in store.cells("nba-shotdash"):
+            c = store.cell("nba-shotdash", ts, st)
+            for t in TABLES:
+                rows = c["sub"] == t
+                cols[t].update(str(f) for f in c["fields"][
+                    np.isfinite(c["X"][rows]).any(axis=0)])
+                for name, doc in store.docs("nba-shotdash", ts, st, sub=t).items():
+                    docs.setdefault((ts, st, str(name)), {})[t] = doc
+        return docs, cols
     for doc in coll.find({"source": "nba-shotdash"}):
         key = (str(doc["timestamp"]), str(doc["season_type"]),
                str(doc["standard_name"]))
         docs.setdefault(key, {})[doc["data_type"]] = doc
         cols[doc["data_type"]].update(k for k in doc if k not in META)
-    print(f"{len(docs)} (cell, player) entries from Mongo", flush=True)
+    return docs, cols
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--store", help="feature_store.py directory to read instead of Mongo")
+    args = ap.parse_args()
+    d = np.load(TD / "data_fixed" / "combined.npz", allow_pickle=True)
+    players, tss, sts = d["player"], d["timestamp"], d["season_type"]
+    mp = d["mp"].astype(np.float64)
+    n = len(players)
+    store = FeatureStore(args.store) if args.store else None
+    docs, cols = read_docs(None if store else get_collection(), store)
+    print(f"{len(docs)} (cell, player) entries from "
+          f"{args.store or 'Mongo'}", flush=True)
 
     names_r = [f"sd:{t}|{c}" for t in TABLES for c in sorted(cols[t])]
     slot = {nm: j for j, nm in enumerate(names_r)}
@@ -5,52 +5,64 @@ documents and lays their 229 stat fields out as two matrices. Playoff rows get N
 throughout -- the opponent scrape was regular-season only, as is production.
 
 Output: data_fixed/wowyopp.npz with on_X, off_X (n_rows x n_fields), fields.
+--store DIR reads the documents from a feature_store.py directory instead of Mongo.
 """
 
+import argparse
 import sys
 import numpy as np
 
 sys.path.insert(0, "..")
-from coverage import as_float
+from coverage import docs_to_matrix
 from db import get_collection
+from feature_store import FeatureStore
 
 KEYS = {"_id", "name", "standard_name", "team", "n_stints", "source",
         "timestamp", "season_type", "on_or_off"}
 
 d = np.load("data_fixed/combined.npz", allow_pickle=True)
 players, tss, sts = d["player"], d["timestamp"], d["season_type"]
-coll = get_collection()
+ap = argparse.ArgumentParser()
+ap.add_argument("--store", help="feature_store.py directory to read instead of Mongo")
+args = ap.parse_args()
+store = FeatureStore(args.store) if args.store else None
+coll = None if store else get_collection()
 
-# field universe from a sample of docs
+# field universe from a sample of docs (every synced cell's, from a store)
 fields = set()
-for doc in coll.find({"source": "wowy-opp"}).limit(300):
-    fields.update(k for k in doc if k not in KEYS)
+if store:
+    for ts, st in store.cells("wowy-opp"):
+        fields.update(str(f) for f in store.cell("wowy-opp", ts, st)["fields"])
+else:
+    for doc in coll.find({"source": "wowy-opp"}).limit(300):
+        fields.update(k for k in doc if k not in KEYS)
 fields = sorted(fields)
-fi = {f: i for i, f in enumerate(fields)}
 print(f"{len(fields)} opponent stat fields")
 
 on_X = np.full((len(players), len(fields)), np.nan, dtype=np.float32)
 off_X = np.full((len(players), len(fields)), np.nan, dtype=np.float32)
 
 cache = {}
+row_docs = {"on": [], "off": []}
 for i, (p, ts, st) in enumerate(zip(players, tss, sts)):
     key = (str(ts), str(st))
     if key not in cache:
         cell = {}
-        for doc in coll.find({"source": "wowy-opp", "timestamp": str(ts),
-                              "season_type": str(st)}):
-            cell[(doc["standard_name"], doc["on_or_off"])] = doc
+        if store:
+            for side in ("on", "off"):
+                for name, doc in store.docs("wowy-opp", *key, sub=side).items():
+                    cell[(name, side)] = doc
+        else:
+            for doc in coll.find({"source": "wowy-opp", "timestamp": str(ts),
+                                  "season_type": str(st)}):
+                cell[(doc["standard_name"], doc["on_or_off"])] = doc
         cache[key] = cell
         if cell:
             print(f"  cell {key}: {len(cell)} docs", flush=True)
-    for side, M in (("on", on_X), ("off", off_X)):
-        doc = cache[key].get((str(p), side))
-        if doc:
-            for k, v in doc.items():
-                if k in fi:
-                    x = as_float(v)
-                    if x is not None:
-                        M[i, fi[k]] = x
+    for side in ("on", "off"):
+        row_docs[side].append(cache[key].get((str(p), side)))
+docs_to_matrix(row_docs["on"], fields, out=on_X)
+docs_to_matrix(row_docs["off"], fields, out=off_X)
 
 n_on = np.isfinite(on_X).any(axis=1).sum()
 print(f"rows with opponent data: {n_on}/{len(players)}")
@@ -0,0 +1,223 @@
+"""A local, numeric mirror of the Mongo sources, one file per cell.
+
+Every build re-read raw per-player documents from Atlas and re-parsed their strings
+through as_float, so the same 4.2M documents crossed the network for each experiment.
+This materializes each source once into training/store/<source>/<ts>_<season_type>.npz:
+
+  player   standard_name per row
+  sub      data_type or on_or_off (the rest of the upsert key), "" where there is none
+  fields   stat field names, the union over the cell's documents
+  X        float32 (rows x fields), as_float already applied, NaN where absent
+  text     the few string fields callers read (pos, team, label_season), per row
+
+Rows are deduplicated with pick_doc before they are written, so a reader never sees
+the repeat inserts the collection still holds.
+
+Feature readers take --store DIR to read it in place of Mongo: build_dataset.py,
+predict_seasons.py, final_boards.py, extract_wowyopp.py and extract_shotdash.py.
+Only the feature blocks move. 538 labels (labels.py, which caches them on disk),
+timestamp selection and positions are still queried from Mongo, as is
+experiment_defend.py, so a --store build still needs a connection -- it just pulls
+kilobytes instead of the feature documents.
+
+Sync is incremental. manifest.json records, per source and cell, the max _id and the
+document count at the last sync; a cell is re-pulled only when either moved. A
+ReplaceOne upsert keeps the _id of the row it replaces, so a re-scrape that rewrites a
+cell in place without adding rows is invisible to the watermark -- purge_cell.py plus
+a re-scrape moves it, or pass --force.
+
+Run:  python training/feature_store.py                  # sync every source
+      python training/feature_store.py --source wowy-opp
+      python training/build_dataset.py --store training/store
+"""
+
+import argparse
+import json
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from coverage import ID_FIELDS, as_float, pick_doc
+from db import REPO_ROOT, get_collection
+
+STORE_DIR = REPO_ROOT / "training" / "store"
+
+SOURCES = ["pbp", "wowy", "wowy-opp", "nba-tracking", "nba-defend", "nba-shotdash"]
+# The upsert key past (source, timestamp, season_type, standard_name); see
+# scraping/mongo_sink.KEY_FIELDS.
+SUB_KEY = {"wowy": "on_or_off", "wowy-opp": "on_or_off", "nba-tracking": "data_type",
+           "nba-defend": "data_type", "nba-shotdash": "data_type"}
+# Strings worth keeping: 538's position and team, and the season labels.py selects on.
+TEXT_FIELDS = ("pos", "team", "label_season")
+
+
+def cell_name(ts, season_type):
+    return f"{ts}_{season_type.replace(' ', '_')}"
+
+
+def cell_arrays(docs, source):
+    """Documents for one (source, cell) -> the arrays one store file holds."""
+    sub_key = SUB_KEY.get(source)
+    grp = defaultdict(list)
+    for d in docs:
+        grp[(d["standard_name"], d.get(sub_key, "") if sub_key else "")].append(d)
+    keys = sorted(grp)
+    picked = [pick_doc(grp[k]) for k in keys]
+
+    fields = sorted({k for d in picked for k, v in d.items()
+                     if k not in ID_FIELDS and as_float(v) is not None})
+    fi = {f: j for j, f in enumerate(fields)}
+    X = np.full((len(picked), len(fields)), np.nan, dtype=np.float32)
+    text = np.full((len(picked), len(TEXT_FIELDS)), "", dtype=object)
+    for i, d in enumerate(picked):
+        for k, v in d.items():
+            j = fi.get(k)
+            if j is not None:
+                x = as_float(v)
+                if x is not None:
+                    X[i, j] = x
+        for j, k in enumerate(TEXT_FIELDS):
+            if d.get(k) is not None:
+                text[i, j] = str(d[k])
+    return {"player": np.array([k[0] for k in keys], dtype=object),
+            "sub": np.array([k[1] for k in keys], dtype=object),
+            "fields": np.array(fields, dtype=object), "X": X, "text": text}
+
+
+class FeatureStore:
+    """Reader and incremental writer for the store directory."""
+
+    def __init__(self, root=STORE_DIR):
+        self.root = Path(root)
+        self._cells = {}
+
+    @property
+    def manifest_path(self):
+        return self.root / "manifest.json"
+
+    def manifest(self):
+        if self.manifest_path.exists():
+            return json.loads(self.manifest_path.read_text())
+        return {}
+
+    def path(self, source, ts, season_type):
+        return self.root / source / f"{cell_name(ts, season_type)}.npz"
+
+    # ------------------------------------------------------------------ sync
+    def stale_cells(self, coll, source, force=False):
+        """(ts, season_type, watermark) for every cell whose watermark moved."""
+        seen = self.manifest().get(source, {})
+        pipe = [{"$match": {"source": source}},
+                {"$group": {"_id": {"ts": "$timestamp", "st": "$season_type"},
+                            "max_id": {"$max": "$_id"}, "n": {"$sum": 1}}}]
+        out = []
+        for r in coll.aggregate(pipe, allowDiskUse=True):
+            ts, st = r["_id"]["ts"], r["_id"]["st"]
+            mark = {"max_id": str(r["max_id"]), "n": r["n"]}
+            if force or seen.get(cell_name(ts, st)) != mark:
+                out.append((ts, st, mark))
+        return sorted(out, key=lambda c: (c[0], c[1]))
+
+    def sync(self, coll, sources=SOURCES, force=False):
+        """Re-pull every stale cell of each source. -> {source: n_cells_written}."""
+        manifest = self.manifest()
+        written = {}
+        for source in sources:
+            stale = self.stale_cells(coll, source, force)
+            print(f"[{source}] {len(stale)} cell(s) to sync", flush=True)
+            for ts, st, mark in stale:
+                docs = list(coll.find({"source": source, "timestamp": ts,
+                                       "season_type": st}))
+                arrays = cell_arrays(docs, source)
+                p = self.path(source, ts, st)
+                p.parent.mkdir(parents=True, exist_ok=True)
+                np.savez_compressed(p, **arrays)
+                self._cells.pop((source, ts, st), None)
+                # Record each cell as it lands, so an interrupted sync resumes.
+                manifest.setdefault(source, {})[cell_name(ts, st)] = mark
+                self.manifest_path.write_text(json.dumps(manifest, indent=1,
+                                                         sort_keys=True))
+                print(f"  {ts} {st:<15} {len(docs):>5} docs -> "
+                      f"{arrays['X'].shape[0]} rows x {arrays['X'].shape[1]} fields")
+            written[source] = len(stale)
+        return written
+
+    # ------------------------------------------------------------------ read
+    def cells(self, source):
+        """(ts, season_type) of every synced cell of source."""
+        out = []
+        for name in self.manifest().get(source, {}):
+            ts, st = name.split("_", 1)
+            out.append((ts, st.replace("_", " ")))
+        return sorted(out)
+
+    def cell(self, source, ts, season_type):
+        """The arrays for one (source, cell), or None if it was never synced."""
+        key = (source, ts, season_type)
+        if key not in self._cells:
+            p = self.path(source, ts, season_type)
+            if not p.exists():
+                self._cells[key] = None
+            else:
+                with np.load(p, allow_pickle=True) as z:
+                    self._cells[key] = {k: z[k] for k in z.files}
+        return self._cells[key]
+
+    def docs(self, source, ts, season_type, sub=None, fields=None):
+        """-> {standard_name: doc} for one cell, rebuilt as dicts of floats.
+
+        The dicts carry the same keys a Mongo document would for the fields they
+        hold, so code written against find() results reads them unchanged.
+        """
+        c = self.cell(source, ts, season_type)
+        if c is None:
+            return {}
+        names = list(c["fields"])
+        want = None if fields is None else set(fields)
+        cols = [j for j, f in enumerate(names) if want is None or f in want]
+        sub_key = SUB_KEY.get(source)
+        out = {}
+        for i in np.flatnonzero(c["sub"] == sub) if sub is not None else range(
+                len(c["player"])):
+            row = c["X"][i]
+            d = {names[j]: float(row[j]) for j in cols if row[j] == row[j]}
+            d.update({k: c["text"][i, j] for j, k in enumerate(TEXT_FIELDS)
+                      if c["text"][i, j]})
+            d.update(standard_name=c["player"][i], source=source,
+                     timestamp=ts, season_type=season_type)
+            if sub_key:
+                d[sub_key] = c["sub"][i]
+            out[c["player"][i]] = d
+        return out
+
+    def fetch_blocks(self, ts, season_type, specs, players=None, fields=None):
+        """Offline counterpart of coverage.fetch_blocks, same arguments and result."""
+        out = defaultdict(dict)
+        for block, q in specs.items():
+            sub_key = SUB_KEY.get(q["source"])
+            got = self.docs(q["source"], ts, season_type,
+                            sub=q.get(sub_key) if sub_key else None,
+                            fields=None if fields is None else fields.get(block, ()))
+            for name, d in got.items():
+                if players is None or name in players:
+                    out[name][block] = d
+        return dict(out)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--source", action="append", choices=SOURCES,
+                    help="sync only this source (repeatable); default all")
+    ap.add_argument("--store", default=str(STORE_DIR))
+    ap.add_argument("--force", action="store_true",
+                    help="re-pull every cell, not just those whose watermark moved")
+    args = ap.parse_args()
+
+    store = FeatureStore(args.store)
+    written = store.sync(get_collection(), args.source or SOURCES, args.force)
+    print("\n" + "  ".join(f"{s}={n}" for s, n in written.items()))
+
+
+if __name__ == "__main__":
+    main()
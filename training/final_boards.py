@@ -21,8 +21,10 @@ verification section reports what these exact fitted models score on the held-ou
 2013-14/2014-15 cells, and the LOSO statistics say how that generalizes.
 
 Run:  python training/final_boards.py
+      python training/final_boards.py --store training/store
 """
 
+import argparse
 import gc
 import json
 from collections import defaultdict
@@ -34,7 +36,7 @@ from sklearn.linear_model import Ridge, RidgeCV
 from sklearn.model_selection import GroupKFold
 
 import experiment_pairwise as EP
-from coverage import as_float
+from coverage import docs_to_matrix
 from db import REPO_ROOT, get_collection
 from experiment_combined import prepare, splits
 from experiment_components import (COMPONENT_LABELS, RELATIVE_COLS, cell_relative,
@@ -42,6 +44,7 @@ from experiment_components import (COMPONENT_LABELS, RELATIVE_COLS, cell_relativ
 from experiment_defend import extract as extract_defend
 from experiment_oppdef import engineered, per100
 from experiment_topk_rank import ranks, score_cells
+from feature_store import FeatureStore
 from predict_seasons import (DROP_FEATURES, build_unlabeled, carry_over_positions,
                              impute_positions)
 from seasons import UNLABELED_SNAPSHOTS
@@ -60,28 +63,26 @@ WOPP_KEYS = {"_id", "name", "standard_name", "team", "n_stints", "source",
              "timestamp", "season_type", "on_or_off"}
 
 
-def extract_wowyopp_for(coll, meta, fields):
-    fi = {f: i for i, f in enumerate(fields)}
-    on = np.full((len(meta), len(fields)), np.nan, dtype=np.float32)
-    off = np.full((len(meta), len(fields)), np.nan, dtype=np.float32)
+def extract_wowyopp_for(coll, meta, fields, store=None):
     cache = {}
-    for i, m in enumerate(meta):
+    row_docs = {"on": [], "off": []}
+    for m in meta:
         key = (m["timestamp"], m["season_type"])
         if key not in cache:
             cell = {}
-            for doc in coll.find({"source": "wowy-opp", "timestamp": key[0],
-                                  "season_type": key[1]}):
-                cell[(doc["standard_name"], doc["on_or_off"])] = doc
+            if store is not None:
+                for side in ("on", "off"):
+                    for name, doc in store.docs("wowy-opp", *key, sub=side).items():
+                        cell[(name, side)] = doc
+            else:
+                for doc in coll.find({"source": "wowy-opp", "timestamp": key[0],
+                                      "season_type": key[1]}):
+                    cell[(doc["standard_name"], doc["on_or_off"])] = doc
             cache[key] = cell
-        for side, M in (("on", on), ("off", off)):
-            doc = cache[key].get((m["player"], side))
-            if doc:
-                for k, v in doc.items():
-                    if k in fi:
-                        x = as_float(v)
-                        if x is not None:
-                            M[i, fi[k]] = x
-    return on, off
+        for side in ("on", "off"):
+            row_docs[side].append(cache[key].get((m["player"], side)))
+    return (docs_to_matrix(row_docs["on"], fields),
+            docs_to_matrix(row_docs["off"], fields))
 
 
 def lgbm_ridge_members(Xtr, t, Xte, med, params, rounds, seeds=SEEDS, ridge_w=0.25):
@@ -98,7 +99,13 @@ def lgbm_ridge_members(Xtr, t, Xte, med, params, rounds, seeds=SEEDS, ridge_w=0.
 
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--store", default=None,
+                    help="read feature blocks from this feature_store.py directory "
+                         "instead of Mongo (sync it first)")
+    args = ap.parse_args()
     coll = get_collection()
+    store = FeatureStore(args.store) if args.store else None
     X0, feat0, d = prepare(str(REPO_ROOT / "training" / "data_fixed"))
     raw_names = list(d["feat_names"])
     raw_keep = [i for i, n in enumerate(raw_names) if n not in DROP_FEATURES]
@@ -112,7 +119,7 @@ def main():
     ofields = [str(f) for f in oppz["fields"]]
 
     print("building unlabeled 2023-26 matrix ...", flush=True)
-    Xn, meta = build_unlabeled(coll, raw_feat, list(UNLABELED_SNAPSHOTS))
+    Xn, meta = build_unlabeled(coll, raw_feat, list(UNLABELED_SNAPSHOTS), store)
     carry_over_positions(coll, meta)
     impute_positions(d["X"], d["pos"], Xn, meta)
     meta_rs = np.array([m["season_type"] == "Regular season" for m in meta])
@@ -132,7 +139,7 @@ def main():
 
     # opponent + defend features for the unlabeled rows, fresh from Mongo --------
     print("extracting opponent + defend features for 2023-26 ...", flush=True)
-    on_n, off_n = extract_wowyopp_for(coll, meta, ofields)
+    on_n, off_n = extract_wowyopp_for(coll, meta, ofields, store)
     on_j = np.vstack([oppz["on_X"], on_n])
     off_j = np.vstack([oppz["off_X"], off_n])
     Eopp_j, _ = engineered(on_j, off_j, ofields, cells_joint)
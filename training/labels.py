@@ -26,7 +26,12 @@ Two lookup modes, because the two kinds of cell mean different things:
                   2018-19, 2019-20 and 2020-21 as usable labeled seasons.
 """
 
+import json
+import re
 from collections import defaultdict
+from pathlib import Path
+
+from coverage import as_float
 
 # Feature season -> the whole-season cell that should carry it. Their features and
 # their labels sit under different timestamps; see the module docstring.
@@ -43,7 +48,61 @@ SEASON_WIDE = {
     "20230715000000": "2022-23",
 }
 
+# Label lookups outlive the process. Every build used to rescan tens of thousands of
+# 538 documents to pick the same tables again; now each answer is written under
+# CACHE_DIR the first time it is computed and read back after that.
+#
+# The whole directory is keyed on the newest 538 _id. A scrape that lands new label
+# documents moves it and the next lookup starts from empty. An in-place rewrite does
+# not -- migrate_label_season.py stamps label_season onto existing documents without
+# changing their _id -- so after a migration like that, call clear_cache() or delete
+# the directory.
+CACHE_DIR = Path(__file__).resolve().parent / "_label_cache"
+
 _cache = {}
+_checked = []
+
+
+def _watermark(coll):
+    d = coll.find_one({"source": "538"}, {"_id": 1}, sort=[("_id", -1)])
+    return str(d["_id"]) if d else ""
+
+
+def clear_cache():
+    _cache.clear()
+    _checked.clear()
+    if CACHE_DIR.exists():
+        for p in CACHE_DIR.glob("*.json"):
+            p.unlink()
+        (CACHE_DIR / "WATERMARK").unlink(missing_ok=True)
+
+
+def _cached(coll, name, compute):
+    """compute()'s JSON-able result, from memory, then disk, then Mongo."""
+    if name in _cache:
+        return _cache[name]
+    if not _checked:
+        mark_path = CACHE_DIR / "WATERMARK"
+        mark = _watermark(coll)
+        if not mark_path.exists() or mark_path.read_text() != mark:
+            clear_cache()
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            mark_path.write_text(mark)
+        _checked.append(mark)
+    path = CACHE_DIR / (re.sub(r"[^\w.-]+", "_", name) + ".json")
+    if path.exists():
+        _cache[name] = json.loads(path.read_text())
+    else:
+        _cache[name] = compute()
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(_cache[name], default=str))
+        tmp.replace(path)
+    return _cache[name]
+
+
+def _plain(d):
+    # ObjectId does not survive json.dumps; nothing downstream reads it as one.
+    return {k: (str(v) if k == "_id" else v) for k, v in d.items()}
 
 
 def best_season_table(coll, season, season_type):
@@ -52,16 +111,22 @@ def best_season_table(coll, season, season_type):
     538 reissued the same finished-season table under many later captures; they
     agree, so 'most rows' just picks the one that was fully scraped.
     """
-    key = (season, season_type)
-    if key in _cache:
-        return _cache[key]
+    return season_table(coll, season, season_type)["rows"]
+
+
+def season_table(coll, season, season_type):
+    """-> {"timestamp", "minutes", "rows"} for best_season_table's pick."""
+    return _cached(coll, f"season_{season}_{season_type}",
+                   lambda: _pick_season_table(coll, season, season_type))
+
+
+def _pick_season_table(coll, season, season_type):
     by_ts = defaultdict(dict)
     for d in coll.find({"source": "538", "label_season": season,
                         "season_type": season_type}):
-        by_ts[d["timestamp"]].setdefault(d["standard_name"], d)
+        by_ts[d["timestamp"]].setdefault(d["standard_name"], _plain(d))
     if not by_ts:
-        _cache[key] = {}
-        return {}
+        return {"timestamp": None, "minutes": 0.0, "rows": {}}
 
     # Total minutes, not row count. 538 republished the same season under hundreds
     # of captures, some taken while it was still being played -- those can carry
@@ -69,18 +134,10 @@ def best_season_table(coll, season, season_type):
     # season's minutes are fully accumulated. Picking by row count instead left the
     # 2020-21 cell 8.4% short against its own features; by minutes it is exact.
     def total_minutes(table):
-        tot = 0.0
-        for d in table.values():
-            v = str(d.get("mp") or "").replace(",", "")
-            try:
-                tot += float(v)
-            except ValueError:
-                pass
-        return tot
+        return sum(as_float(d.get("mp")) or 0.0 for d in table.values())
 
-    best = max(by_ts.values(), key=lambda t: (total_minutes(t), len(t)))
-    _cache[key] = best
-    return best
+    ts, best = max(by_ts.items(), key=lambda kv: (total_minutes(kv[1]), len(kv[1])))
+    return {"timestamp": ts, "minutes": total_minutes(best), "rows": best}
 
 
 def aligned_timestamps(coll, season_of_ts):
@@ -94,11 +151,8 @@ def aligned_timestamps(coll, season_of_ts):
     Filtering before the stride means the stride spends its budget on cells that can
     actually yield rows.
     """
-    pipe = [{"$match": {"source": "538"}},
-            {"$group": {"_id": {"ts": "$timestamp", "ls": "$label_season"}}}]
     out = set()
-    for r in coll.aggregate(pipe, allowDiskUse=True):
-        ts, ls = r["_id"]["ts"], r["_id"]["ls"]
+    for ts, ls in label_seasons(coll):
         try:
             if ls and season_of_ts(ts) == ls:
                 out.add(ts)
@@ -107,14 +161,66 @@ def aligned_timestamps(coll, season_of_ts):
     return out
 
 
+def label_seasons(coll):
+    """Every (timestamp, label_season) pair among the 538 documents."""
+    def compute():
+        pipe = [{"$match": {"source": "538"}},
+                {"$group": {"_id": {"ts": "$timestamp", "ls": "$label_season"}}}]
+        return sorted(([r["_id"]["ts"], r["_id"].get("ls")]
+                       for r in coll.aggregate(pipe, allowDiskUse=True)),
+                      key=lambda p: (p[0], p[1] or ""))
+    return [tuple(p) for p in _cached(coll, "label_seasons", compute)]
+
+
+def snapshot_table(coll, ts, season_type):
+    """-> {standard_name: 538 doc} for every document at this timestamp, any season."""
+    def compute():
+        out = {}
+        for d in coll.find({"source": "538", "timestamp": ts,
+                            "season_type": season_type}):
+            out.setdefault(d["standard_name"], _plain(d))
+        return out
+    return _cached(coll, f"snapshot_{ts}_{season_type}", compute)
+
+
+def min_minutes(coll, ts, season_type):
+    """Lowest positive minutes on any 538 document at this timestamp, or None."""
+    def compute():
+        v = []
+        for d in coll.find({"source": "538", "timestamp": ts,
+                            "season_type": season_type}, {"mp": 1, "_id": 0}):
+            x = as_float(d.get("mp"))
+            if x:
+                v.append(x)
+        return min(v) if v else None
+    return _cached(coll, f"minmp_{ts}_{season_type}", compute)
+
+
+def latest_positions(coll):
+    """-> {standard_name: [timestamp, pos]} from the newest 538 capture listing one."""
+    def compute():
+        latest = {}
+        for d in coll.find({"source": "538"}, {"standard_name": 1, "pos": 1,
+                                               "timestamp": 1, "_id": 0}):
+            if not d.get("pos"):
+                continue
+            prev = latest.get(d["standard_name"])
+            if prev is None or d["timestamp"] > prev[0]:
+                latest[d["standard_name"]] = [d["timestamp"], d["pos"]]
+        return latest
+    return _cached(coll, "positions", compute)
+
+
 def labels_for(coll, ts, season_type, feature_season):
     """-> {standard_name: 538 doc} for this cell, or {} if there is no honest match."""
     if SEASON_WIDE.get(ts):
         return best_season_table(coll, SEASON_WIDE[ts], season_type)
 
-    out = {}
-    for d in coll.find({"source": "538", "timestamp": ts,
-                        "season_type": season_type,
-                        "label_season": feature_season}):
-        out.setdefault(d["standard_name"], d)
-    return out
+    def compute():
+        out = {}
+        for d in coll.find({"source": "538", "timestamp": ts,
+                            "season_type": season_type,
+                            "label_season": feature_season}):
+            out.setdefault(d["standard_name"], _plain(d))
+        return out
+    return _cached(coll, f"cell_{ts}_{season_type}_{feature_season}", compute)
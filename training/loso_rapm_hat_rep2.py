@@ -6,7 +6,7 @@ the size that has fooled this project before. Ten-fold season-held-out CV
 decides, with strict per-fold hygiene:
 
   RAPM pool   for a held-out season inside the 2013-19 window, the pooled RAPM
-              target is REFIT from the cached possession files with that
+              target is REFIT from the cached possession store with that
               season's possessions excluded (fixed lambda 0.01, the value
               RidgeCV chose for both full pools). Held-out seasons outside the
               window use the full 6-year pool.
@@ -23,13 +23,11 @@ Run:  python training/loso_rapm_hat.py
 """
 
 import json
-from pathlib import Path
 
 import lightgbm as lgb
 import numpy as np
 import pandas as pd
-from scipy import sparse as sp
-from sklearn.linear_model import Ridge, RidgeCV
+from sklearn.linear_model import RidgeCV
 from sklearn.model_selection import GroupKFold
 
 from db import REPO_ROOT
@@ -37,6 +35,9 @@ from estimated_raptor import norm_name
 from experiment_combined import prepare, splits
 from experiment_components import RELATIVE_COLS, cell_relative
 from experiment_topk_rank import score_cells
+import poss_store
+import possessions as P
+import rapm_solver
 from predict_seasons import DROP_FEATURES
 from train_rapture import TARGETS
 
@@ -45,7 +46,6 @@ MIN_POSS = 4000
 LAM = 0.01
 SEEDS = (20, 21, 22)
 TD = REPO_ROOT / "training"
-BUILD = Path("/tmp/rapm_build")
 WIN = {"2013-14": 2013, "2014-15": 2014, "2015-16": 2015, "2016-17": 2016,
        "2017-18": 2017, "2018-19": 2018}
 STAMPS = {"2013-14": "20140715000000", "2014-15": "20150715000000",
@@ -55,28 +55,12 @@ STAMPS = {"2013-14": "20140715000000", "2014-15": "20150715000000",
           "2021-22": "20220715000000", "2022-23": "20230715000000"}
 
 
-def fit_pool(poss):
-    players = sorted(set(np.unique(poss[[f"o{i}" for i in range(5)]].values))
-                     | set(np.unique(poss[[f"d{i}" for i in range(5)]].values)))
-    pidx = {p: i for i, p in enumerate(players)}
-    P, n = len(players), len(poss)
-    rows = np.repeat(np.arange(n), 10)
-    cols = np.empty(n * 10, dtype=np.int64)
-    vals = np.empty(n * 10, dtype=np.float64)
-    O = poss[[f"o{i}" for i in range(5)]].values
-    D = poss[[f"d{i}" for i in range(5)]].values
-    for j in range(5):
-        cols[j::10] = [pidx[p] for p in O[:, j]]
-        vals[j::10] = 1.0
-        cols[5 + j::10] = [pidx[p] + P for p in D[:, j]]
-        vals[5 + j::10] = -1.0
-    X = sp.csr_matrix((vals, (rows, cols)), shape=(n, 2 * P))
-    y = 100.0 * poss["pts"].values.astype(np.float64)
-    model = Ridge(alpha=(LAM * n) / 2.0, fit_intercept=True).fit(X, y)
-    d_coef = model.coef_[P:]
-    cnt = np.bincount(cols[np.tile(np.arange(10) >= 5, n)] - P, minlength=P)
-    d_coef = d_coef - np.average(d_coef, weights=np.maximum(cnt, 1))
-    return {str(p): (v, c) for p, v, c in zip(players, d_coef, cnt)}
+def fit_pool(design, mask=None, x0=None):
+    """Defensive RAPM over the possessions in mask at LAM. -> ({player id:
+    (drapm, defensive possessions)}, coefficients to start the next pool from)."""
+    coef = rapm_solver.fit(design, LAM, mask, x0)
+    players, _, d_coef, _, cnt = rapm_solver.ratings(design, coef, mask)
+    return {str(p): (v, c) for p, v, c in zip(players, d_coef, cnt)}, coef
 
 
 def lgbm_ridge_members(Xtr, t, Xte, med, params, rounds, seeds=SEEDS,
@@ -111,7 +95,8 @@ def main():
     params = dict(tuned["defense"]["params"], verbose=-1)
     rounds = max(tuned["defense"]["rounds"] // 3, 150)
 
-    frames = {s: pd.read_csv(BUILD / f"poss_{s}.csv")
+    # one row per matchup and season: a season left out is a mask over them
+    frames = {s: P.stints(poss_store.load(s).frame())
               for s in (2013, 2014, 2015, 2016, 2017, 2018)}
     # id -> standard name (as in build_rapm)
     names = {}
@@ -122,11 +107,11 @@ def main():
 
     pools = {}
     full = pd.concat(frames.values(), ignore_index=True)
-    pools["full"] = fit_pool(full)
+    year = np.repeat(list(frames), [len(v) for v in frames.values()])
+    design = rapm_solver.Design.from_stints(full)
+    pools["full"], coef = fit_pool(design)
     for season, yr in WIN.items():
-        sub = pd.concat([v for k, v in frames.items() if k != yr],
-                        ignore_index=True)
-        pools[season] = fit_pool(sub)
+        pools[season], _ = fit_pool(design, year != yr, coef)
         print(f"pool ex-{season}: {len(pools[season])} players", flush=True)
 
     per_season = {}
@@ -0,0 +1,179 @@
+"""Parsed possessions on disk as memory-mappable .npy arrays, one directory a season.
+
+build_rapm cached poss_<season>.csv and parse_attrib wrote attrib_poss_<season>.csv
+and attrib_events_<season>.csv -- the same possessions twice, as text -- and
+posmatch, posmatch2, courtmate, courtmate_chain and the three loso_rapm_hat scripts
+each pd.read_csv'd them back, a few seconds and a few hundred MB per season every
+time. Here a season is STORE_DIR/<season>/:
+
+  off.npy, def.npy   int32 (n, 5)   the offense's and the defense's five player ids
+  pts.npy            int8  (n,)     points the offense scored
+  period.npy         int8  (n,)     period of the possession's last event
+  games.npy          int32 (g,)     GAME_IDs, in order
+  game_ptr.npy       int64 (g + 1,) game k's possessions: game_ptr[k]:game_ptr[k+1]
+  ev_ptr.npy         int64 (n + 1,) possession i's events are ev_ptr[i]:ev_ptr[i+1]
+  ev_kind.npy        int8           index into possessions.KINDS
+  ev_player.npy      int32
+  ev_value.npy       int8
+
+load() maps every array read-only (np.load mmap_mode="r"), so opening a season
+parses nothing and processes reading the same season share its pages. Season.frame()
+and Season.events() give back the old CSVs' columns for code that wants a frame.
+
+Seasons converted from old CSVs have no game index (poss_<season>.csv had none)
+and, from poss_<season>.csv alone, no events; Season.games and Season.ev_ptr are
+then None.
+
+Run:  python training/poss_store.py --convert     # old CSVs in BUILD -> STORE_DIR
+      python training/poss_store.py               # what the store holds
+"""
+
+import argparse
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from possessions import EVENT_COLS, INDEX_COLS, KINDS, POSS_COLS
+
+BUILD = Path("/tmp/rapm_build")
+STORE_DIR = BUILD / "store"
+
+_OFF, _DEF = POSS_COLS[:5], POSS_COLS[5:10]
+
+
+def path(season, root=STORE_DIR):
+    return Path(root) / str(season)
+
+
+def exists(season, root=STORE_DIR, events=False):
+    p = path(season, root)
+    return (p / "pts.npy").exists() and (not events or (p / "ev_ptr.npy").exists())
+
+
+def save(season, poss, events=None, root=STORE_DIR):
+    """Write possessions.parse()'s frames (events optional) as season's directory,
+    replacing it whole: it is written beside the old one and swapped in."""
+    p = path(season, root)
+    tmp = p.with_name(p.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    arrays = {"off": poss[_OFF].to_numpy(np.int32),
+              "def": poss[_DEF].to_numpy(np.int32),
+              "pts": poss["pts"].to_numpy(np.int8)}
+    if all(c in poss for c in INDEX_COLS):
+        game = poss["game"].to_numpy(np.int64)
+        starts = np.flatnonzero(np.r_[True, game[1:] != game[:-1]]) if len(game) \
+            else np.zeros(0, np.int64)
+        arrays.update(period=poss["period"].to_numpy(np.int8),
+                      games=game[starts].astype(np.int32),
+                      game_ptr=np.r_[starts, len(game)].astype(np.int64))
+    if events is not None:
+        idx = events["poss_idx"].to_numpy(np.int64)
+        arrays.update(
+            ev_ptr=np.searchsorted(idx, np.arange(len(poss) + 1)).astype(np.int64),
+            ev_kind=pd.Categorical(events["kind"], categories=KINDS).codes
+            .astype(np.int8),
+            ev_player=events["player_id"].to_numpy(np.int32),
+            ev_value=events["value"].to_numpy(np.int8))
+    for name, a in arrays.items():
+        np.save(tmp / f"{name}.npy", a)
+    shutil.rmtree(p, ignore_errors=True)
+    tmp.rename(p)
+    return p
+
+
+class Season:
+    """One season's possessions, every array memory-mapped from its directory."""
+
+    def __init__(self, p, mmap=True):
+        self.path = Path(p)
+        mode = "r" if mmap else None
+
+        def arr(name):
+            f = self.path / f"{name}.npy"
+            return np.load(f, mmap_mode=mode) if f.exists() else None
+        self.off, self.defense, self.pts = arr("off"), arr("def"), arr("pts")
+        if self.pts is None:
+            raise FileNotFoundError(f"no possessions in {self.path}")
+        self.period, self.games, self.game_ptr = (arr("period"), arr("games"),
+                                                  arr("game_ptr"))
+        self.ev_ptr, self.ev_kind = arr("ev_ptr"), arr("ev_kind")
+        self.ev_player, self.ev_value = arr("ev_player"), arr("ev_value")
+
+    def __len__(self):
+        return len(self.pts)
+
+    def game(self):
+        """GAME_ID of every possession, or None without a game index."""
+        if self.games is None:
+            return None
+        return np.repeat(np.asarray(self.games), np.diff(self.game_ptr))
+
+    def frame(self):
+        """The possessions as a frame with the old CSVs' o0..o4, d0..d4, pts."""
+        df = pd.DataFrame(np.hstack([self.off, self.defense]).astype(np.int64),
+                          columns=_OFF + _DEF)
+        df["pts"] = np.asarray(self.pts, dtype=np.int64)
+        return df
+
+    def events(self):
+        """The attributed events as a frame with the old CSV's EVENT_COLS."""
+        if self.ev_ptr is None:
+            raise FileNotFoundError(f"no events in {self.path} (converted from "
+                                    f"poss_<season>.csv; re-run parse_attrib.py)")
+        return pd.DataFrame({
+            "poss_idx": np.repeat(np.arange(len(self)), np.diff(self.ev_ptr)),
+            "kind": np.asarray(KINDS)[np.asarray(self.ev_kind)],
+            "player_id": np.asarray(self.ev_player, dtype=np.int64),
+            "value": np.asarray(self.ev_value, dtype=np.int64)})[EVENT_COLS]
+
+
+def load(season, root=STORE_DIR, mmap=True):
+    return Season(path(season, root), mmap)
+
+
+def convert(build=BUILD, root=STORE_DIR):
+    """Old CSV caches in build -> the store, attrib files (with events) first.
+    -> the seasons converted."""
+    done = []
+    seasons = sorted({f.stem.rsplit("_", 1)[1]
+                      for f in Path(build).glob("*poss_*.csv")})
+    for season in seasons:
+        if exists(season, root, events=True):
+            continue
+        ap = Path(build) / f"attrib_poss_{season}.csv"
+        ae = Path(build) / f"attrib_events_{season}.csv"
+        pp = Path(build) / f"poss_{season}.csv"
+        if ap.exists() and ae.exists():
+            save(season, pd.read_csv(ap), pd.read_csv(ae), root)
+        elif pp.exists() and not exists(season, root):
+            save(season, pd.read_csv(pp), None, root)
+        else:
+            continue
+        done.append(season)
+        print(f"  {season}: {len(load(season, root)):,} possessions", flush=True)
+    return done
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--convert", action="store_true",
+                    help=f"convert the poss_/attrib_ CSVs in {BUILD} into the store")
+    ap.add_argument("--root", default=str(STORE_DIR))
+    args = ap.parse_args()
+    if args.convert:
+        print(f"converted {len(convert(root=args.root))} season(s)")
+    for p in sorted(Path(args.root).glob("[0-9]*")):
+        if p.suffix == ".tmp" or not (p / "pts.npy").exists():
+            continue
+        s = Season(p)
+        print(f"{p.name}: {len(s):>9,} possessions  "
+              f"{len(s.games) if s.games is not None else '-':>5} games  "
+              f"{s.ev_ptr[-1] if s.ev_ptr is not None else '-':>9} events  "
+              f"{sum(f.stat().st_size for f in p.glob('*.npy')) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Ryan Davis's possession rules as column operations over a whole season.
+
+build_rapm.parse_game and raptor2/parse_attrib.parse_game_attrib each walked
+list(g.iterrows()) and asked play_by_play_utils' predicates about one row at a time,
+several of which rescan the ten rows before or after it; add_time_elapsed was a
+DataFrame.apply(axis=1). That was most of the "~30-60 min" in build_rapm's
+docstring, and the two loops were copies of each other.
+
+Here the season frame -- every game's events with their lineups, each game's rows
+contiguous and in EVENTNUM order -- is parsed once:
+
+  masks      event types, "miss" / "3PT" in either description, team rebounds and
+             turnovers (PLAYER1_TEAM_ID empty: PLAYER1_ID is the team)
+  lookbacks  "the nearest miss / foul in the LOOKBACK rows before this one" is a
+             running maximum of flagged row numbers, checked against the distance
+             and the game's first row; the and-1 look-ahead is AND1_LOOKAHEAD
+             shifted comparisons
+  ends       turnover | made last free throw | defensive rebound | make that is
+             not an and-1 | end of period, exactly as the loop's or-chain, down to
+             its (IndexError -> not an end) on a game's first row
+  segments   a possession is the rows after the previous end up to and including
+             this one; one cumulative sum numbers them and reduceat finds each
+             one's last counted row, whose team and lineups the possession takes
+
+parse() returns the same (off5, def5, pts) rows and attributed scoring/rebound
+events the two loops did, in the same order. The lineups themselves still come
+from nba_on_court one game at a time; with_lineups() is that loop.
+
+No possession spans two games, so parsing runs of whole games separately and
+concatenating them in GAME_ID order is the same as parsing the season at once.
+pack() and unpack() carry a run's result between processes as int32/int8 arrays
+and renumber poss_idx on the way back (build_rapm --workers).
+
+Most possessions repeat a matchup already seen. stints() groups them into one row
+per matchup with its possession count, points and squared points -- all a
+squared-loss fit or a possession-weighted sum needs -- for rapm_solver and the
+courtmate chains to work on.
+"""
+
+import numpy as np
+import pandas as pd
+
+MADE, FREE_THROW, REBOUND, TURNOVER, FOUL, SUBSTITUTION, END_OF_PERIOD = (
+    1, 3, 4, 5, 6, 8, 13)
+# EVENTMSGACTIONTYPE of a free throw that is the last of its trip: 1 of 1, 2 of 2,
+# 3 of 3. Technical, flagrant and clear-path trips keep the ball and never end one.
+LAST_FREE_THROWS = (10, 12, 15)
+ONE_OF_ONE = 10
+# Fouls whose 1-of-1 leaves the ball with the shooting team: loose ball, inbound,
+# away from play.
+RETAINING_FOULS = (3, 5, 6)
+# play_by_play_utils looks this many rows back for a rebound's missed shot and a
+# free throw's foul, and at the next AND1_LOOKAHEAD rows for an and-1's free throw.
+LOOKBACK = 10
+AND1_LOOKAHEAD = 9
+
+HP = [f"HOME_PLAYER{i}" for i in range(1, 6)]
+AP = [f"AWAY_PLAYER{i}" for i in range(1, 6)]
+POSS_COLS = [f"o{i}" for i in range(5)] + [f"d{i}" for i in range(5)] + ["pts"]
+# Where each possession happened: its GAME_ID and the period of its last event.
+INDEX_COLS = ["game", "period"]
+EVENT_COLS = ["poss_idx", "kind", "player_id", "value"]
+KINDS = ("score", "oreb", "dreb")
+# A stint row stands for every possession of one matchup (the same five on offense
+# and five on defense): pts is their points summed, poss how many there were.
+STINT_COLS = POSS_COLS + ["poss", "pts_sq"]
+DESCRIPTIONS = ("HOMEDESCRIPTION", "VISITORDESCRIPTION", "NEUTRALDESCRIPTION")
+
+
+def time_elapsed(df):
+    """Seconds since tip-off for every event, NaN where PCTIMESTRING is not m:ss."""
+    ms = df["PCTIMESTRING"].astype(str).str.extract(r"^\s*(\d+):(\d+)\s*$")
+    m = pd.to_numeric(ms[0]).to_numpy(float)
+    s = pd.to_numeric(ms[1]).to_numpy(float)
+    period = df["PERIOD"].to_numpy()
+    maxm = np.where(period < 5, 12, 5)
+    base = (np.minimum(period, 5) - 1) * 720 + np.maximum(period - 5, 0) * 300
+    return base + (maxm - m - 1) * 60 + (60 - s)
+
+
+def team_ids(df):
+    """GAME_ID -> (home_id, away_id), from which side's description carries made
+    shots; games where either side has none are left out."""
+    made = df[df["EVENTMSGTYPE"] == MADE]
+    sides = []
+    for col in ("HOMEDESCRIPTION", "VISITORDESCRIPTION"):
+        m = made[made[col].astype(str).str.len() > 0]
+        # Series.mode's first value: the most common id, the smallest on a tie.
+        counts = m.groupby(["GAME_ID", "PLAYER1_TEAM_ID"]).size().reset_index(name="n")
+        counts = counts.sort_values(["GAME_ID", "n", "PLAYER1_TEAM_ID"],
+                                    ascending=[True, False, True])
+        sides.append(counts.drop_duplicates("GAME_ID").set_index("GAME_ID")
+                     ["PLAYER1_TEAM_ID"].astype(np.int64))
+    both = sides[0].index.intersection(sides[1].index)
+    return {gid: (int(sides[0][gid]), int(sides[1][gid])) for gid in both}
+
+
+def with_lineups(df, lineups, progress=None):
+    """Season play-by-play -> (events with the ten players on court, home ids,
+    away ids), one row per event and every game in GAME_ID order.
+
+    lineups(g) is nba_on_court for one game (None when it cannot place anyone);
+    games without team ids or lineups are dropped, as the per-game parsers did.
+    progress(k, n_games), if given, is called after every game.
+    """
+    df = df.sort_values(["GAME_ID", "EVENTNUM"], kind="stable")
+    df[list(DESCRIPTIONS)] = df[list(DESCRIPTIONS)].fillna("")
+    teams = team_ids(df)
+    n_games = df["GAME_ID"].nunique()
+    frames, home, away = [], [], []
+    for k, (gid, g) in enumerate(df.groupby("GAME_ID", sort=True)):
+        if gid in teams:
+            g = lineups(g.reset_index(drop=True))
+            if g is not None:
+                frames.append(g)
+                home.append(np.full(len(g), teams[gid][0], dtype=np.int64))
+                away.append(np.full(len(g), teams[gid][1], dtype=np.int64))
+        if progress:
+            progress(k + 1, n_games)
+    if not frames:
+        return df.iloc[:0], np.zeros(0, np.int64), np.zeros(0, np.int64)
+    return (pd.concat(frames, ignore_index=True), np.concatenate(home),
+            np.concatenate(away))
+
+
+def _last_before(flag, start, window=LOOKBACK):
+    """Per row, the nearest earlier row of the same game within window rows where
+    flag holds, else -1."""
+    idx = np.arange(len(flag))
+    marked = np.where(flag, idx, -1)
+    prev = np.maximum.accumulate(np.concatenate(([-1], marked[:-1])))
+    return np.where((prev >= start) & (idx - prev <= window), prev, -1)
+
+
+def _eq(a, b):
+    """a == b for float ids, False where either is NaN (as Python compares them)."""
+    return (a == b) & ~np.isnan(a) & ~np.isnan(b)
+
+
+def end_flags(df, home, away):
+    """-> (per-row masks and columns parse() needs, possession-end flags)."""
+    n = len(df)
+    idx = np.arange(n)
+    game = df["GAME_ID"].to_numpy()
+    new = np.ones(n, bool)
+    new[1:] = game[1:] != game[:-1]
+    start = np.maximum.accumulate(np.where(new, idx, 0))
+    first = idx == start
+
+    typ = df["EVENTMSGTYPE"].to_numpy()
+    act = df["EVENTMSGACTIONTYPE"].to_numpy()
+    p1 = pd.to_numeric(df["PLAYER1_ID"], errors="coerce").to_numpy(float)
+    p1t = pd.to_numeric(df["PLAYER1_TEAM_ID"], errors="coerce").to_numpy(float)
+    desc = [df[c].fillna("").astype(str) for c in DESCRIPTIONS[:2]]
+    miss = np.logical_or(*(d.str.lower().str.contains("miss", regex=False)
+                           .to_numpy() for d in desc))
+    three = np.logical_or(*(d.str.contains("3PT", regex=False).to_numpy()
+                            for d in desc))
+    te = time_elapsed(df)
+
+    made, ft, reb = typ == MADE, typ == FREE_THROW, typ == REBOUND
+    turnover, eop = typ == TURNOVER, typ == END_OF_PERIOD
+    team_event = np.isnan(p1t)
+
+    # Made last free throw, unless a 1-of-1 whose foul lets the shooters keep it.
+    foul = _last_before(typ == FOUL, start)
+    retained = (foul >= 0) & np.isin(act[np.maximum(foul, 0)], RETAINING_FOULS)
+    last_ft = (ft & np.isin(act, LAST_FREE_THROWS) & ~miss
+               & ~((act == ONE_OF_ONE) & retained) & ~first)
+
+    # Defensive rebound: the rebounder is not the team that missed. With no miss
+    # in the window the loop fell back on the window's first row.
+    shot = _last_before(miss, start)
+    shot = np.where(shot >= 0, shot, np.maximum(start, idx - LOOKBACK))
+    rebounder = np.where(reb & team_event, p1, p1t)
+    dreb = reb & ~first & ~_eq(p1t[shot], rebounder)
+
+    # And-1: the shooter's 1-of-1 at the same game clock within the next rows.
+    and1 = np.zeros(n, bool)
+    for k in range(1, AND1_LOOKAHEAD + 1):
+        j = idx[:-k]
+        nxt = j + k
+        and1[j] |= ((game[nxt] == game[j]) & ft[nxt] & (act[nxt] == ONE_OF_ONE)
+                    & _eq(p1[nxt], p1[j]) & _eq(te[nxt], te[j]))
+
+    end = turnover | last_ft | dreb | (made & ~and1) | eop
+    cols = dict(new=new, typ=typ, p1=p1, p1t=p1t, miss=miss, three=three,
+                made=made, ft=ft, reb=reb, turnover=turnover, eop=eop,
+                team_event=team_event, home=np.asarray(home, float),
+                away=np.asarray(away, float))
+    return cols, end
+
+
+def _possession_team(c, last):
+    """The offense of each possession from its last counted row, NaN where the
+    loop's _possession_team returned None."""
+    p1, p1t = c["p1"][last], c["p1t"][last]
+    hid, aid = c["home"][last], c["away"][last]
+    reb, to = c["reb"][last], c["turnover"][last]
+    scored = c["made"][last] | c["ft"][last]
+    team_event = c["team_event"][last]
+
+    # A team rebound or turnover names the team in PLAYER1_ID.
+    own = np.where(team_event, p1, p1t)
+    after_reb = np.where(np.isnan(own), np.nan, np.where(own == hid, aid, hid))
+    other = np.where(np.isnan(p1t), p1, p1t)
+    other = np.where((other == hid) | (other == aid), other, np.nan)
+    return np.select([scored, reb, to], [p1t, after_reb, own], other)
+
+
+def parse(df, home, away):
+    """Events with lineups (with_lineups' output) -> (possessions, events).
+
+    possessions: POSS_COLS, offense's five, defense's five, points scored, then
+    INDEX_COLS.
+    events: EVENT_COLS, who scored how much ("score") and who took each offensive
+    or defensive rebound ("oreb" / "dreb"), poss_idx a row of possessions.
+    """
+    n = len(df)
+    if n == 0:
+        return unpack([])
+    c, end = end_flags(df, home, away)
+    idx = np.arange(n)
+    counted = ~(c["typ"] == SUBSTITUTION) & ~c["eop"]
+
+    boundary = c["new"].copy()
+    boundary[1:] |= end[:-1]
+    seg = np.cumsum(boundary) - 1
+    starts = np.flatnonzero(boundary)
+    stops = np.concatenate((starts[1:], [n])) - 1
+    last = np.maximum.reduceat(np.where(counted, idx, -1), starts)
+    emitted = end[stops] & (last >= 0)
+
+    team = np.full(len(starts), np.nan)
+    team[emitted] = _possession_team(c, last[emitted])
+    keep = ~np.isnan(team)
+    poss_no = np.cumsum(keep) - 1           # segment -> row of possessions
+
+    L = last[keep]
+    home5 = df[HP].to_numpy()[L].astype(np.int64)
+    away5 = df[AP].to_numpy()[L].astype(np.int64)
+    off_home = (team[keep] == c["home"][L])[:, None]
+
+    row_team = team[seg]
+    value = np.where(c["ft"], 1, np.where(c["three"], 3, 2))
+    scoring = counted & (c["made"] | (c["ft"] & ~c["miss"]))
+    score = scoring & _eq(c["p1t"], row_team)
+    pts = np.bincount(poss_no[seg[score]], weights=value[score],
+                      minlength=int(keep.sum())).astype(np.int64)
+    game = pd.to_numeric(df["GAME_ID"]).to_numpy(np.int64)[L]
+    period = df["PERIOD"].to_numpy(np.int64)[L]
+    poss = pd.DataFrame(np.hstack([np.where(off_home, home5, away5),
+                                   np.where(off_home, away5, home5), pts[:, None],
+                                   game[:, None], period[:, None]]),
+                        columns=POSS_COLS + INDEX_COLS)
+
+    rebound = (counted & c["reb"] & ~c["team_event"] & ~np.isnan(row_team))
+    ev = np.flatnonzero(score | rebound)
+    kind = np.where(score[ev], "score",
+                    np.where(_eq(c["p1t"][ev], row_team[ev]), "oreb", "dreb"))
+    events = pd.DataFrame({"poss_idx": poss_no[seg[ev]], "kind": kind,
+                           "player_id": c["p1"][ev].astype(np.int64),
+                           "value": np.where(score[ev], value[ev], 1)})
+    return poss, events
+
+
+def same_as_rows(poss, events, rows, ev_rows):
+    """parse()'s frames against build_rapm.parse_game_rows' lists (POSS_COLS per
+    row, EVENT_COLS tuples), the comparison --check makes."""
+    return (poss[POSS_COLS].values.tolist() == rows
+            and [tuple(r) for r in events.itertuples(index=False)] == ev_rows)
+
+
+def pack(poss, events):
+    """parse()'s frames -> (possessions, poss_idx, kind codes, player ids, values)
+    as int32 / int8 arrays. Player, team and game ids fit in int32."""
+    return (poss[POSS_COLS + INDEX_COLS].to_numpy(np.int32),
+            events["poss_idx"].to_numpy(np.int32),
+            pd.Categorical(events["kind"], categories=KINDS).codes.astype(np.int8),
+            events["player_id"].to_numpy(np.int32),
+            events["value"].to_numpy(np.int8))
+
+
+def unpack(parts):
+    """pack()ed runs of games, in order -> parse()'s frames for all of them."""
+    if not parts:
+        parts = [(np.zeros((0, len(POSS_COLS + INDEX_COLS)), np.int32),
+                  np.zeros(0, np.int32), np.zeros(0, np.int8),
+                  np.zeros(0, np.int32), np.zeros(0, np.int8))]
+    offsets = np.cumsum([0] + [len(p[0]) for p in parts[:-1]])
+    poss = pd.DataFrame(np.concatenate([p[0] for p in parts]).astype(np.int64),
+                        columns=POSS_COLS + INDEX_COLS)
+    events = pd.DataFrame({
+        "poss_idx": np.concatenate([p[1].astype(np.int64) + o
+                                    for p, o in zip(parts, offsets)]),
+        "kind": np.asarray(KINDS)[np.concatenate([p[2] for p in parts])],
+        "player_id": np.concatenate([p[3] for p in parts]).astype(np.int64),
+        "value": np.concatenate([p[4] for p in parts]).astype(np.int64)})
+    return poss, events
+
+
+def matchups(off, defense, group=None):
+    """(n, 5) offense and defense ids -> (the distinct matchups as (u, 10) ids,
+    each side sorted, in sorted order; the matchup number of every row). With
+    group (n ints), rows of different groups are never the same matchup and the
+    group leads each matchup's row."""
+    keys = np.hstack([np.sort(off, axis=1), np.sort(defense, axis=1)])
+    if group is not None:
+        keys = np.hstack([np.asarray(group).reshape(-1, 1), keys])
+    order = np.lexsort(keys.T[::-1])
+    keys = keys[order]
+    first = np.r_[np.ones(min(len(keys), 1), bool),
+                  (keys[1:] != keys[:-1]).any(axis=1)]
+    inv = np.empty(len(order), dtype=np.int64)
+    inv[order] = np.cumsum(first) - 1
+    return keys[first], inv
+
+
+def stints(poss, by=None):
+    """Possessions (o0..o4, d0..d4, pts) -> one row per matchup, per value of the
+    by column when given, with STINT_COLS: the lineups sorted within each side, pts
+    and pts_sq summed, poss counted."""
+    group = None if by is None else poss[by].to_numpy()
+    keys, inv = matchups(poss[POSS_COLS[:5]].to_numpy(),
+                         poss[POSS_COLS[5:10]].to_numpy(), group)
+    pts = poss["pts"].to_numpy(np.int64)
+    u = len(keys)
+    out = pd.DataFrame(keys[:, -10:], columns=POSS_COLS[:10])
+    out["pts"] = np.bincount(inv, weights=pts, minlength=u).astype(np.int64)
+    out["poss"] = np.bincount(inv, minlength=u)
+    out["pts_sq"] = np.bincount(inv, weights=pts * pts, minlength=u).astype(np.int64)
+    if by is not None:
+        out.insert(0, by, keys[:, 0])
+    return out
@@ -26,6 +26,7 @@ Two things differ from a labeled row and are worth stating plainly:
        thing with positions zeroed so the report can quantify what it cost.
 
 Run:  python training/predict_seasons.py
+      python training/predict_seasons.py --store training/store
 """
 
 import argparse
@@ -38,9 +39,11 @@ import numpy as np
 import pandas as pd
 from sklearn.linear_model import RidgeCV
 
-from coverage import TRACK_TYPES, as_float, pick_doc
+from coverage import TRACK_TYPES, as_float, docs_to_matrix, fetch_blocks
 from db import REPO_ROOT, get_collection
 from estimated_raptor import metrics
+from feature_store import FeatureStore
+from labels import latest_positions, min_minutes
 from experiment_combined import splits
 from seasons import UNLABELED_SNAPSHOTS, season_of
 from train_rapture import (LGB_PARAMS, POS_COLS, TARGETS, add_context, dedupe,
@@ -71,56 +74,49 @@ REQUIRED = ["pbp", "wowy_on", "wowy_off"]
 MIN_BLOCKS_FRAC = 0.8
 
 
-def build_unlabeled(coll, feat_names, timestamps):
-    """Feature matrix for cells with no 538 label, in the training column order."""
+def build_unlabeled(coll, feat_names, timestamps, store=None):
+    """Feature matrix for cells with no 538 label, in the training column order.
+
+    store, a feature_store.FeatureStore, reads the blocks from local files instead.
+    """
     blocks = defaultdict(list)
     for n in feat_names:
         b, f = n.split("|", 1)
         blocks[b].append(f)
+    # Minutes stands in for 538's mp below, whether or not it is a feature column.
+    fields = {b: list(blocks.get(b, ())) for b in BLOCK_QUERY}
+    fields["pbp"] = fields["pbp"] + ["Minutes"]
 
-    rows, meta = [], []
+    Xs, meta = [], []
     for ts in timestamps:
         for st in SEASON_TYPES:
-            picked = defaultdict(dict)
-            for block, q in BLOCK_QUERY.items():
-                grp = defaultdict(list)
-                for d in coll.find({"timestamp": ts, "season_type": st, **q}):
-                    grp[d["standard_name"]].append(d)
-                for name, docs in grp.items():
-                    picked[name][block] = pick_doc(docs)
-
-            n_before = len(rows)
+            picked = (store.fetch_blocks(ts, st, BLOCK_QUERY, fields=fields)
+                      if store is not None
+                      else fetch_blocks(coll, ts, st, BLOCK_QUERY, fields=fields))
+
+            kept = []
             for player, got in picked.items():
                 if (any(b not in got for b in REQUIRED)
                         or len(got) < len(BLOCK_QUERY) * MIN_BLOCKS_FRAC):
                     continue
-                vec = []
-                for b in blocks:
-                    doc = got.get(b, {})
-                    vec.extend(as_float(doc.get(f)) for f in blocks[b])
-                rows.append(np.array([np.nan if v is None else v for v in vec],
-                                     dtype=np.float32))
+                kept.append(got)
                 # 538 supplied mp; pbp Minutes is the same number (see module docstring)
                 mp = as_float(got["pbp"].get("Minutes")) or 0.0
                 meta.append({"player": player, "timestamp": ts, "season": season_of(ts),
                              "season_type": st, "mp": mp, "pos": ""})
+            Xs.append(np.hstack([docs_to_matrix([got.get(b) for got in kept], blocks[b])
+                                 for b in blocks])
+                      if blocks else np.zeros((len(kept), 0), dtype=np.float32))
             print(f"  {ts} {st:<15} {len(picked):>4} players -> "
-                  f"{len(rows) - n_before} complete rows")
+                  f"{len(kept)} complete rows")
 
-    X = np.vstack(rows) if rows else np.zeros((0, len(feat_names)), dtype=np.float32)
+    X = np.vstack(Xs) if Xs else np.zeros((0, len(feat_names)), dtype=np.float32)
     return X, meta
 
 
 def carry_over_positions(coll, meta):
     """Reuse a player's 538 position where 538 ever listed them."""
-    latest = {}
-    for d in coll.find({"source": "538"}, {"standard_name": 1, "pos": 1,
-                                           "timestamp": 1, "_id": 0}):
-        if not d.get("pos"):
-            continue
-        prev = latest.get(d["standard_name"])
-        if prev is None or d["timestamp"] > prev[0]:
-            latest[d["standard_name"]] = (d["timestamp"], d["pos"])
+    latest = latest_positions(coll)
     hit = 0
     for m in meta:
         got = latest.get(m["player"])
@@ -218,15 +214,10 @@ def eligibility(coll):
     """
     floors = {}
     for st in SEASON_TYPES:
-        mins = []
-        for ts in ("20140715000000", "20150715000000", "20160715000000",
-                   "20170715000000", "20180715000000"):
-            v = [as_float(d.get("mp")) for d in
-                 coll.find({"source": "538", "timestamp": ts, "season_type": st},
-                           {"mp": 1, "_id": 0})]
-            v = [x for x in v if x]
-            if v:
-                mins.append(min(v))
+        mins = [min_minutes(coll, ts, st)
+                for ts in ("20140715000000", "20150715000000", "20160715000000",
+                           "20170715000000", "20180715000000")]
+        mins = [m for m in mins if m is not None]
         floors[st] = float(min(mins)) if mins else 0.0
     return floors
 
@@ -243,7 +234,8 @@ def run(args):
     print(f"labeled: X={d['X'].shape} (dropped identifier columns: {dropped})")
 
     print("building the unlabeled cells ...")
-    Xn, meta = build_unlabeled(coll, feat, list(UNLABELED_SNAPSHOTS))
+    store = FeatureStore(args.store) if args.store else None
+    Xn, meta = build_unlabeled(coll, feat, list(UNLABELED_SNAPSHOTS), store)
     print(f"unlabeled: X={Xn.shape}")
 
     carried = 0
@@ -392,6 +384,9 @@ def main():
                     default="carry+impute")
     ap.add_argument("--out", default=str(REPO_ROOT / "training"
                                          / "RESULTS_predicted_seasons.md"))
+    ap.add_argument("--store", default=None,
+                    help="read feature blocks from this feature_store.py directory "
+                         "instead of Mongo (sync it first)")
     args = ap.parse_args()
 
     df, floors, carried, held = run(args)
@@ -0,0 +1,204 @@
+"""Ridge RAPM on possession lineups, solved on a design shared by every pool.
+
+build_rapm.fit_rapm built its design with a dict lookup per player slot and gave it
+to RidgeCV(cv=5): 3 lambdas x 5 folds plus a refit, each a cold iterative solve on
+every possession. loso_rapm_hat*.fit_pool built the same design again for the full
+pool and for each season left out. Here:
+
+  * Design() maps player ids to columns with np.searchsorted on the sorted ids, and
+    collapses possessions with the same ten players (offense and defense) into one
+    row (possessions.matchups). A pool -- a CV fold, a season range, a season left
+    out -- is then only a weight vector over those rows (its possession count and
+    points sum per row), never a new matrix. Design.from_stints() takes
+    possessions.stints() rows, already counted, in place of possessions.
+  * A collapsed row carries its count as weight and its points sum as target. The
+    squared loss of the possessions it stands for differs from the weighted row's
+    by a constant, so the ridge solution is the same.
+  * solve() takes X'WX (the intercept an unpenalized last column, as
+    fit_intercept=True) and solves (X'WX + alpha I) b = X'Wy by Jacobi-
+    preconditioned conjugate gradients from x0. X'WX is only ever formed over the
+    smaller side: the whole design's is kept, a pool holding most possessions
+    (a season left out, a CV training fold) is that less the rest's.
+  * fit_cv() starts each lambda from the one before and each fold from the
+    previous fold; callers start a sub-pool from the full pool's coefficients.
+
+alpha = lambda * n / 2 as in Davis's lambda_to_alpha, n the pool's possessions.
+fit_cv() scores lambdas as RidgeCV(cv=5) did: unshuffled contiguous folds over the
+pool's possessions in order, each fit with the whole pool's alpha, mean R^2 on the
+held-out folds, first best on ties. On a from_stints() design the folds are cut
+from stints instead, and R^2 is still per possession (pts_sq carries what it needs).
+stints() comes back sorted by lineup ids, so a contiguous run of them would be a few
+players' matchups; the stints are shuffled (SEED) before they are cut.
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, cg
+
+from possessions import matchups
+
+# Relative residual at which CG stops. alpha is in the thousands, so the system is
+# well conditioned and this is far tighter than Ridge's own tol (1e-4) at little cost.
+TOL = 1e-10
+FOLDS = 5
+# Fixed so a stint design's folds, and the lambda they pick, are the same each run.
+SEED = 0
+
+
+class Design:
+    """Possessions collapsed to distinct matchups, one sparse row each.
+
+    X has a column per player on offense (+1), per player on defense (-1) and a
+    last column of ones for the intercept. inv maps each possession to its row.
+    """
+
+    def __init__(self, off, defense, pts, poss=None, pts_sq=None):
+        off, defense = np.asarray(off), np.asarray(defense)
+        self.players = np.unique(np.concatenate([off.ravel(), defense.ravel()]))
+        P = self.n_players = len(self.players)
+        keys, self.inv = matchups(off, defense)
+        keys = np.searchsorted(self.players, keys)
+        u = len(keys)
+        cols = np.hstack([keys[:, :5], keys[:, 5:] + P,
+                          np.full((u, 1), 2 * P)]).ravel()
+        vals = np.tile(np.r_[np.ones(5), -np.ones(5), 1.0], u)
+        self.X = sparse.csr_matrix((vals, (np.repeat(np.arange(u), 11), cols)),
+                                   shape=(u, 2 * P + 1))
+        self._XT = self.X.T.tocsr()
+        self.y = 100.0 * np.asarray(pts, dtype=np.float64)
+        if poss is None:
+            self.w, self.yy = None, self.y * self.y
+        else:
+            self.w = np.asarray(poss, dtype=np.float64)
+            self.yy = (1e4 * np.asarray(pts_sq, dtype=np.float64) if pts_sq is not None
+                       else self.y * self.y / np.maximum(self.w, 1.0))
+        self._full = None
+
+    @classmethod
+    def from_stints(cls, stints):
+        """A design over possessions.stints() rows: the weighted-ridge path."""
+        return cls(stints[[f"o{i}" for i in range(5)]].values,
+                   stints[[f"d{i}" for i in range(5)]].values,
+                   stints["pts"].values, stints["poss"].values,
+                   stints["pts_sq"].values)
+
+    def __len__(self):
+        return len(self.y)
+
+    def totals(self, mask=None):
+        """-> (possessions, sum of y, sum of y^2) per row of X, over the input rows
+        in mask (a boolean array or an index array; all when None)."""
+        inv, y, yy, w = self.inv, self.y, self.yy, self.w
+        if mask is not None:
+            inv, y, yy = inv[mask], y[mask], yy[mask]
+            w = None if w is None else w[mask]
+        u = self.X.shape[0]
+        return (np.bincount(inv, weights=w, minlength=u).astype(np.float64),
+                np.bincount(inv, weights=y, minlength=u),
+                np.bincount(inv, weights=yy, minlength=u))
+
+    def _gram(self, w):
+        rows = np.flatnonzero(w)
+        X = self.X[rows]
+        return (X.T @ X.multiply(w[rows, None]).tocsr()).toarray()
+
+    def gram(self, w):
+        """X'WX. A pool holding most possessions is the whole design's (computed
+        once) less the rest's; entries are possession counts, so exactly."""
+        if self._full is None:
+            w_full = self.totals()[0]
+            self._full = (w_full, self._gram(w_full))
+        w_full, g_full = self._full
+        rest = w_full - w
+        if np.count_nonzero(rest) < np.count_nonzero(w):
+            return g_full - self._gram(rest)
+        return self._gram(w)
+
+    def solve(self, alphas, w, ysum, x0=None, G=None):
+        """Ridge on rows weighted w with target sums ysum, for each alpha in turn,
+        each solve started from the last. G is gram(w) when the caller has it.
+        -> a list of coefficient vectors (2 * n_players, then the intercept)."""
+        if G is None:
+            G = self.gram(w)
+        b = self._XT @ ysum
+        pen = np.r_[np.ones(G.shape[0] - 1), 0.0]
+        diag = np.diag(G).copy()
+        x = np.zeros(G.shape[0]) if x0 is None else np.asarray(x0, dtype=np.float64)
+        if x0 is None and w.sum() > 0:
+            x[-1] = ysum.sum() / w.sum()
+        out = []
+        for alpha in alphas:
+            A = G + np.diag(alpha * pen)
+            scale = 1.0 / np.maximum(diag + alpha * pen, 1e-12)
+            M = LinearOperator(A.shape, matvec=lambda v, s=scale: s * v)
+            x, info = cg(A, b, x0=x, rtol=TOL, maxiter=10 * len(x), M=M)
+            if info:
+                raise RuntimeError(f"CG did not converge at alpha={alpha} ({info})")
+            out.append(x)
+        return out
+
+    def possessions(self, w):
+        """Weights w -> (possessions on offense, on defense) per player."""
+        P = self.n_players
+        c = self._XT @ w
+        return c[:P], -c[P:2 * P]
+
+
+def _mask_index(design, mask):
+    if mask is None:
+        return np.arange(len(design))
+    mask = np.asarray(mask)
+    return np.flatnonzero(mask) if mask.dtype == bool else mask
+
+
+def fit(design, lam, mask=None, x0=None):
+    """Ridge at one lambda over the possessions in mask. -> coefficients."""
+    w, ysum, _ = design.totals(mask)
+    return design.solve([lam * w.sum() / 2.0], w, ysum, x0)[0]
+
+
+def fit_cv(design, lambdas, mask=None, folds=FOLDS, x0=None):
+    """Pick lambda by folds-fold CV over the possessions in mask, refit on all of
+    them. -> (coefficients, lambda)."""
+    idx = _mask_index(design, mask)
+    if design.w is not None:
+        idx = np.random.default_rng(SEED).permutation(idx)
+    n = len(idx)
+    sizes = np.full(folds, n // folds)
+    sizes[:n % folds] += 1
+    bounds = np.r_[0, np.cumsum(sizes)]
+    w_all, y_all, q_all = design.totals(idx)
+    g_all = design.gram(w_all)
+    alphas = [l * w_all.sum() / 2.0 for l in lambdas]
+    scores = np.zeros(len(lambdas))
+    start = x0
+    for k in range(folds):
+        w_te, y_te, q_te = design.totals(idx[bounds[k]:bounds[k + 1]])
+        w_tr, y_tr = w_all - w_te, y_all - y_te
+        coefs = design.solve(alphas, w_tr, y_tr, start,
+                             g_all - design.gram(w_te))
+        start = coefs[0]
+        sst = q_te.sum() - y_te.sum() ** 2 / w_te.sum()
+        for j, c in enumerate(coefs):
+            pred = design.X @ c
+            sse = (q_te - 2.0 * pred * y_te + w_te * pred * pred).sum()
+            scores[j] += (1.0 - sse / sst) / folds
+    best = int(np.argmax(scores))
+    coef = design.solve([alphas[best]], w_all, y_all, start, g_all)[0]
+    return coef, lambdas[best]
+
+
+def ratings(design, coef, mask=None):
+    """-> (players, offense, defense, offensive possessions, defensive
+    possessions) for the players with possessions in mask, offense and defense
+    re-centered to a possession-weighted zero (538 re-zeroed their pooled target)."""
+    w, _, _ = design.totals(mask)
+    cnt_o, cnt_d = design.possessions(w)
+    keep = (cnt_o + cnt_d) > 0
+    P = design.n_players
+    o, d = coef[:P][keep], coef[P:2 * P][keep]
+    cnt_o, cnt_d = cnt_o[keep], cnt_d[keep]
+    o = o - np.average(o, weights=np.maximum(cnt_o, 1))
+    d = d - np.average(d, weights=np.maximum(cnt_d, 1))
+    return (design.players[keep], o, d, cnt_o.astype(np.int64),
+            cnt_d.astype(np.int64))
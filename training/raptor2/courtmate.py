@@ -7,8 +7,9 @@ the number of possessions that the courtmate had without the player" -- and
 (3) the courtmates' courtmates' ratings. Team-without-player (WOWY off) is the
 construction the document explicitly calls inferior; this builds the real one.
 
-Per season, one pass over possessions accumulates per-player and per-teammate-
-pair totals (possessions and points, offense and defense). Then:
+Per season, one pass over its stints (possessions.stints: one row per matchup,
+weighted by its possessions) accumulates per-player and per-teammate-pair totals
+(possessions and points, offense and defense). Then:
 
   rtg_without(t | p)  = 100*(pts_t - pts_shared(p,t)) / (poss_t - shared(p,t))
   cw(p)               = sum_t w * rtg_without(t|p) / sum_t w,
@@ -41,10 +42,11 @@ from sklearn.linear_model import RidgeCV
 from db import REPO_ROOT
 from estimated_raptor import norm_name
 from experiment_combined import prepare, splits
+import poss_store
+import possessions as P
 from predict_seasons import DROP_FEATURES
 
 TD = REPO_ROOT / "training"
-BUILD = Path("/tmp/rapm_build")
 SEASON_OF = {2013: "2013-14", 2014: "2014-15", 2015: "2015-16",
              2016: "2016-17", 2017: "2017-18", 2018: "2018-19",
              2019: "2019-20", 2020: "2020-21", 2021: "2021-22",
@@ -67,27 +69,25 @@ def pair_key(a, b):
 
 
 def season_chain(poss):
-    """-> {player_id: [on_o, on_d, cw_o, cw_d, cc_o, cc_d, poss]}"""
+    """Possessions, or possessions.stints() rows (weighted by their poss column)
+    -> {player_id: [on_o, on_d, cw_o, cw_d, cc_o, cc_d, poss]}"""
     O = poss[[f"o{i}" for i in range(5)]].values
     D = poss[[f"d{i}" for i in range(5)]].values
     pts = poss["pts"].values.astype(np.float64)
+    n = poss["poss"].values.astype(np.float64) if "poss" in poss \
+        else np.ones(len(poss))
 
     tot = {}   # side -> (poss_series, pts_series) per player
     shared = {}
     for side, M in (("o", O), ("d", D)):
         flat = M.ravel()
-        rep = np.repeat(pts, 5)
-        s_poss = pd.Series(1.0, index=flat).groupby(level=0).sum()
-        s_pts = pd.Series(rep, index=flat).groupby(level=0).sum()
+        s_poss = pd.Series(np.repeat(n, 5), index=flat).groupby(level=0).sum()
+        s_pts = pd.Series(np.repeat(pts, 5), index=flat).groupby(level=0).sum()
         tot[side] = (s_poss, s_pts)
-        keys, vals = [], []
-        for i, j in combinations(range(5), 2):
-            keys.append(pair_key(M[:, i], M[:, j]))
-            vals.append(pts)
-        k = np.concatenate(keys)
-        v = np.concatenate(vals)
-        p_poss = pd.Series(1.0, index=k).groupby(level=0).sum()
-        p_pts = pd.Series(v, index=k).groupby(level=0).sum()
+        keys = np.concatenate([pair_key(M[:, i], M[:, j])
+                               for i, j in combinations(range(5), 2)])
+        p_poss = pd.Series(np.tile(n, 10), index=keys).groupby(level=0).sum()
+        p_pts = pd.Series(np.tile(pts, 10), index=keys).groupby(level=0).sum()
         shared[side] = (p_poss, p_pts)
 
     players = sorted(set(tot["o"][0].index) | set(tot["d"][0].index))
@@ -154,12 +154,11 @@ def main():
 
     chain = {}
     for yr, season in SEASON_OF.items():
-        fp = BUILD / f"attrib_poss_{yr}.csv"
-        if not fp.exists():
+        if not poss_store.exists(yr):
             print(f"[{season}] possessions not parsed yet -- skipped",
                   flush=True)
             continue
-        res = season_chain(pd.read_csv(fp))
+        res = season_chain(P.stints(poss_store.load(yr).frame()))
         for pid, row in res.items():
             chain[(season, norm_name(names.get(int(pid), f"id{pid}")))] = row
         print(f"[{season}] {len(res)} players", flush=True)
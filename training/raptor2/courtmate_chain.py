@@ -9,8 +9,10 @@ The methodology uses, for each side of the ball:
 
 The checked-in ``wowy`` tables contain (1) and a team-without-player proxy for
 (2), but not the pair-level relationships.  ``build_rapm.py`` can produce the
-required ``poss_<year>.csv`` files.  This module turns one such possession file
-into the missing chain without O(rotation²) API calls.
+required possessions (a ``poss_store`` season directory).  This module turns one
+such season, or a possession CSV with the same columns, into the missing chain
+without O(rotation²) API calls.  It works on the season's stints (one weighted
+row per ten-player matchup), which gives the same chain as every possession.
 
 FiveThirtyEight did not publish the exact third-step normalization.  We use the
 literal graph interpretation: compute step 2 for every player, then average the
@@ -22,19 +24,30 @@ of silently folding in an undocumented competition-adjustment coefficient.
 from __future__ import annotations
 
 import argparse
+import sys
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 
 
-def _side_features(lineups, points, higher_is_better=True):
+def _weights(weights, n):
+    if weights is None:
+        return np.ones(n)
+    weights = np.asarray(weights, dtype=float)
+    if len(weights) != n:
+        raise ValueError("weights and lineups must have the same number of rows")
+    return weights
+
+
+def _side_features(lineups, points, higher_is_better=True, weights=None):
     lineups = np.asarray(lineups)
     points = np.asarray(points, dtype=float)
     if lineups.ndim != 2 or lineups.shape[1] != 5:
         raise ValueError("lineups must have shape (possessions, 5)")
     if len(points) != len(lineups):
         raise ValueError("points and lineups must have the same number of rows")
+    weights = _weights(weights, len(lineups))
     players = np.unique(lineups)
     pidx = {p: i for i, p in enumerate(players)}
     n = len(players)
@@ -43,11 +56,11 @@ def _side_features(lineups, points, higher_is_better=True):
     shared_poss = np.zeros((n, n), dtype=float)
     shared_pts = np.zeros((n, n), dtype=float)
 
-    for lineup, value in zip(lineups, points):
+    for lineup, value, w in zip(lineups, points, weights):
         ids = np.array([pidx[p] for p in lineup], dtype=int)
-        poss[ids] += 1.0
+        poss[ids] += w
         pts[ids] += value
-        shared_poss[np.ix_(ids, ids)] += 1.0
+        shared_poss[np.ix_(ids, ids)] += w
         shared_pts[np.ix_(ids, ids)] += value
 
     sign = 1.0 if higher_is_better else -1.0
@@ -76,9 +89,13 @@ def _side_features(lineups, points, higher_is_better=True):
     return players, own, step2, step3, poss
 
 
-def courtmate_chain_features(offense_lineups, defense_lineups, points):
+def courtmate_chain_features(offense_lineups, defense_lineups, points, weights=None):
     """Return one row per player with offense/defense chain and competition.
 
+    With ``weights`` each row stands for that many possessions and ``points`` are
+    their total -- ``possessions.stints()`` rows, which give the same result as
+    the possessions they collapse.
+
     Defensive ratings are negated points allowed per 100 so that larger values
     consistently mean better performance.  ``*_opp_quality`` is the possession-
     weighted mean raw rating of the five opponents faced and is deliberately a
@@ -88,8 +105,9 @@ def courtmate_chain_features(offense_lineups, defense_lineups, points):
     defense_lineups = np.asarray(defense_lineups)
     if offense_lineups.shape != defense_lineups.shape:
         raise ValueError("offense and defense lineups must have equal shape")
-    po, oo, o2, o3, oposs = _side_features(offense_lineups, points, True)
-    pd_, dd, d2, d3, dposs = _side_features(defense_lineups, points, False)
+    weights = _weights(weights, len(offense_lineups))
+    po, oo, o2, o3, oposs = _side_features(offense_lineups, points, True, weights)
+    pd_, dd, d2, d3, dposs = _side_features(defense_lineups, points, False, weights)
     players = np.unique(np.concatenate([po, pd_]))
     oi, di = {p: i for i, p in enumerate(po)}, {p: i for i, p in enumerate(pd_)}
 
@@ -97,15 +115,15 @@ def courtmate_chain_features(offense_lineups, defense_lineups, points):
     # the adjustment sign/magnitude rather than baking in an unpublished value.
     opp_o = {p: [0.0, 0.0] for p in players}
     opp_d = {p: [0.0, 0.0] for p in players}
-    for off, deff in zip(offense_lineups, defense_lineups):
+    for off, deff, w in zip(offense_lineups, defense_lineups, weights):
         mean_def = np.nanmean([dd[di[p]] for p in deff])
         mean_off = np.nanmean([oo[oi[p]] for p in off])
         for p in off:
-            opp_o[p][0] += mean_def
-            opp_o[p][1] += 1
+            opp_o[p][0] += w * mean_def
+            opp_o[p][1] += w
         for p in deff:
-            opp_d[p][0] += mean_off
-            opp_d[p][1] += 1
+            opp_d[p][0] += w * mean_off
+            opp_d[p][1] += w
 
     records = []
     for p in players:
@@ -128,14 +146,18 @@ def courtmate_chain_features(offense_lineups, defense_lineups, points):
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("possessions", help="poss_<year>.csv from build_rapm.py")
+    ap.add_argument("possessions",
+                    help="a poss_store season directory (or a possession CSV)")
     ap.add_argument("--out", help="output CSV; defaults beside the input")
     args = ap.parse_args()
     p = Path(args.possessions)
-    df = pd.read_csv(p)
-    offense = df[[f"o{i}" for i in range(5)]].to_numpy()
-    defense = df[[f"d{i}" for i in range(5)]].to_numpy()
-    out = courtmate_chain_features(offense, defense, df["pts"].to_numpy())
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import poss_store
+    from possessions import stints
+    st = stints(poss_store.Season(p).frame() if p.is_dir() else pd.read_csv(p))
+    out = courtmate_chain_features(st[[f"o{i}" for i in range(5)]].to_numpy(),
+                                   st[[f"d{i}" for i in range(5)]].to_numpy(),
+                                   st["pts"].to_numpy(), st["poss"].to_numpy())
     target = Path(args.out) if args.out else p.with_name(p.stem + "_courtchain.csv")
     out.to_csv(target, index=False)
     print(f"wrote {target} ({len(out)} players)")
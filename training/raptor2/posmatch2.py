@@ -21,7 +21,6 @@ import sys
 from pathlib import Path
 
 import numpy as np
-import pandas as pd
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 sys.path.insert(0, str(Path(__file__).resolve().parent))
@@ -33,11 +32,11 @@ from experiment_components import RELATIVE_COLS
 from experiment_components import cell_relative as cellrel_features
 from experiment_oppdef import blend
 from experiment_topk_rank import score_cells
+import poss_store
 from predict_seasons import DROP_FEATURES
 from train_rapture import TARGETS
 
 TD = REPO_ROOT / "training"
-BUILD = Path("/tmp/rapm_build")
 FLOOR = 1065
 SEASON_OF = {2013: "2013-14", 2014: "2014-15", 2015: "2015-16",
              2016: "2016-17", 2017: "2017-18", 2018: "2018-19",
@@ -84,14 +83,12 @@ def main():
 
     acc = {}
     for yr, season in SEASON_OF.items():
-        fp = BUILD / f"attrib_poss_{yr}.csv"
-        if not fp.exists():
+        if not poss_store.exists(yr, events=True):
             print(f"[{season}] missing possessions", flush=True)
             continue
-        poss = pd.read_csv(fp)
-        ev = pd.read_csv(BUILD / f"attrib_events_{yr}.csv")
-        O = poss[[f"o{i}" for i in range(5)]].values
-        D = poss[[f"d{i}" for i in range(5)]].values
+        store = poss_store.load(yr)
+        ev = store.events()
+        O, D = np.asarray(store.off), np.asarray(store.defense)
         pv, dg = {}, {}
         for pid in np.unique(np.concatenate([O.ravel(), D.ravel()])):
             key = (season, norm_name(names.get(int(pid), f"id{pid}")))
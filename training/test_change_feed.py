@@ -0,0 +1,55 @@
+"""Tests for the rebuild plan derived from changed (source, cell) pairs."""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from change_feed import (ARTIFACTS, BOARD_COMMANDS, LABELED_SEASONS, changed_cells,
+                         plan, record)
+
+FIXED = "training/data_fixed"
+
+
+class PlanTests(unittest.TestCase):
+    def test_in_season_cell_after_538_is_idle(self):
+        p = plan({("pbp", "20251201000000", "Regular season"): 480})
+        self.assertEqual(p["artifacts"], [])
+        self.assertEqual(p["loso"], {})
+        self.assertFalse(p["boards"])
+        self.assertEqual(p["commands"], ["python training/feature_store.py --source pbp"])
+
+    def test_projection_snapshot_stales_only_the_boards(self):
+        p = plan({("wowy", "20260715000000", "Regular season"): 900})
+        self.assertEqual(p["artifacts"], [])
+        self.assertEqual(p["loso"], {})
+        self.assertTrue(p["boards"])
+        self.assertEqual(p["commands"][-1], BOARD_COMMANDS[-1])
+
+    def test_labeled_extract_source_stales_only_its_artifact(self):
+        p = plan({("nba-shotdash", "20160715000000", "Regular season"): 300})
+        self.assertEqual(p["artifacts"], [f"{FIXED}/shotdash.npz"])
+        self.assertEqual(p["loso"], {})     # the LOSO does not read shotdash
+        self.assertTrue(p["boards"])
+
+    def test_combined_source_restales_everything_aligned_to_it(self):
+        p = plan({("pbp", "20160715000000", "Regular season"): 450,
+                  ("wowy", "20220301000000", "Playoffs"): 10})
+        self.assertEqual(p["artifacts"], list(ARTIFACTS))
+        self.assertEqual(set(p["loso"]), LABELED_SEASONS)
+        self.assertEqual([s for s, why in p["loso"].items() if why == "eval"],
+                         ["2015-16"])
+
+    def test_record_groups_documents_by_cell(self):
+        state = {"changed": {}}
+        for _ in range(3):
+            record(state, {"source": "pbp", "timestamp": "20160715000000",
+                           "season_type": "Playoffs", "Points": 1})
+        record(state, {"source": "pbp"})
+        self.assertEqual(changed_cells(state),
+                         {("pbp", "20160715000000", "Playoffs"): 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,7 @@ import unittest
 from pathlib import Path
 
 import numpy as np
+import pandas as pd
 
 sys.path.insert(0, str(Path(__file__).resolve().parent / "raptor2"))
 
@@ -30,6 +31,17 @@ class CourtmateChainTests(unittest.TestCase):
         self.assertTrue(np.isfinite(got.loc[1, "off_courtmates_without"]))
         self.assertTrue(np.isfinite(got.loc[11, "def_courtmates_courtmates"]))
 
+    def test_weighted_rows_match_repeated_possessions(self):
+        off = np.array([[1, 2, 3, 4, 5], [1, 2, 3, 6, 7], [2, 3, 4, 5, 6]])
+        deff = np.array([[11, 12, 13, 14, 15], [11, 12, 13, 16, 17],
+                         [12, 13, 14, 15, 16]])
+        pts = np.array([1.0, 2.0, 3.0])
+        n = np.array([3, 1, 2])
+        want = courtmate_chain_features(np.repeat(off, n, axis=0),
+                                        np.repeat(deff, n, axis=0), np.repeat(pts, n))
+        got = courtmate_chain_features(off, deff, pts * n, weights=n)
+        pd.testing.assert_frame_equal(got, want)
+
     def test_shape_validation(self):
         with self.assertRaises(ValueError):
             courtmate_chain_features(np.ones((2, 4)), np.ones((2, 4)), [1, 2])
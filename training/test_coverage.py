@@ -0,0 +1,60 @@
+"""Equivalence tests for the batch document-to-matrix converter."""
+
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from coverage import as_float, docs_to_matrix, registry_report
+
+
+class DocsToMatrixTests(unittest.TestCase):
+    def test_matches_scalar_as_float(self):
+        docs = [
+            {"a": 1, "b": "1,234.5", "c": "45.2%", "d": True},
+            {"a": 2.5, "b": "+3", "c": "n/a", "d": None},
+            None,
+            {"a": None, "b": "-.5", "c": "", "d": "7"},
+        ]
+        fields = ["a", "b", "c", "d", "missing"]
+        got = docs_to_matrix(docs, fields)
+        expected = np.array([[np.nan if (v := as_float((d or {}).get(f))) is None
+                              else v for f in fields] for d in docs],
+                            dtype=np.float32)
+        self.assertEqual(got.dtype, np.float32)
+        np.testing.assert_array_equal(got, expected)
+
+    def test_fills_output_slice_in_place(self):
+        out = np.zeros((2, 3), dtype=np.float32)
+        docs_to_matrix([{"x": "2"}, {}], ["x"], out=out[:, 1:2])
+        np.testing.assert_array_equal(out, [[0, 2, 0], [0, np.nan, 0]])
+
+
+class RegistryReportTests(unittest.TestCase):
+    def test_rates_are_numeric_rows_over_block_rows(self):
+        cats = {
+            ("pbp", "20140715000000", "Regular season"): {
+                "-": {"rows": 4, "fields": {"Points": (4, 4), "Charges": (1, 1),
+                                            "name": (4, 0), "Blank": (2, 0)}}},
+            ("pbp", "20140715000000", "Playoffs"): {
+                "-": {"rows": 4, "fields": {"Points": (4, 2)}}},
+            ("wowy", "20220301000000", "Regular season"): {
+                "on": {"rows": 10, "fields": {"Points": (10, 10)}},
+                "off": {"rows": 10, "fields": {"Points": (10, 5)}}},
+        }
+        specs = {"pbp": {"source": "pbp"},
+                 "wowy_on": {"source": "wowy", "on_or_off": "on"},
+                 "wowy_off": {"source": "wowy", "on_or_off": "off"}}
+        r = registry_report(cats, specs)
+        self.assertEqual(r["test"]["coverage"]["pbp"], {"Points": 0.75, "Charges": 0.125})
+        self.assertEqual(r["test"]["denominator"], {"pbp": 8})
+        self.assertEqual(r["train"]["coverage"],
+                         {"wowy_on": {"Points": 1.0}, "wowy_off": {"Points": 0.5}})
+        self.assertEqual(r["hist"]["cells"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
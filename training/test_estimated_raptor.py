@@ -6,7 +6,9 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
-from estimated_raptor import norm_name
+import pandas as pd
+
+from estimated_raptor import match_rows, norm_name
 
 
 class EstimatedRaptorNameTests(unittest.TestCase):
@@ -23,5 +25,31 @@ class EstimatedRaptorNameTests(unittest.TestCase):
                          "kentaviouscaldwellpope")
 
 
+class MatchRowsTests(unittest.TestCase):
+    def setUp(self):
+        names = ["Marcus Morris", "Marcus Morris Sr.", "Nikola Jokic", "Al Horford"]
+        self.paine = pd.DataFrame({"Year": 2014, "Type": "RS",
+                                   "key": [norm_name(n) for n in names]})
+
+    def match(self, name, year=2014):
+        ours = pd.DataFrame({"year": [year], "ptype": ["RS"], "key": [norm_name(name)]})
+        idx, how, score = match_rows(ours, self.paine)
+        return idx[0], how[0], score[0]
+
+    def test_exact_and_fuzzy(self):
+        self.assertEqual(self.match("Nikola Jokić")[:2], (2, "exact"))
+        idx, how, score = self.match("Al Horfrod")
+        self.assertEqual((idx, how), (3, "fuzzy"))
+        self.assertLess(score, 1.0)
+
+    def test_shared_key_is_ambiguous_not_joined(self):
+        self.assertEqual(self.match("Marcus Morris")[:2], (-1, "ambiguous"))
+        self.assertEqual(self.match("Marcus Moris")[:2], (-1, "ambiguous"))
+
+    def test_no_match_outside_the_pool(self):
+        self.assertEqual(self.match("Nikola Jokic", year=2015)[:2], (-1, "none"))
+        self.assertEqual(self.match("Zach Randolph")[:2], (-1, "none"))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,77 @@
+"""Tests for the memory-mapped possession store."""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import numpy as np
+import pandas as pd
+
+import poss_store
+from possessions import POSS_COLS
+
+
+def frames():
+    poss = pd.DataFrame(
+        [[11, 12, 13, 14, 15, 21, 22, 23, 24, 25, 2, 7, 1],
+         [21, 22, 23, 24, 25, 11, 12, 13, 14, 15, 0, 7, 1],
+         [11, 12, 13, 14, 16, 21, 22, 23, 24, 25, 3, 7, 2],
+         [31, 32, 33, 34, 35, 41, 42, 43, 44, 45, 1, 9, 4]],
+        columns=POSS_COLS + ["game", "period"])
+    events = pd.DataFrame({"poss_idx": [0, 1, 2, 2, 3],
+                           "kind": ["score", "dreb", "oreb", "score", "score"],
+                           "player_id": [11, 12, 14, 16, 33],
+                           "value": [2, 1, 1, 3, 1]})
+    return poss, events
+
+
+class StoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        poss, events = frames()
+        poss_store.save(2015, poss, events, self.root)
+        self.assertTrue(poss_store.exists(2015, self.root, events=True))
+        s = poss_store.load(2015, self.root)
+        self.assertEqual(len(s), 4)
+        self.assertEqual(s.off.dtype, np.int32)
+        self.assertEqual(s.pts.dtype, np.int8)
+        self.assertFalse(s.off.flags.writeable)
+        pd.testing.assert_frame_equal(s.frame(), poss[POSS_COLS])
+        pd.testing.assert_frame_equal(s.events(), events)
+        np.testing.assert_array_equal(s.games, [7, 9])
+        np.testing.assert_array_equal(s.game_ptr, [0, 3, 4])
+        np.testing.assert_array_equal(s.game(), poss["game"])
+        np.testing.assert_array_equal(s.period, poss["period"])
+
+    def test_without_events_or_game_index(self):
+        poss, _ = frames()
+        poss_store.save(2015, poss[POSS_COLS], None, self.root)
+        self.assertTrue(poss_store.exists(2015, self.root))
+        self.assertFalse(poss_store.exists(2015, self.root, events=True))
+        s = poss_store.load(2015, self.root)
+        self.assertIsNone(s.game())
+        with self.assertRaises(FileNotFoundError):
+            s.events()
+
+    def test_convert_prefers_attrib_files(self):
+        poss, events = frames()
+        poss[POSS_COLS].to_csv(self.root / "poss_2014.csv", index=False)
+        poss[POSS_COLS].to_csv(self.root / "attrib_poss_2015.csv", index=False)
+        events.to_csv(self.root / "attrib_events_2015.csv", index=False)
+        store = self.root / "store"
+        self.assertEqual(poss_store.convert(self.root, store), ["2014", "2015"])
+        self.assertFalse(poss_store.exists(2014, store, events=True))
+        pd.testing.assert_frame_equal(poss_store.load(2015, store).events(), events)
+
+
+if __name__ == "__main__":
+    unittest.main()
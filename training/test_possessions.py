@@ -0,0 +1,119 @@
+"""Tests for the columnar possession parser on hand-built play-by-play."""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import numpy as np
+import pandas as pd
+
+from possessions import (AP, HP, POSS_COLS, pack, parse, same_as_rows, stints,
+                         time_elapsed, unpack)
+
+HOME, AWAY = 1, 2
+HOME5, AWAY5 = [11, 12, 13, 14, 15], [21, 22, 23, 24, 25]
+
+
+def ev(typ, act=0, player=np.nan, team=np.nan, home="", away="", clock="11:00"):
+    return dict(EVENTMSGTYPE=typ, EVENTMSGACTIONTYPE=act, PLAYER1_ID=player,
+                PLAYER1_TEAM_ID=team, HOMEDESCRIPTION=home, VISITORDESCRIPTION=away,
+                NEUTRALDESCRIPTION="", PCTIMESTRING=clock, PERIOD=1)
+
+
+def game(gid, events):
+    g = pd.DataFrame(events)
+    g["GAME_ID"] = gid
+    g["EVENTNUM"] = range(len(g))
+    for c, p in zip(HP + AP, HOME5 + AWAY5):
+        g[c] = p
+    return g
+
+
+class ParseTests(unittest.TestCase):
+    def setUp(self):
+        a = game(1, [
+            ev(12),
+            ev(1, player=11, team=HOME, home="Jump Shot"),
+            ev(2, player=21, team=AWAY, away="MISS Layup"),
+            ev(4, player=12, team=HOME, home="REBOUND"),               # defensive
+            ev(1, player=13, team=HOME, home="3PT Jump Shot", clock="9:30"),
+            ev(6, act=2, player=22, team=AWAY, away="S.FOUL", clock="9:30"),
+            ev(3, act=10, player=13, team=HOME, home="Free Throw 1 of 1",
+               clock="9:30"),                                          # and-1
+            ev(8, player=14, team=HOME, home="SUB"),
+            ev(5, player=23, team=AWAY, away="Bad Pass Turnover"),
+            ev(2, player=14, team=HOME, home="MISS Jump Shot"),
+            ev(4, player=HOME, home="Team Rebound"),                  # offensive
+            ev(6, act=3, player=24, team=AWAY, away="L.B.FOUL"),
+            ev(3, act=10, player=15, team=HOME, home="Free Throw 1 of 1"),  # kept
+            ev(13),
+        ])
+        b = game(2, [
+            ev(4, player=21, team=AWAY, away="REBOUND"),   # first row: never an end
+            ev(1, player=21, team=AWAY, away="Dunk"),
+            ev(2, player=11, team=HOME, home="MISS Jumper"),   # after the last end
+        ])
+        self.games = [a, b]
+        self.poss, self.events = self.parse(pd.concat([a, b], ignore_index=True))
+
+    @staticmethod
+    def parse(df):
+        return parse(df, np.full(len(df), HOME), np.full(len(df), AWAY))
+
+    def test_possessions_offense_and_points(self):
+        off_home = [list(r[:5]) == HOME5 for r in self.poss.to_numpy()]
+        self.assertEqual(off_home, [True, False, True, False, True, False])
+        self.assertEqual(self.poss["pts"].tolist(), [2, 0, 4, 0, 1, 2])
+        self.assertEqual(self.poss.iloc[1, 5:10].tolist(), HOME5)
+
+    def test_attributed_events(self):
+        got = [tuple(r) for r in self.events.itertuples(index=False)]
+        self.assertEqual(got, [(0, "score", 11, 2), (1, "dreb", 12, 1),
+                               (2, "score", 13, 3), (2, "score", 13, 1),
+                               (4, "score", 15, 1), (5, "oreb", 21, 1),
+                               (5, "score", 21, 2)])
+
+    def test_games_parsed_apart_and_unpacked_match_one_parse(self):
+        poss, events = unpack([pack(*self.parse(g)) for g in self.games])
+        pd.testing.assert_frame_equal(poss, self.poss)
+        pd.testing.assert_frame_equal(events, self.events)
+
+    def test_check_matches_row_loop_output(self):
+        # What parse_game_rows returns for the two games: the index columns parse()
+        # adds must not count as a difference.
+        rows = [HOME5 + AWAY5 + [2], AWAY5 + HOME5 + [0], HOME5 + AWAY5 + [4],
+                AWAY5 + HOME5 + [0], HOME5 + AWAY5 + [1], AWAY5 + HOME5 + [2]]
+        ev_rows = [(0, "score", 11, 2), (1, "dreb", 12, 1), (2, "score", 13, 3),
+                   (2, "score", 13, 1), (4, "score", 15, 1), (5, "oreb", 21, 1),
+                   (5, "score", 21, 2)]
+        self.assertEqual(list(self.poss.columns[len(POSS_COLS):]), ["game", "period"])
+        self.assertTrue(same_as_rows(self.poss, self.events, rows, ev_rows))
+        rows[2][-1] = 3
+        self.assertFalse(same_as_rows(self.poss, self.events, rows, ev_rows))
+
+    def test_stints_group_matchups(self):
+        poss = pd.DataFrame([[1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 2],
+                             [5, 4, 3, 2, 1, 10, 9, 8, 7, 6, 3],   # same matchup
+                             [6, 7, 8, 9, 10, 1, 2, 3, 4, 5, 1],
+                             [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 0]],
+                            columns=POSS_COLS)
+        poss["season"] = [2015, 2015, 2015, 2016]
+        st = stints(poss)
+        self.assertEqual(st[["pts", "poss", "pts_sq"]].values.tolist(),
+                         [[5, 3, 13], [1, 1, 1]])
+        self.assertEqual(st.iloc[0, :10].tolist(), list(range(1, 11)))
+        st = stints(poss, by="season")
+        self.assertEqual(st[["season", "pts", "poss"]].values.tolist(),
+                         [[2015, 5, 2], [2015, 1, 1], [2016, 0, 1]])
+
+    def test_time_elapsed(self):
+        df = pd.DataFrame({"PCTIMESTRING": ["12:00", "0:00", "4:30", "bad"],
+                           "PERIOD": [1, 4, 5, 2]})
+        np.testing.assert_array_equal(time_elapsed(df)[:3], [0, 2880, 2910])
+        self.assertTrue(np.isnan(time_elapsed(df)[3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
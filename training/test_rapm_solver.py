@@ -0,0 +1,116 @@
+"""Tests for the RAPM solver against scikit-learn's ridge on the same possessions."""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import Ridge
+from sklearn.model_selection import GridSearchCV
+
+import rapm_solver
+from possessions import POSS_COLS, stints
+
+LAMBDAS = [0.01, 0.05, 0.1]
+
+
+def possessions(n=3000, seed=0):
+    """Lineups drawn from four eight-man teams, so matchups repeat."""
+    rng = np.random.default_rng(seed)
+    teams = np.arange(32).reshape(4, 8) + 200
+    a = rng.integers(0, 4, n)
+    b = (a + rng.integers(1, 4, n)) % 4
+    pick = lambda t: np.array([rng.choice(teams[k], 5, replace=False) for k in t])
+    return pick(a), pick(b), rng.choice([0, 1, 2, 3], n, p=[.5, .1, .3, .1])
+
+
+def scored(n=6000, seed=1):
+    """possessions() with points drawn from per-player effects, so CV has a
+    lambda to find."""
+    off, defense, _ = possessions(n, seed)
+    rng = np.random.default_rng(seed + 100)
+    eff = rng.normal(0, 0.08, 300)
+    p = np.clip(0.5 + eff[off].sum(1) - eff[defense].sum(1), 0.05, 0.95)
+    return off, defense, 2 * (rng.random(n) < p)
+
+
+def dense(design, off, defense):
+    P = design.n_players
+    X = np.zeros((len(off), 2 * P))
+    rows = np.arange(len(off))[:, None]
+    X[rows, np.searchsorted(design.players, off)] = 1.0
+    X[rows, np.searchsorted(design.players, defense) + P] = -1.0
+    return X
+
+
+class SolverTests(unittest.TestCase):
+    def setUp(self):
+        self.off, self.defense, self.pts = possessions()
+        self.design = rapm_solver.Design(self.off, self.defense, self.pts)
+        self.X = dense(self.design, self.off, self.defense)
+        self.y = 100.0 * self.pts
+
+    def test_identical_matchups_collapse(self):
+        self.assertLess(self.design.X.shape[0], len(self.pts))
+        w, ysum, _ = self.design.totals()
+        self.assertEqual(w.sum(), len(self.pts))
+        self.assertAlmostEqual(ysum.sum(), self.y.sum())
+
+    def test_fit_matches_ridge(self):
+        n = len(self.y)
+        coef = rapm_solver.fit(self.design, 0.05)
+        want = Ridge(alpha=0.05 * n / 2, solver="cholesky").fit(self.X, self.y)
+        np.testing.assert_allclose(coef[:-1], want.coef_, atol=1e-6)
+        self.assertAlmostEqual(coef[-1], want.intercept_, places=6)
+
+    def test_sub_pool_matches_ridge_on_its_rows(self):
+        mask = np.arange(len(self.y)) % 3 != 0
+        full = rapm_solver.fit(self.design, 0.01)
+        coef = rapm_solver.fit(self.design, 0.01, mask, x0=full)
+        want = Ridge(alpha=0.01 * mask.sum() / 2, solver="cholesky").fit(
+            self.X[mask], self.y[mask])
+        np.testing.assert_allclose(coef[:-1], want.coef_, atol=1e-6)
+
+    def test_stints_design_matches_possessions(self):
+        poss = pd.DataFrame(np.hstack([self.off, self.defense]),
+                            columns=POSS_COLS[:10])
+        poss["pts"] = self.pts
+        st = rapm_solver.Design.from_stints(stints(poss))
+        np.testing.assert_allclose(rapm_solver.fit(st, 0.05),
+                                   rapm_solver.fit(self.design, 0.05), atol=1e-8)
+        w, _, q = st.totals()
+        self.assertEqual(w.sum(), len(self.pts))
+        self.assertAlmostEqual(q.sum(), (self.y ** 2).sum())
+
+    def test_cv_picks_ridgecv_lambda(self):
+        n = len(self.y)
+        grid = GridSearchCV(Ridge(solver="cholesky"),
+                            {"alpha": [l * n / 2 for l in LAMBDAS]}, cv=5)
+        grid.fit(self.X, self.y)
+        _, lam = rapm_solver.fit_cv(self.design, LAMBDAS)
+        self.assertAlmostEqual(lam * n / 2, grid.best_params_["alpha"])
+
+    def test_cv_on_stints_picks_possession_lambda(self):
+        lambdas = [0.0003, 0.001, 0.003, 0.01, 0.03, 0.1]
+        off, defense, pts = scored()
+        poss = pd.DataFrame(np.hstack([off, defense]), columns=POSS_COLS[:10])
+        poss["pts"] = pts
+        _, want = rapm_solver.fit_cv(rapm_solver.Design(off, defense, pts), lambdas)
+        _, lam = rapm_solver.fit_cv(rapm_solver.Design.from_stints(stints(poss)),
+                                    lambdas)
+        self.assertEqual(lam, want)
+
+    def test_ratings_recentered(self):
+        coef = rapm_solver.fit(self.design, 0.05)
+        players, o, d, cnt_o, cnt_d = rapm_solver.ratings(self.design, coef)
+        self.assertEqual(len(players), 32)
+        self.assertAlmostEqual(np.average(o, weights=cnt_o), 0.0)
+        self.assertAlmostEqual(np.average(d, weights=cnt_d), 0.0)
+        self.assertEqual(cnt_o.sum(), 5 * len(self.y))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,4 @@
-"""Season lookup and date helpers for the scrapers.
+"""Season lookup, date and value helpers shared by scraping/ and training/.
 
 Everything here hangs off one SEASONS table. The previous version spelled the same
 dates out three times -- a prose table in a docstring, a chain of elif branches in
@@ -144,3 +144,20 @@ def remove_numbers_and_apostrophes(string: str) -> str:
 def reformat_date(timestamp):
     """YYYY-MM-DD -> MM/DD/YYYY, which is what stats.nba.com wants."""
     return datetime.strptime(timestamp, "%Y-%m-%d").strftime("%m/%d/%Y")
+
+
+NUM_RE = re.compile(r"^-?[\d,]*\.?\d+$")
+
+
+def as_float(v):
+    """Parse a scraped value to float, or None if it isn't a number."""
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return float(v)
+    if isinstance(v, str):
+        s = v.strip().replace(",", "").replace("%", "").lstrip("+")
+        if s and NUM_RE.match(s.replace(",", "")):
+            try:
+                return float(s)
+            except ValueError:
+                return None
+    return None